@@ -0,0 +1,32 @@
+'''
+Benchmarks that need a live Redis run against BENCH_REDIS_URL (default redis://localhost:6379/15), never the
+service's REDIS_URL, and flush it as they go; they refuse to start on a database that already holds keys unless
+given --force.
+'''
+import os
+import sys
+
+BENCH_REDIS_URL = os.environ.get('BENCH_REDIS_URL', 'redis://localhost:6379/15')
+
+
+def bench_redis(force=False):
+    '''
+    :param force: use the database even if it is not empty (its keys are flushed)
+    :return: decoding client for BENCH_REDIS_URL, flushed
+    '''
+    import redis
+
+    client = redis.Redis.from_url(BENCH_REDIS_URL, decode_responses=True)
+    keys = client.dbsize()
+    if keys and not force:
+        sys.exit('{} holds {} key(s) and benchmarks flush it: point BENCH_REDIS_URL at an empty database or pass '
+                 '--force'.format(BENCH_REDIS_URL, keys))
+    client.flushdb()
+    return client
+
+
+def force_flag(args):
+    '''
+    :return: (args without --force, whether it was given)
+    '''
+    return [a for a in args if a != '--force'], '--force' in args
@@ -0,0 +1,53 @@
+'''
+Cost of keeping a BeliefTracker up to date through a game, against rebuilding it from the game's history at every
+decision, and of reading the card probability matrix.
+
+    python -m benchmarks.bench_beliefs [games]
+'''
+import random
+import sys
+import time
+
+from briscola import deck
+from briscola.beliefs import BeliefTracker
+from benchmarks.bench_make_unmake import start_of_play
+
+
+def main(games=200):
+    rng = random.Random(0)
+    updates = rebuilds = matrices = 0.0
+    plays = 0
+    for i in range(games):
+        game = start_of_play(i)
+        tracker = BeliefTracker(1, game.players[1].original_hand)
+        tracker.caller_won(game.bid_winner.id)
+        tracker.partner_rank_called(game.partner_rank)
+        while any(p.hand for p in game.players):
+            if game.state == 'call-partner-suit':
+                suit = rng.choice(deck.suits)
+                game.call_partner_suit(suit)
+                started = time.perf_counter()
+                tracker.partner_revealed(game.partner.id, suit)
+                updates += time.perf_counter() - started
+                continue
+            seat = game.current_player_id
+            card = rng.choice(game.players[seat].hand)
+            game.play_card(seat, card)
+            started = time.perf_counter()
+            tracker.card_played(seat, card.card_id)
+            updates += time.perf_counter() - started
+            started = time.perf_counter()
+            tracker.card_probabilities()
+            matrices += time.perf_counter() - started
+            started = time.perf_counter()
+            BeliefTracker.from_game(game, 1)
+            rebuilds += time.perf_counter() - started
+            plays += 1
+
+    print('incremental update: {:6.2f} us/event'.format(updates / plays * 1e6))
+    print('rebuild from game:  {:6.2f} us/decision'.format(rebuilds / plays * 1e6))
+    print('probability matrix: {:6.2f} us/refresh'.format(matrices / plays * 1e6))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
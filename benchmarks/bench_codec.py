@@ -0,0 +1,64 @@
+'''
+Wire cost per event, in process: whole games are played by heuristic bots through GameServer.handle_action, every
+event they publish is captured, and each codec then encodes and decodes the lot: standard library JSON, orjson (if
+installed) and the compact binary format. Reports bytes and microseconds (encode, decode) per event.
+
+    python -m benchmarks.bench_codec [games]
+'''
+import sys
+import time
+
+from briscola import bot
+from briscola_codec import CompactCodec, JsonCodec, OrjsonCodec, decode, orjson
+from briscola_service import GameServer
+
+
+class CapturingRedis:
+    def __init__(self):
+        self.published = []
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def publish(self, channel, data):
+        self.published.append(data)
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def events(games):
+    redis = CapturingRedis()
+    for n in range(games):
+        server = GameServer('C{}'.format(n), redis, bot_seats=range(5), bot_player=bot.Bot(seed=n))
+        server.game.reseed(n)
+        server.handle_action({'message_type': 'join', 'game_id': server.game_id, 'action_id': 'join',
+                              'player_id': 0, 'role': 'player', 'payload': {'message_type': 'join'}})
+    return [decode(data) for data in redis.published]
+
+
+def cost(codec, envelopes):
+    started = time.perf_counter()
+    encoded = [codec.encode(envelope) for envelope in envelopes]
+    encode_us = (time.perf_counter() - started) / len(envelopes) * 1e6
+    started = time.perf_counter()
+    for data in encoded:
+        codec.decode(data)
+    decode_us = (time.perf_counter() - started) / len(envelopes) * 1e6
+    return sum(len(data) for data in encoded) / len(envelopes), encode_us, decode_us
+
+
+def main(games=100):
+    envelopes = events(int(games))
+    codecs = [('json', JsonCodec())]
+    if orjson is not None:
+        codecs.append(('orjson', OrjsonCodec()))
+    codecs.append(('compact', CompactCodec()))
+    for name, codec in codecs:
+        size, encode_us, decode_us = cost(codec, envelopes)
+        print('{:<8} {:6.1f} bytes  {:5.1f} us encode  {:5.1f} us decode per event ({} events)'.format(
+            name, size, encode_us, decode_us, len(envelopes)))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,39 @@
+'''
+Game creation and dealing throughput: each game shuffling its own seeded stream versus drawing from a shared
+NumPy-generated ShufflePool.
+
+    python -m benchmarks.bench_deal [games]
+'''
+import sys
+import time
+
+from briscola.deck import Deck, ShufflePool
+from briscola.game import Game
+
+
+def deal_games(games, pool=None):
+    started = time.perf_counter()
+    for i in range(games):
+        game = Game(seed=i, shuffle_pool=pool)
+        game.start_game()
+        game.deal_cards()
+    return games / (time.perf_counter() - started)
+
+
+def deal_decks(games, pool=None):
+    deck = Deck(seed=0, pool=pool)
+    started = time.perf_counter()
+    for _ in range(games):
+        deck.deal_valid_hands(5)
+    return games / (time.perf_counter() - started)
+
+
+def main(games=20000):
+    print('deal only, own stream:   {:9.0f} deals/s'.format(deal_decks(games)))
+    print('deal only, shuffle pool: {:9.0f} deals/s'.format(deal_decks(games, ShufflePool(seed=0))))
+    print('own stream:   {:9.0f} games/s'.format(deal_games(games)))
+    print('shuffle pool: {:9.0f} games/s'.format(deal_games(games, ShufflePool(seed=0))))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
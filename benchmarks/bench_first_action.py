@@ -0,0 +1,81 @@
+'''
+First-action latency against a live Redis (BENCH_REDIS_URL, default redis://localhost:6379/15, flushed first; see
+benchmarks): the time from publishing a new game's first action to its action.result, next to the same latency for
+a game's second action.
+
+Games are opened one at a time, so each number is one uncontended round trip through the service. To compare with
+an older version of the service (e.g. before first actions were handed over in process instead of re-published),
+run the service from another checkout with --tree:
+
+    git worktree add /tmp/before <commit>
+    python -m benchmarks.bench_first_action [games] [mode] [--tree /tmp/before] [--force]
+    python -m benchmarks.bench_first_action 500 threaded
+'''
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks import BENCH_REDIS_URL, bench_redis, force_flag
+
+TIMEOUT = 10
+
+
+def envelope(game_id, message_type, n):
+    return json.dumps({
+        'message_type': message_type, 'game_id': game_id, 'action_id': '{}-{}'.format(game_id, n),
+        'player_id': 0, 'role': 'player', 'payload': {'message_type': message_type},
+    })
+
+
+def round_trip(client, pubsub, game_id, message_type, n):
+    action_id = '{}-{}'.format(game_id, n)
+    started = time.perf_counter()
+    client.publish('game.{}.actions'.format(game_id), envelope(game_id, message_type, n))
+    deadline = time.time() + TIMEOUT
+    while time.time() < deadline:
+        msg = pubsub.get_message(timeout=1.0)
+        if msg and msg['type'] == 'pmessage':
+            data = json.loads(msg['data'])
+            if data['message_type'] == 'action.result' and data['action_id'] == action_id:
+                return time.perf_counter() - started
+    raise RuntimeError('no result for ' + action_id)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def main(games=500, mode='threaded', tree='.', force=False):
+    client = bench_redis(force)
+    env = dict(os.environ, REDIS_URL=BENCH_REDIS_URL, BOT_SEATS='', SERVICE_MODE=mode, GAME_LEASES='0')
+    proc = subprocess.Popen([sys.executable, os.path.join(tree, 'briscola_service.py')], env=env, cwd=tree,
+                            stdout=subprocess.DEVNULL)
+    try:
+        while client.pubsub_numpat() < 1:
+            time.sleep(0.05)
+        pubsub = client.pubsub()
+        pubsub.psubscribe('game.*.events')
+        first, second = [], []
+        for i in range(int(games)):
+            game_id = 'FIRST{}-{}'.format(os.getpid(), i)
+            first.append(round_trip(client, pubsub, game_id, 'join', 0))
+            second.append(round_trip(client, pubsub, game_id, 'sync', 1))
+        for name, values in (('first action', first), ('second action', second)):
+            print('{:<14} {} games ({}): p50 {:6.3f} ms  p99 {:6.3f} ms  max {:6.3f} ms'.format(
+                name, games, mode, percentile(values, 0.5) * 1000, percentile(values, 0.99) * 1000,
+                max(values) * 1000))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+if __name__ == '__main__':
+    args, force = force_flag([a for a in sys.argv[1:] if a != '--tree'])
+    tree = '.'
+    if '--tree' in sys.argv:
+        tree = sys.argv[sys.argv.index('--tree') + 1]
+        args.remove(tree)
+    main(*args, tree=tree, force=force)
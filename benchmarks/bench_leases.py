@@ -0,0 +1,106 @@
+'''
+Game ownership leases against a live Redis (BENCH_REDIS_URL, default redis://localhost:6379/15,
+flushed between runs; see benchmarks).
+
+Renewal: the time one node takes to renew the leases of [counts] games, in batched script calls, as the heartbeat
+does every HEARTBEAT_INTERVAL.
+
+Failover: two service nodes run with a short lease TTL; a game is started, the node owning it is killed with
+SIGKILL, and the driver keeps sending sync actions until the other node answers. Failover time is measured from
+the kill to that answer; with no graceful release it is bounded by the lease TTL.
+
+    python -m benchmarks.bench_leases [counts] [ttl_ms] [--force]
+    python -m benchmarks.bench_leases 1000,5000,20000 3000
+'''
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from benchmarks import BENCH_REDIS_URL, bench_redis, force_flag
+from briscola_leases import LeaseManager
+
+REPEATS = 5
+
+
+def renewal(client, count, ttl_ms):
+    leases = LeaseManager(client, ttl_ms, node_id='bench')
+    games = ['LEASE{}'.format(n) for n in range(count)]
+    for game_id in games:
+        leases.acquire(game_id)
+    timings = []
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        lost = leases.renew(games)
+        timings.append(time.perf_counter() - started)
+    assert not lost
+    best = min(timings)
+    print('renew {:>6} leases: {:8.2f} ms  ({:5.2f} us per game)'.format(count, best * 1000, best / count * 1e6))
+
+
+def envelope(game_id, message_type, n):
+    return json.dumps({
+        'message_type': message_type, 'game_id': game_id, 'action_id': '{}-{}'.format(game_id, n),
+        'player_id': 0, 'role': 'player', 'payload': {'message_type': message_type},
+    })
+
+
+def answered_by(pubsub, action_id, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        msg = pubsub.get_message(timeout=0.05)
+        if msg and msg['type'] == 'pmessage':
+            data = json.loads(msg['data'])
+            if data['message_type'] == 'action.result' and data['action_id'] == action_id:
+                return True
+    return False
+
+
+def failover(client, ttl_ms):
+    env = dict(os.environ, REDIS_URL=BENCH_REDIS_URL, BOT_SEATS='', SERVICE_MODE='threaded',
+               GAME_LEASE_TTL_MS=str(ttl_ms), HEARTBEAT_INTERVAL_SECONDS='1')
+    nodes = {name: subprocess.Popen([sys.executable, 'briscola_service.py'], env=dict(env, SERVICE_NODE_ID=name),
+                                    stdout=subprocess.DEVNULL)
+             for name in ('node-a', 'node-b')}
+    try:
+        while client.pubsub_numpat() < 1:
+            time.sleep(0.05)
+        time.sleep(1.0)
+        pubsub = client.pubsub()
+        pubsub.psubscribe('game.*.events')
+        game_id = 'FAILOVER{}'.format(os.getpid())
+        channel = 'game.{}.actions'.format(game_id)
+        client.publish(channel, envelope(game_id, 'join', 0))
+        assert answered_by(pubsub, '{}-0'.format(game_id), 10), 'no node answered the join'
+        owner = client.get('game:{}:owner'.format(game_id))
+
+        killed = time.perf_counter()
+        nodes[owner].send_signal(signal.SIGKILL)
+        n = 0
+        while True:
+            n += 1
+            client.publish(channel, envelope(game_id, 'sync', n))
+            if answered_by(pubsub, '{}-{}'.format(game_id, n), 0.1):
+                break
+        elapsed = time.perf_counter() - killed
+        print('failover with a {} ms lease: {:.2f} s ({} action(s) sent, now owned by {})'.format(
+            ttl_ms, elapsed, n, client.get('game:{}:owner'.format(game_id))))
+    finally:
+        for proc in nodes.values():
+            proc.terminate()
+            proc.wait()
+
+
+def main(counts='1000,5000,20000', ttl_ms=3000, force=False):
+    client = bench_redis(force)
+    for count in counts.split(','):
+        renewal(client, int(count), int(ttl_ms))
+    client.flushdb()
+    failover(client, int(ttl_ms))
+
+
+if __name__ == '__main__':
+    args, force = force_flag(sys.argv[1:])
+    main(*args, force=force)
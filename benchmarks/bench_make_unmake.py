@@ -0,0 +1,62 @@
+'''
+Random playouts from the start of play, copying the game for every playout versus playing on one working copy and
+undoing back to the start, plus ISMCTS iterations for a fixed budget.
+
+    python -m benchmarks.bench_make_unmake [playouts]
+'''
+import copy
+import random
+import sys
+import time
+
+from briscola import bot
+from briscola.game import Game
+
+
+def start_of_play(seed):
+    random.seed(seed)
+    game = Game()
+    game.start_game()
+    game.deal_cards()
+    game.player_bid(0, 70)
+    for seat in range(1, 5):
+        game.player_bid(seat, -1)
+    game.call_partner_rank(10)
+    return game
+
+
+def playout(world, rng):
+    depth = 0
+    actions = bot.legal_actions(world)
+    while actions:
+        bot.apply_action(world, rng.choice(actions))
+        depth += 1
+        actions = bot.legal_actions(world)
+    return depth
+
+
+def main(playouts=2000):
+    game = start_of_play(1)
+    rng = random.Random(0)
+
+    started = time.perf_counter()
+    for _ in range(playouts):
+        playout(copy.deepcopy(game), rng)
+    copied = (time.perf_counter() - started) / playouts
+
+    world = copy.deepcopy(game)
+    started = time.perf_counter()
+    for _ in range(playouts):
+        for _ in range(playout(world, rng)):
+            world.undo()
+    undone = (time.perf_counter() - started) / playouts
+
+    print('deepcopy + play: {:8.1f} us/playout'.format(copied * 1e6))
+    print('play + undo:     {:8.1f} us/playout ({:.2f}x)'.format(undone * 1e6, copied / undone))
+
+    _, done = bot.search(game, 0, budget=1.0, seed=0)
+    print('ISMCTS:          {:8d} iterations/s (one tree)'.format(done))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
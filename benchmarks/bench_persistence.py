@@ -0,0 +1,83 @@
+'''
+Persistence cost per action, in process: the action log with periodic checkpoints (sync), the same with
+write-behind, and a checkpoint written on every action (the full game rewritten each time, as every action used to
+rewrite the game's whole snapshot).
+
+Whole games are played by heuristic bots through GameServer.handle_action against a Redis stand-in that only
+counts what it is sent, so the numbers are the service's own cost per action: encoding events, log entries and
+checkpoints and queueing the writes, and the bytes of game state written. Write-behind entries are written when the
+game ends (its shutdown flush), so every coalesced write is counted, not dropped.
+
+    python -m benchmarks.bench_persistence [games]
+'''
+import sys
+import time
+
+import briscola_service
+from briscola import bot
+from briscola_persistence import CHECKPOINT_ACTIONS, WriteBehind
+from briscola_service import GameServer
+
+
+class CountingRedis:
+    def __init__(self):
+        self.checkpoints = 0
+        self.state_bytes = 0
+        self.round_trips = 0
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def publish(self, channel, data):
+        pass
+
+    def setex(self, key, ttl, value):
+        pass
+
+    def set(self, key, value, ex=None):
+        self.checkpoints += 1
+        self.state_bytes += len(value)
+
+    def rpush(self, key, *values):
+        self.state_bytes += sum(len(value) for value in values)
+
+    def expire(self, key, ttl):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def execute(self):
+        self.round_trips += 1
+
+
+def play(games, write_behind):
+    redis = CountingRedis()
+    actions = 0
+    elapsed = 0.0
+    for n in range(games):
+        wb = WriteBehind(window_ms=50, max_staleness_ms=500) if write_behind else None
+        server = GameServer('B{}'.format(n), redis, bot_seats=range(5), bot_player=bot.Bot(seed=n), write_behind=wb)
+        server.game.reseed(n)
+        started = time.perf_counter()
+        server.handle_action({'message_type': 'join', 'game_id': server.game_id, 'action_id': 'join',
+                              'player_id': 0, 'role': 'player', 'payload': {'message_type': 'join'}})
+        server.flush_state()
+        elapsed += time.perf_counter() - started
+        actions += redis.round_trips - actions
+    return elapsed / actions * 1e6, redis.state_bytes / actions, redis.checkpoints / games, actions / games
+
+
+def main(games=200):
+    modes = (('log', False, CHECKPOINT_ACTIONS), ('write-behind', True, CHECKPOINT_ACTIONS),
+             ('every action', False, 1))
+    for name, write_behind, checkpoint_actions in modes:
+        briscola_service.CHECKPOINT_ACTIONS = checkpoint_actions
+        latency, state_bytes, checkpoints, actions = play(int(games), write_behind)
+        print('{:<13} {:7.1f} us per action  {:7.1f} state bytes per action  {:5.1f} actions and {:5.1f} '
+              'checkpoints per game'.format(name, latency, state_bytes, actions, checkpoints))
+    briscola_service.CHECKPOINT_ACTIONS = CHECKPOINT_ACTIONS
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
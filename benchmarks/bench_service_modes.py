@@ -0,0 +1,151 @@
+'''
+Concurrent-game capacity of the threaded, asyncio and sharded service modes against a live Redis (BENCH_REDIS_URL,
+default redis://localhost:6379/15, flushed between modes; see benchmarks).
+
+For each mode the service runs in its own process. The driver opens the given number of games with one join each,
+waits for every action.result, then sends rounds of sync actions across all games. It reports the time to bring
+the games up, action throughput, and the service's resident memory, OS threads and Redis connections (summed over
+the worker processes for a sharded mode).
+
+A sharded mode is sharded:<workers>[:<worker mode>], e.g. sharded:4 or sharded:4:asyncio; running sharded:1,
+sharded:2 and sharded:4 shows how throughput scales with cores. streams:<nodes> runs that many service nodes
+sharing the actions through Redis Streams consumer groups (SERVICE_TRANSPORT=streams); the driver then adds
+actions to the streams instead of publishing them.
+
+    python -m benchmarks.bench_service_modes [games] [rounds] [modes] [--force]
+    python -m benchmarks.bench_service_modes 2000 3 threaded,asyncio,sharded:4:asyncio
+'''
+import json
+import os
+import subprocess
+import sys
+import time
+
+import redis
+
+from benchmarks import BENCH_REDIS_URL, bench_redis, force_flag
+
+TIMEOUT = 120
+
+
+def serve(mode):
+    if mode.startswith('sharded'):
+        from briscola_sharding import ShardSupervisor
+        _, workers, *worker_mode = mode.split(':')
+        ShardSupervisor(int(workers), worker_mode[0] if worker_mode else 'threaded').run()
+    elif mode == 'streams':
+        from briscola_streams import StreamsBriscolaService
+        StreamsBriscolaService().run()
+    elif mode == 'asyncio':
+        from briscola_async_service import AsyncBriscolaService
+        AsyncBriscolaService().run()
+    else:
+        from briscola_service import BriscolaService
+        BriscolaService().run()
+
+
+def process_status(pid):
+    status = {}
+    with open('/proc/{}/status'.format(pid)) as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            status[key] = value.strip()
+    rss, threads = int(status['VmRSS'].split()[0]) // 1024, int(status['Threads'])
+    with open('/proc/{}/task/{}/children'.format(pid, pid)) as f:
+        for child in f.read().split():
+            child_rss, child_threads = process_status(child)
+            rss += child_rss
+            threads += child_threads
+    return rss, threads
+
+
+def envelope(game_id, message_type, n):
+    return json.dumps({
+        'message_type': message_type, 'game_id': game_id, 'action_id': '{}-{}'.format(game_id, n),
+        'player_id': 0, 'role': 'player', 'payload': {'message_type': message_type},
+    })
+
+
+def wait_results(pubsub, expected):
+    seen = 0
+    deadline = time.time() + TIMEOUT
+    while seen < expected and time.time() < deadline:
+        msg = pubsub.get_message(timeout=1.0)
+        if msg and msg['type'] == 'pmessage' and json.loads(msg['data'])['message_type'] == 'action.result':
+            seen += 1
+    return seen
+
+
+def start_services(mode):
+    env = dict(os.environ, REDIS_URL=BENCH_REDIS_URL, BOT_SEATS='', SERVICE_MODE=mode.split(':')[-1])
+    command = [sys.executable, '-m', 'benchmarks.bench_service_modes', '--serve']
+    if not mode.startswith('streams'):
+        return [subprocess.Popen(command + [mode], env=env, stdout=subprocess.DEVNULL)]
+    nodes = ['node-{}'.format(i) for i in range(int(mode.partition(':')[2] or 1))]
+    env.update(SERVICE_MODE='threaded', STREAM_NODES=','.join(nodes))
+    return [subprocess.Popen(command + ['streams'], env=dict(env, STREAM_NODE=node), stdout=subprocess.DEVNULL)
+            for node in nodes]
+
+
+def measure(mode, games, rounds):
+    client = redis.Redis.from_url(BENCH_REDIS_URL, decode_responses=True)
+    client.flushdb()
+    baseline = client.info('clients')['connected_clients']
+    procs = start_services(mode)
+    if mode.startswith('streams'):
+        from briscola_streams import add_action
+
+        def send(game_id, data):
+            add_action(client, json.loads(data))
+    else:
+        def send(game_id, data):
+            client.publish('game.{}.actions'.format(game_id), data)
+    try:
+        if mode.startswith('streams'):
+            time.sleep(1.0)  # the nodes to create the consumer groups
+        else:
+            while client.pubsub_numpat() < 1:
+                time.sleep(0.05)
+        if mode.startswith('sharded'):
+            time.sleep(1.0)  # the last workers to subscribe
+        pubsub = client.pubsub()
+        pubsub.psubscribe('game.*.events')
+        prefix = 'BENCH{}{}'.format(mode.replace(':', '').upper(), os.getpid())
+        ids = ['{}-{}'.format(prefix, i) for i in range(games)]
+
+        started = time.perf_counter()
+        for game_id in ids:
+            send(game_id, envelope(game_id, 'join', 0))
+        answered = wait_results(pubsub, games)
+        startup = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for n in range(1, rounds + 1):
+            for game_id in ids:
+                send(game_id, envelope(game_id, 'sync', n))
+        handled = wait_results(pubsub, games * rounds)
+        throughput = handled / (time.perf_counter() - started)
+
+        rss, threads = map(sum, zip(*(process_status(proc.pid) for proc in procs)))
+        connections = client.info('clients')['connected_clients'] - baseline - 1  # the driver's pubsub
+        print('{:<18} games {:>6} up {:>6}/{} in {:6.2f}s  {:8.0f} actions/s  rss {:5d} MB  threads {:5d}  '
+              'redis connections {:5d}'.format(mode, games, answered, games, startup, throughput, rss, threads,
+                                               connections))
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+
+
+def main(games=1000, rounds=3, modes='threaded,asyncio', force=False):
+    bench_redis(force)
+    for mode in modes.split(','):
+        measure(mode, int(games), int(rounds))
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--serve']:
+        serve(sys.argv[2])
+    else:
+        args, force = force_flag(sys.argv[1:])
+        main(*args, force=force)
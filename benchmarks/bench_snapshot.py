@@ -0,0 +1,97 @@
+'''
+Persisted game state: size and encode/decode time of the verbose JSON snapshot from GameServer.build_snapshot (the
+old game:<id>:state, which could not restore hands or tricks), the complete Game.checkpoint as JSON, and the compact
+binary briscola.snapshot encoding (raw, and as the service stores it: base64 in a small JSON record).
+
+Positions are taken after every transition of randomly played games, from the deal to the last trick.
+
+    python -m benchmarks.bench_snapshot [games]
+'''
+import base64
+import copy
+import json
+import random
+import sys
+import time
+
+from briscola import snapshot
+from briscola.game import Game
+from briscola_service import GameServer
+
+
+def positions(games):
+    found = []
+    for seed in range(games):
+        rng = random.Random(seed)
+        game = Game(seed=seed)
+        game.start_game()
+        game.deal_cards()
+        found.append(copy.deepcopy(game))
+        game.player_bid(rng.randrange(5), rng.randrange(61, 121))
+        for seat in range(5):
+            if game.state == 'bid' and game.players[seat] is not game.bid_winner:
+                game.player_bid(seat, -1)
+        game.call_partner_rank(rng.choice(range(1, 11)))
+        while any(p.hand for p in game.players):
+            if game.state == 'call-partner-suit':
+                game.call_partner_suit(rng.choice(['cups', 'coins', 'swords', 'clubs']))
+            else:
+                game.play_card(game.current_player_id, rng.choice(game.players[game.current_player_id].hand))
+            found.append(copy.deepcopy(game))
+    return found
+
+
+def verbose_json(server, game):
+    server.game = game
+    snap = server.build_snapshot()
+    snap['seed'] = game.seed
+    snap['last_action_id'] = 'ABC123'
+    return json.dumps(snap)
+
+
+def load_verbose(server, data):
+    server.game = Game()
+    server.load_state(json.loads(data))
+
+
+def record(server, game):
+    server.game = game
+    return server.encode_state()
+
+
+def load_record(server, data):
+    server.game = Game()
+    server.load_state(json.loads(data))
+
+
+def timed(fn, items, keep=True):
+    # decoded games are dropped as they are made: a heap of live games would bill the decoder for the collector
+    results = []
+    started = time.perf_counter()
+    for item in items:
+        result = fn(item)
+        if keep:
+            results.append(result)
+    return results, (time.perf_counter() - started) / len(items) * 1e6
+
+
+def main(games=200):
+    games_ = positions(int(games))
+    server = GameServer('BENCH', None)
+    server.last_action_id = 'ABC123'
+    formats = (
+        ('verbose json (lossy)', lambda g: verbose_json(server, g), lambda b: load_verbose(server, b)),
+        ('checkpoint json', lambda g: json.dumps(g.checkpoint()), lambda b: Game().restore_checkpoint(json.loads(b))),
+        ('binary', snapshot.encode, snapshot.decode),
+        ('binary record', lambda g: record(server, g), lambda b: load_record(server, b)),
+    )
+    print('{} positions from {} games'.format(len(games_), games))
+    for name, encode, decode in formats:
+        encoded, encode_us = timed(encode, games_)
+        _, decode_us = timed(decode, encoded, keep=False)
+        size = sum(len(e) for e in encoded) / len(encoded)
+        print('{:<21} {:7.1f} bytes  encode {:6.1f} us  decode {:6.1f} us'.format(name, size, encode_us, decode_us))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
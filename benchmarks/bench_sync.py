@@ -0,0 +1,48 @@
+'''
+Reconnect storm, in process: every client of every game sends a sync at once (as after a deploy), answered with
+the public snapshot cached per game state version plus the client's hand, versus the whole snapshot rebuilt and
+serialised for every client (the cache dropped before each sync).
+
+    python -m benchmarks.bench_sync [games] [clients per game]
+'''
+import sys
+import time
+
+from briscola_service import GameServer
+
+
+class NullRedis:
+    def pipeline(self, transaction=True):
+        return self
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def storm(servers, clients, cached):
+    started = time.perf_counter()
+    for server in servers:
+        for client in range(clients):
+            if not cached:
+                server.snapshot_cache = None
+            server.handle_action({'message_type': 'sync', 'game_id': server.game_id, 'action_id': 'S{}'.format(client),
+                                  'player_id': client % 5, 'role': 'player', 'payload': {'message_type': 'sync'}})
+    return (time.perf_counter() - started) / (len(servers) * clients) * 1e6
+
+
+def main(games=200, clients=20):
+    games, clients = int(games), int(clients)
+    servers = []
+    for n in range(games):
+        server = GameServer('S{}'.format(n), NullRedis())
+        server.game.reseed(n)
+        server.handle_action({'message_type': 'join', 'game_id': server.game_id, 'action_id': 'join',
+                              'player_id': 0, 'role': 'player', 'payload': {'message_type': 'join'}})
+        servers.append(server)
+    for name, cached in (('rebuilt per client', False), ('cached per version', True)):
+        print('{:<19} {:6.1f} us per sync ({} games x {} clients)'.format(
+            name, storm(servers, clients, cached), games, clients))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,287 @@
+'''
+Vectorised batch engine: plays N independent games of Briscola Chiamata at once with NumPy arrays.
+
+Cards are card ids (suit_index * 10 + rank - 1, see briscola.deck) and -1 marks an empty slot. Every step (deal,
+auction, call, each of the 40 plays, trick resolution, scoring) is one vectorised operation over the batch, and the
+decisions are made by pluggable vectorised policies:
+
+    bid_policy(hands, rng) -> (n, 5) highest bid each seat is willing to make, -1 to pass
+    call_policy(hands, caller, rng) -> ((n,) called rank, (n,) called suit index)
+    play_policy(view, rng) -> (n,) slot in view.hand of the card to play
+
+Rules follow briscola.game.Game: the bid winner leads the first trick, which is resolved with the called suit as
+trump once it is complete, the winner of each trick leads the next, and the calling team is the bid winner plus the
+holder of the called card. replay_game drives a Game through the same decisions to check a result against it.
+'''
+import numpy as np
+
+import briscola.deck as d
+import briscola.game as g
+
+HAND_SIZE = 8
+SEATS = 5
+TRICKS = len(d.cards) // SEATS
+
+CARD_VALUES = np.array(d.card_values, dtype=np.int16)
+CARD_RANKS = np.array(d.card_ranks, dtype=np.int8)
+CARD_SUITS = np.repeat(np.arange(len(d.suits), dtype=np.int8), len(d.ranks))
+# BEATS[trump_index, winning_id, card_id]: card_id takes the trick from winning_id
+BEATS = np.frombuffer(bytes(g._beats), dtype=np.uint8).reshape(g.NO_TRUMP + 1, len(d.cards), len(d.cards)).astype(bool)
+
+
+class PlayView:
+    '''
+    What the acting seats can see when choosing a card, one row per game
+    hand: (n, 8) card ids of the acting seat, -1 for cards already played
+    trick: (n, 5) cards played to the current trick in play order, -1 for positions not yet played
+    position: number of cards already in the trick
+    trump: (n,) trump index, g.NO_TRUMP during the first trick while the suit is not yet called
+    seat, leader, caller: (n,) seat ids
+    trick_number: 0-7
+    '''
+
+    def __init__(self, hand, trick, position, trump, seat, leader, caller, trick_number):
+        self.hand = hand
+        self.trick = trick
+        self.position = position
+        self.trump = trump
+        self.seat = seat
+        self.leader = leader
+        self.caller = caller
+        self.trick_number = trick_number
+
+    def legal(self):
+        return self.hand >= 0
+
+
+class BatchResult:
+    '''
+    Outcome of a batch of games, one row per game. Void games (every seat passed) are not played: their
+    plays are -1 and their points 0.
+    '''
+
+    def __init__(self, hands, bid_winner, bid, void, partner_rank, partner_suit, partner, plays, leaders,
+                 trick_winners, points):
+        self.hands = hands                  # (n, 5, 8) dealt hands
+        self.bid_winner = bid_winner        # (n,) caller seat
+        self.bid = bid                      # (n,) winning bid
+        self.void = void                    # (n,) True when nobody bid
+        self.partner_rank = partner_rank    # (n,) called rank 1-10
+        self.partner_suit = partner_suit    # (n,) called suit index, also trump
+        self.partner = partner              # (n,) seat holding the called card (may be the caller)
+        self.plays = plays                  # (n, 8, 5) card ids in play order for each trick
+        self.leaders = leaders              # (n, 8) seat leading each trick
+        self.trick_winners = trick_winners  # (n, 8) seat winning each trick
+        self.points = points                # (n, 5) card points taken per seat
+
+    def __len__(self):
+        return len(self.bid)
+
+    def team_points(self):
+        '''
+        :return: ((n,) calling team points, (n,) defending team points), as Game.team_points
+        '''
+        rows = np.arange(len(self))
+        calling = self.points[rows, self.bid_winner].astype(np.int32)
+        calling += np.where(self.partner != self.bid_winner, self.points[rows, self.partner], 0)
+        return calling, self.points.sum(axis=1) - calling
+
+    def caller_won(self):
+        calling, _ = self.team_points()
+        return (calling >= self.bid) & ~self.void
+
+
+# Policies
+
+def random_bids(hands, rng):
+    '''each seat passes half the time, otherwise is willing to go up to a random bid in 61-90'''
+    n = hands.shape[0]
+    limits = rng.integers(61, 91, size=(n, SEATS)).astype(np.int16)
+    return np.where(rng.random((n, SEATS)) < 0.5, -1, limits)
+
+
+def hand_value_bids(hands, rng):
+    '''bid up to 61 plus the card points held above 20, pass on weaker hands'''
+    held = CARD_VALUES[hands].sum(axis=2)
+    return np.where(held > 20, np.minimum(61 + held - 20, 120), -1).astype(np.int16)
+
+
+def call_best_missing(hands, caller, rng):
+    '''
+    Call the longest suit in the caller's hand (ties broken by points held, then suit order) as trump, and the
+    highest rank of that suit the caller does not hold
+    '''
+    n = hands.shape[0]
+    rows = np.arange(n)
+    caller_hand = hands[rows, caller]
+    held = np.zeros((n, len(d.cards)), dtype=bool)
+    held[rows[:, None], caller_hand] = True
+    by_suit = held.reshape(n, len(d.suits), len(d.ranks))
+    suit_points = (by_suit * CARD_VALUES.reshape(len(d.suits), len(d.ranks))).sum(axis=2)
+    score = by_suit.sum(axis=2) * 1000 + suit_points * 10 - np.arange(len(d.suits))
+    suit = score.argmax(axis=1)
+    missing = ~by_suit[rows, suit]
+    # highest missing rank: last True along the rank axis
+    rank = len(d.ranks) - np.argmax(missing[:, ::-1], axis=1)
+    return rank.astype(np.int8), suit.astype(np.int8)
+
+
+def random_play(view, rng):
+    '''uniform over the cards still in hand'''
+    keys = rng.random(view.hand.shape)
+    keys[~view.legal()] = -1.0
+    return keys.argmax(axis=1)
+
+
+def lowest_card_play(view, rng):
+    '''always discard the cheapest card (by points, then rank)'''
+    hand = np.where(view.legal(), view.hand, 0)
+    cost = CARD_VALUES[hand].astype(np.int32) * 16 + CARD_RANKS[hand]
+    cost[~view.legal()] = np.iinfo(np.int32).max
+    return cost.argmin(axis=1)
+
+
+# Engine
+
+def deal(n, rng, minimum_hand_value=5, fixed=None):
+    '''
+    Shuffle and deal n games, redealing (vectorised, only the failing rows) until every hand holds at least
+    minimum_hand_value points, as Game.deal_cards does
+    :param fixed: 8 card ids to give seat 0 in every game, dealing only the other 32 cards at random
+    :return: (n, 5, 8) card ids
+    '''
+    hands = np.empty((n, SEATS, HAND_SIZE), dtype=np.int8)
+    if fixed is None:
+        cards, first = np.arange(len(d.cards), dtype=np.int8), 0
+    else:
+        fixed = np.asarray(fixed, dtype=np.int8)
+        cards, first = np.setdiff1d(np.arange(len(d.cards), dtype=np.int8), fixed), 1
+        hands[:, 0] = fixed
+    pending = np.arange(n)
+    while len(pending):
+        perm = np.argsort(rng.random((len(pending), len(cards))), axis=1)
+        hands[pending, first:] = cards[perm].reshape(len(pending), SEATS - first, HAND_SIZE)
+        held = CARD_VALUES[hands[pending, first:]].sum(axis=2)
+        pending = pending[(held < minimum_hand_value).any(axis=1)]
+    return hands
+
+
+def auction(limits):
+    '''
+    Resolve an ascending auction from each seat's bid limit: the highest limit wins (lowest seat on ties) at one
+    more than the next highest limit, and at least 61
+    :return: ((n,) winning seat, (n,) winning bid, (n,) void)
+    '''
+    rows = np.arange(limits.shape[0])
+    winner = limits.argmax(axis=1)
+    top = limits[rows, winner].astype(np.int16)
+    others = limits.astype(np.int16).copy()
+    others[rows, winner] = -1
+    bid = np.maximum(61, np.minimum(top, others.max(axis=1) + 1))
+    return winner, bid, top < 61
+
+
+def simulate(n, bid_policy=hand_value_bids, call_policy=call_best_missing, play_policy=random_play, seed=None,
+             minimum_hand_value=5, hands=None):
+    '''
+    Play n full games
+    :param n: number of games
+    :param bid_policy: vectorised bidding policy
+    :param call_policy: vectorised partner-call policy
+    :param play_policy: vectorised card-play policy
+    :param seed: seed for the numpy Generator used by the deal and the policies
+    :param minimum_hand_value: fewest points a dealt hand may hold
+    :param hands: (n, 5, 8) card ids to play instead of dealing
+    :return: BatchResult
+    '''
+    rng = np.random.default_rng(seed)
+    rows = np.arange(n)
+    if hands is None:
+        hands = deal(n, rng, minimum_hand_value)
+    bid_winner, bid, void = auction(bid_policy(hands, rng))
+    partner_rank, partner_suit = call_policy(hands, bid_winner, rng)
+
+    # seat holding each card, to find the partner
+    owner = np.empty((n, len(d.cards)), dtype=np.int8)
+    np.put_along_axis(owner, hands.reshape(n, -1).astype(np.intp),
+                      np.repeat(np.arange(SEATS, dtype=np.int8), HAND_SIZE)[None, :].repeat(n, axis=0), axis=1)
+    partner_card = partner_suit.astype(np.intp) * len(d.ranks) + partner_rank - 1
+    partner = owner[rows, partner_card]
+
+    plays = np.full((n, TRICKS, SEATS), -1, dtype=np.int8)
+    leaders = np.zeros((n, TRICKS), dtype=np.int8)
+    trick_winners = np.zeros((n, TRICKS), dtype=np.int8)
+    points = np.zeros((n, SEATS), dtype=np.int16)
+
+    live = np.flatnonzero(~void)
+    remaining = hands[live].copy()
+    m = len(live)
+    live_rows = np.arange(m)
+    trump = partner_suit[live].astype(np.intp)
+    hidden_trump = np.full(m, g.NO_TRUMP, dtype=np.intp)
+    leader = bid_winner[live].astype(np.intp)
+    caller = leader.copy()
+    live_points = np.zeros((m, SEATS), dtype=np.int16)
+    for trick_number in range(TRICKS):
+        trick = np.full((m, SEATS), -1, dtype=np.int8)
+        winning_card = np.zeros(m, dtype=np.intp)
+        winning_pos = np.zeros(m, dtype=np.intp)
+        visible_trump = hidden_trump if trick_number == 0 else trump
+        for position in range(SEATS):
+            seat = (leader + position) % SEATS
+            hand = remaining[live_rows, seat]
+            view = PlayView(hand, trick, position, visible_trump, seat, leader, caller, trick_number)
+            slot = np.asarray(play_policy(view, rng), dtype=np.intp)
+            card = hand[live_rows, slot].astype(np.intp)
+            if (card < 0).any():
+                raise ValueError('play policy chose an empty slot')
+            remaining[live_rows, seat, slot] = -1
+            trick[:, position] = card
+            if position == 0:
+                winning_card = card
+            else:
+                # the first trick is resolved with the called suit once complete, so using it throughout is equivalent
+                takes = BEATS[trump, winning_card, card]
+                winning_card = np.where(takes, card, winning_card)
+                winning_pos = np.where(takes, position, winning_pos)
+        winner = (leader + winning_pos) % SEATS
+        live_points[live_rows, winner] += CARD_VALUES[trick].sum(axis=1)
+        plays[live, trick_number] = trick
+        leaders[live, trick_number] = leader
+        trick_winners[live, trick_number] = winner
+        leader = winner
+    points[live] = live_points
+
+    return BatchResult(hands, bid_winner, bid, void, partner_rank, partner_suit, partner, plays, leaders,
+                       trick_winners, points)
+
+
+def replay_game(result, i):
+    '''
+    Drive the reference Game through game i of a batch result
+    :param result: BatchResult
+    :param i: row in the batch
+    :return: Game after the last trick
+    '''
+    if result.void[i]:
+        raise ValueError('game ' + str(i) + ' was void')
+    game = g.Game()
+    game.start_game()
+    for player, hand in zip(game.players, result.hands[i]):
+        player.hand = [d.cards[c] for c in hand]
+        player.original_hand = list(player.hand)
+    game.state = 'bid'
+
+    winner = int(result.bid_winner[i])
+    game.player_bid(winner, int(result.bid[i]))
+    for seat in range(SEATS):
+        if seat != winner:
+            game.player_bid(seat, -1)
+    game.call_partner_rank(int(result.partner_rank[i]))
+    for trick_number in range(TRICKS):
+        leader = int(result.leaders[i, trick_number])
+        for position, card_id in enumerate(result.plays[i, trick_number]):
+            game.play_card((leader + position) % SEATS, d.cards[card_id])
+        if trick_number == 0:
+            game.call_partner_suit(d.suits[result.partner_suit[i]])
+    return game
@@ -0,0 +1,211 @@
+'''
+Belief tracking for one seat: where the cards it cannot see are, and who the partner is.
+
+Everything is kept as 40-bit card masks per seat (see briscola.deck for card ids) and updated event by event: a
+play clears one bit from every seat and sets it in the player's played mask, and the partner call pins the called
+card on the partner. Probabilities are derived from the masks on demand: a card nobody is known to hold is spread
+over the seats that may still hold it in proportion to their free slots (the cards they hold that the observer
+cannot place), which is exact for a uniformly random deal.
+
+Trackers follow the service's events (trick.played and phase.change) with on_event, or can be driven directly
+by the Game transitions through card_played, caller_won, partner_rank_called and partner_revealed.
+'''
+import briscola.deck as d
+
+SEATS = 5
+ALL_CARDS = (1 << len(d.cards)) - 1
+_NOWHERE = [0.0] * SEATS
+_CERTAIN = [[1.0 if s == seat else 0.0 for s in range(SEATS)] for seat in range(SEATS)]
+
+
+def hand_mask(cards):
+    mask = 0
+    for card in cards:
+        mask |= 1 << card.card_id
+    return mask
+
+
+def mask_cards(mask):
+    '''
+    :return: the cards of a mask in card id order
+    '''
+    cards = []
+    while mask:
+        low = mask & -mask
+        cards.append(d.cards[low.bit_length() - 1])
+        mask ^= low
+    return cards
+
+
+class BeliefTracker:
+    '''
+    :param seat: observing player id
+    :param hand: the cards dealt to seat
+    '''
+
+    def __init__(self, seat, hand):
+        own = hand_mask(hand)
+        self.seat = seat
+        # possible[s]: cards s may still hold; known[s]: cards s is known to hold; played[s]: cards s has played
+        self.possible = [own if s == seat else ALL_CARDS & ~own for s in range(SEATS)]
+        self.known = [own if s == seat else 0 for s in range(SEATS)]
+        self.played = [0] * SEATS
+        self.hand_sizes = [len(hand)] * SEATS
+        self.plays = 0
+        self.caller = None
+        self.partner_rank = None
+        self.partner = None
+        self.partner_card = None
+        self._matrix = None
+
+    @classmethod
+    def from_game(cls, game, seat):
+        '''
+        Build a tracker for seat from a game's history (for a game restored or joined part way through)
+        '''
+        # the order of the plays does not matter to the masks
+        played = [entry for player in game.players for trick in player.tricks_won for entry in trick]
+        tracker = cls(seat, game.players[seat].original_hand)
+        if game.bid_winner is not None and game.state != 'bid':
+            tracker.caller_won(game.bid_winner.id)
+        for card, player_id in played + list(game.current_trick):
+            tracker.card_played(player_id, card.card_id)
+        if game.partner_rank is not None:
+            tracker.partner_rank_called(game.partner_rank)
+        if game.partner is not None:
+            tracker.partner_revealed(game.partner.id, game.partner_suit)
+        return tracker
+
+    def card_played(self, seat, card_id):
+        bit = 1 << card_id
+        if not (self.possible[seat] >> card_id) & 1:
+            raise ValueError('seat ' + str(seat) + ' cannot hold card ' + str(card_id))
+        keep = ~bit
+        possible, known = self.possible, self.known
+        for s in range(SEATS):
+            possible[s] &= keep
+            known[s] &= keep
+        self.played[seat] |= bit
+        self.hand_sizes[seat] -= 1
+        self.plays += 1
+        self._matrix = None
+
+    def caller_won(self, caller_id):
+        self.caller = caller_id
+        self._matrix = None
+
+    def partner_rank_called(self, rank):
+        self.partner_rank = rank
+        self._matrix = None
+
+    def partner_revealed(self, partner_id, suit):
+        card_id = d.suits.index(suit) * len(d.ranks) + self.partner_rank - 1
+        self.partner = partner_id
+        self.partner_card = card_id
+        bit = 1 << card_id
+        if self.possible[partner_id] & bit:
+            # still in a hand: it has to be the partner's
+            for s in range(SEATS):
+                self.possible[s] &= ~bit
+            self.possible[partner_id] |= bit
+            self.known[partner_id] |= bit
+        self._matrix = None
+
+    def on_event(self, event):
+        '''
+        Update from a published game event; other message types are ignored
+        '''
+        mtype = event.get('message_type')
+        if mtype == 'trick.played':
+            card = event['card']
+            if 'card_id' in card:
+                card_id = card['card_id']
+            else:
+                card_id = d.Card(card['suit'], int(card['rank'])).card_id
+            self.card_played(event['player_id'], card_id)
+        elif mtype == 'phase.change':
+            if event.get('caller_id') is not None and event.get('phase') == 'call-partner-rank':
+                self.caller_won(event['caller_id'])
+            if event.get('partner_rank') is not None and self.partner_rank is None:
+                self.partner_rank_called(event['partner_rank'])
+            if event.get('partner_id') is not None and self.partner is None:
+                self.partner_revealed(event['partner_id'], event['trump_suit'])
+
+    def unknown(self):
+        '''
+        :return: mask of the cards still in hands that the observer cannot place
+        '''
+        placed = 0
+        for mask in self.known:
+            placed |= mask
+        held = 0
+        for mask in self.possible:
+            held |= mask
+        return held & ~placed
+
+    def free_slots(self, seat):
+        return self.hand_sizes[seat] - self.known[seat].bit_count()
+
+    def card_probabilities(self):
+        '''
+        :return: 40 rows (by card id) of 5 probabilities (by seat) that the seat holds the card now; rows of played
+        cards are all zero. Rows are shared between cards and across calls until the next update, so treat them as
+        read-only.
+        '''
+        if self._matrix is not None:
+            return self._matrix
+        matrix = [_NOWHERE] * len(d.cards)
+        for s, mask in enumerate(self.known):
+            while mask:
+                low = mask & -mask
+                matrix[low.bit_length() - 1] = _CERTAIN[s]
+                mask ^= low
+
+        # unknown cards with the same set of candidate seats share a row
+        free = [self.free_slots(s) for s in range(SEATS)]
+        p0, p1, p2, p3, p4 = self.possible
+        rows = {}
+        mask = self.unknown()
+        while mask:
+            low = mask & -mask
+            card_id = low.bit_length() - 1
+            mask ^= low
+            holders = ((p0 >> card_id) & 1 | ((p1 >> card_id) & 1) << 1 | ((p2 >> card_id) & 1) << 2
+                       | ((p3 >> card_id) & 1) << 3 | ((p4 >> card_id) & 1) << 4)
+            row = rows.get(holders)
+            if row is None:
+                total = sum(free[s] for s in range(SEATS) if (holders >> s) & 1)
+                row = rows[holders] = [free[s] / total if (holders >> s) & 1 else 0.0 for s in range(SEATS)]
+            matrix[card_id] = row
+        self._matrix = matrix
+        return matrix
+
+    def holder_probabilities(self, card_id):
+        '''
+        :return: 5 probabilities that each seat held card_id in its dealt hand (played cards included)
+        '''
+        for s in range(SEATS):
+            if (self.played[s] >> card_id) & 1:
+                return _CERTAIN[s]
+        return self.card_probabilities()[card_id]
+
+    def partner_probabilities(self):
+        '''
+        :return: 5 probabilities that each seat is the partner. Once the rank is called the partner holds one of its
+        four cards, taken to be any the caller is not known to hold with equal chance; before that, any seat other
+        than the caller.
+        '''
+        if self.partner is not None:
+            return [1.0 if s == self.partner else 0.0 for s in range(SEATS)]
+        if self.partner_rank is None:
+            others = [s for s in range(SEATS) if s != self.caller]
+            return [1.0 / len(others) if s in others else 0.0 for s in range(SEATS)]
+        candidates = [suit * len(d.ranks) + self.partner_rank - 1 for suit in range(len(d.suits))]
+        if self.caller is not None:
+            caller_held = self.known[self.caller] | self.played[self.caller]
+            candidates = [c for c in candidates if not (caller_held >> c) & 1] or candidates
+        totals = [0.0] * SEATS
+        for card_id in candidates:
+            for s, p in enumerate(self.holder_probabilities(card_id)):
+                totals[s] += p
+        return [total / len(candidates) for total in totals]
@@ -0,0 +1,204 @@
+'''
+Monte Carlo bidding advisor.
+
+A hand is evaluated by dealing the 32 cards it does not hold at random to the other four seats many times and
+playing every deal out with the batch engine once for each partner call (rank and trump suit) the hand could make,
+with the hand as the bid winner. The result is the calling team's expected points for every call.
+
+Evaluations are cached in a bounded LRU keyed by the canonical form of the hand: the rules treat the four suits
+alike, so hands that differ only by a relabelling of suits share one evaluation (with the called suit relabelled to
+match). Suits the hand holds identically are interchangeable too and are only simulated once.
+'''
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+
+import briscola.deck as d
+from briscola import batch
+
+_RANKS = len(d.ranks)
+_SUITS = len(d.suits)
+_SUIT_MASK = (1 << _RANKS) - 1
+
+
+def canonical(cards):
+    '''
+    Canonical form of a hand under suit relabelling: the hand's per-suit rank masks sorted in descending order
+    :param cards: Card objects
+    :return: (40-bit canonical hand mask, order) where order[i] is the suit index relabelled to canonical suit i
+    '''
+    mask = 0
+    for card in cards:
+        mask |= 1 << card.card_id
+    suit_masks = [(mask >> (suit * _RANKS)) & _SUIT_MASK for suit in range(_SUITS)]
+    order = tuple(sorted(range(_SUITS), key=lambda suit: suit_masks[suit], reverse=True))
+    key = 0
+    for i, suit in enumerate(order):
+        key |= suit_masks[suit] << (i * _RANKS)
+    return key, order
+
+
+def simulate_calls(key, samples, minimum_hand_value=5, seed=0):
+    '''
+    Expected calling team points for a canonical hand, for every call
+    :param key: canonical hand mask
+    :param samples: deals of the hidden cards to play out per call
+    :param minimum_hand_value: fewest points any dealt hand holds
+    :param seed: numpy seed; the same deals are played for every call so calls compare with less noise
+    :return: (10, 4) array indexed [rank - 1, canonical suit]
+    '''
+    rng = np.random.default_rng([seed, key])
+    fixed = [card_id for card_id in range(len(d.cards)) if (key >> card_id) & 1]
+    suit_masks = [(key >> (suit * _RANKS)) & _SUIT_MASK for suit in range(_SUITS)]
+    # canonical suits come sorted, so suits held identically are adjacent
+    suits = [suit for suit in range(_SUITS) if suit == 0 or suit_masks[suit] != suit_masks[suit - 1]]
+    calls = len(suits) * _RANKS
+
+    hands = np.tile(batch.deal(samples, rng, minimum_hand_value, fixed=fixed), (calls, 1, 1))
+    rank = np.repeat(np.tile(np.arange(1, _RANKS + 1, dtype=np.int8), len(suits)), samples)
+    suit = np.repeat(np.repeat(np.array(suits, dtype=np.int8), _RANKS), samples)
+    limits = np.full((len(hands), batch.SEATS), -1, dtype=np.int16)
+    limits[:, 0] = 61
+
+    result = batch.simulate(len(hands), bid_policy=lambda hands, rng: limits,
+                            call_policy=lambda hands, caller, rng: (rank, suit), seed=rng.integers(1 << 63),
+                            hands=hands)
+    calling, _ = result.team_points()
+    means = calling.reshape(len(suits), _RANKS, samples).mean(axis=2)
+
+    values = np.empty((_RANKS, _SUITS))
+    for suit in range(_SUITS):
+        values[:, suit] = means[max(i for i, s in enumerate(suits) if s <= suit)]
+    return values
+
+
+class HandEvaluation:
+    '''
+    expected: {(rank, suit): calling team expected points} for every call
+    '''
+
+    def __init__(self, values, order):
+        self.expected = {(rank, d.suits[suit]): float(values[rank - 1, i])
+                         for i, suit in enumerate(order) for rank in d.ranks}
+
+    def best_call(self):
+        '''
+        :return: ((rank, suit), expected points) of the most valuable call
+        '''
+        call = max(self.expected, key=self.expected.get)
+        return call, self.expected[call]
+
+    def bid_limit(self, margin=0.0):
+        '''
+        Highest bid the hand is expected to make with its best call, -1 when that is below the minimum bid of 61
+        :param margin: points to keep in hand against the estimate
+        '''
+        limit = min(int(self.best_call()[1] - margin), 120)
+        return limit if limit >= 61 else -1
+
+
+class BiddingAdvisor:
+    '''
+    Evaluates hands on demand, in the calling thread with evaluate() or in the background with submit(), and keeps
+    the last cache_size evaluations
+    :param samples: deals played out per call
+    :param cache_size: canonical hands kept in the LRU cache
+    :param minimum_hand_value: fewest points any hand holds in the deals being simulated
+    :param executor: concurrent.futures executor used by submit (without one, submit evaluates in the calling thread)
+    '''
+
+    def __init__(self, samples=256, cache_size=4096, minimum_hand_value=5, seed=0, executor=None):
+        self.samples = samples
+        self.cache_size = cache_size
+        self.minimum_hand_value = minimum_hand_value
+        self.seed = seed
+        self.executor = executor
+        self.cache = OrderedDict()
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _cached(self, key):
+        with self._lock:
+            values = self.cache.get(key)
+            if values is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.cache.move_to_end(key)
+            return values
+
+    def _store(self, key, values):
+        with self._lock:
+            self.cache[key] = values
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            self.pending.pop(key, None)
+
+    def evaluate(self, cards):
+        '''
+        :param cards: the hand, Card objects
+        :return: HandEvaluation, simulated now unless cached
+        '''
+        key, order = canonical(cards)
+        values = self._cached(key)
+        if values is None:
+            values = simulate_calls(key, self.samples, self.minimum_hand_value, self.seed)
+            self._store(key, values)
+        return HandEvaluation(values, order)
+
+    def peek(self, cards):
+        '''
+        :return: HandEvaluation if the hand is cached, otherwise None (never simulates)
+        '''
+        key, order = canonical(cards)
+        values = self._cached(key)
+        return None if values is None else HandEvaluation(values, order)
+
+    def submit(self, cards):
+        '''
+        Evaluate a hand on the executor, sharing the work with any evaluation of the same canonical hand already
+        running
+        :return: Future resolving to a HandEvaluation
+        '''
+        key, order = canonical(cards)
+        future = Future()
+        values = self._cached(key)
+        if values is not None:
+            future.set_result(HandEvaluation(values, order))
+            return future
+
+        if self.executor is None:
+            values = simulate_calls(key, self.samples, self.minimum_hand_value, self.seed)
+            self._store(key, values)
+            future.set_result(HandEvaluation(values, order))
+            return future
+
+        with self._lock:
+            running = self.pending.get(key)
+            started = running is None
+            if started:
+                running = self.executor.submit(simulate_calls, key, self.samples, self.minimum_hand_value, self.seed)
+                self.pending[key] = running
+        if started:
+            # outside the lock: the callback runs right here if the simulation has already finished
+            running.add_done_callback(lambda done: self._finished(key, done))
+
+        def relabel(done):
+            if done.exception() is not None:
+                future.set_exception(done.exception())
+            else:
+                future.set_result(HandEvaluation(done.result(), order))
+        running.add_done_callback(relabel)
+        return future
+
+    def _finished(self, key, done):
+        if done.exception() is None:
+            self._store(key, done.result())
+        else:
+            with self._lock:
+                self.pending.pop(key, None)
@@ -0,0 +1,447 @@
+'''
+Bot players for empty seats.
+
+Bot makes every decision with simple heuristics and plays a random card. ISMCTSBot chooses cards (and the partner
+suit, when it is the caller) with information-set Monte Carlo tree search: each iteration deals the cards the bot
+cannot see into a random determinization consistent with what it has seen, walks a single tree shared by all
+determinizations, and plays the game out at random. The search runs root-parallel: several independent trees are
+searched in a process pool for the same wall-clock budget and their root visit counts are summed.
+'''
+import copy
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import briscola.deck as d
+from briscola.beliefs import mask_cards
+from briscola.endgame import EndgameSolver
+from briscola.game import beats, trump_index
+
+PLAY_STATES = ('play-first-trick', 'play-tricks', 'trick-won')
+# actions are card ids for plays, SUIT_ACTION + suit index for calling the partner suit
+SUIT_ACTION = len(d.cards)
+
+_executor = None
+
+
+def get_executor(max_workers=None):
+    '''
+    Process pool shared by every ISMCTSBot in this process, created on first use. Workers are spawned rather than
+    forked since the game service runs one thread per game.
+    '''
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), mp_context=get_context('spawn'))
+    return _executor
+
+
+def seat_to_act(game):
+    '''
+    :return: id of the player whose decision the game is waiting on, or None when no bot can act
+    '''
+    if game.state == 'call-partner-rank' or game.state == 'call-partner-suit':
+        return game.bid_winner.id
+    if game.state in PLAY_STATES and game.players[game.current_player_id].hand:
+        return game.current_player_id
+    return None
+
+
+def legal_actions(game):
+    if game.state == 'call-partner-suit':
+        return [SUIT_ACTION + i for i in range(len(d.suits))]
+    if game.state in PLAY_STATES:
+        return [card.card_id for card in game.players[game.current_player_id].hand]
+    return []
+
+
+def apply_action(game, action):
+    if action >= SUIT_ACTION:
+        game.call_partner_suit(d.suits[action - SUIT_ACTION])
+    else:
+        game.play_card(game.current_player_id, d.cards[action])
+
+
+def played_cards(game):
+    '''
+    :return: {player id: [cards played so far]}
+    '''
+    played = {player.id: [] for player in game.players}
+    for player in game.players:
+        for trick in player.tricks_won:
+            for card, player_id in trick:
+                played[player_id].append(card)
+    for card, player_id in game.current_trick:
+        played[player_id].append(card)
+    return played
+
+
+class Determinizer:
+    '''
+    Samples the cards an observer cannot see, for one decision point. Everything that does not change between
+    samples (played cards, unseen cards, hand sizes, the called card's holder) is worked out once, read off the
+    observer's BeliefTracker when one is given instead of from the game's history.
+    '''
+
+    def __init__(self, game, seat, beliefs=None):
+        self.seat = seat
+        if beliefs is not None:
+            self.played = {s: mask_cards(mask) for s, mask in enumerate(beliefs.played)}
+            self.fixed = {s: mask_cards(mask) if s != seat else [] for s, mask in enumerate(beliefs.known)}
+            self.unseen = mask_cards(beliefs.unknown())
+            self.hand_sizes = dict(enumerate(beliefs.hand_sizes))
+            return
+
+        self.played = played_cards(game)
+        seen = set(game.players[seat].hand)
+        for cards in self.played.values():
+            seen.update(cards)
+
+        self.fixed = {player.id: [] for player in game.players}
+        if game.partner is not None and game.partner.id != seat:
+            partner_card = d.Card(game.partner_suit, game.partner_rank)
+            if partner_card not in seen:
+                self.fixed[game.partner.id].append(partner_card)
+                seen.add(partner_card)
+
+        self.unseen = [card for card in d.cards if card not in seen]
+        self.hand_sizes = {player.id: len(player.hand) for player in game.players}
+
+    def deal(self, world, rng):
+        '''
+        Deal a fresh sample of the hidden cards into world, a copy of the game at the decision point
+        '''
+        unseen = list(self.unseen)
+        rng.shuffle(unseen)
+        for player in world.players:
+            if player.id == self.seat:
+                continue
+            fixed = self.fixed[player.id]
+            need = self.hand_sizes[player.id] - len(fixed)
+            hand = fixed + unseen[:need]
+            del unseen[:need]
+            player.hand = hand
+            player.original_hand = self.played[player.id] + hand
+        # partner lookup has to follow the sampled hands
+        world.card_owner = None
+        world.rehash()
+
+
+def determinize(game, seat, rng, beliefs=None):
+    '''
+    Copy the game and deal the cards seat cannot see at random to the other players, respecting their hand sizes
+    and, once the partner has been revealed, that the partner holds the called card
+    :param game: Game as seen by the server
+    :param seat: observing player id
+    :param rng: random.Random
+    :param beliefs: seat's BeliefTracker, in step with game
+    :return: Game copy
+    '''
+    world = copy.deepcopy(game)
+    Determinizer(game, seat, beliefs).deal(world, rng)
+    return world
+
+
+def unknown_cards(game, seat):
+    '''
+    Number of cards whose holder seat cannot be sure of: none once at most one other player still holds cards,
+    otherwise every card in the other hands except the called card once the partner is known
+    '''
+    holders = [player for player in game.players if player.id != seat and player.hand]
+    if len(holders) <= 1:
+        return 0
+    unknown = sum(len(player.hand) for player in holders)
+    if game.partner is not None and game.partner.id != seat:
+        partner_card = d.Card(game.partner_suit, game.partner_rank)
+        if game.partner.has_card(partner_card):
+            unknown -= 1
+    return unknown
+
+
+def reward(game, seat):
+    '''
+    Value of a finished game for seat: half for the team making (or breaking) the bid, half for its share of points
+    '''
+    calling, defending = game.team_points()
+    if seat in (game.bid_winner.id, game.partner.id):
+        return 0.5 * (calling >= game.bid) + 0.5 * calling / 120.0
+    return 0.5 * (calling < game.bid) + 0.5 * defending / 120.0
+
+
+class Node:
+    __slots__ = ('parent', 'action', 'actor', 'children', 'visits', 'total', 'available')
+
+    def __init__(self, parent=None, action=None, actor=None):
+        self.parent = parent
+        self.action = action
+        self.actor = actor
+        self.children = {}
+        self.visits = 0
+        self.total = 0.0
+        self.available = 1
+
+
+def search(game, seat, budget=0.2, iterations=None, seed=None, exploration=0.7, beliefs=None):
+    '''
+    Run one ISMCTS tree from seat's point of view
+    :param game: Game waiting on a decision by seat
+    :param seat: acting player id
+    :param budget: wall-clock seconds to search for
+    :param iterations: stop after this many iterations instead, if given
+    :param seed: seed for the determinization and rollout generator
+    :param exploration: UCB exploration constant
+    :param beliefs: seat's BeliefTracker, in step with game
+    :return: ({action: root visits}, iterations run)
+    '''
+    rng = random.Random(seed)
+    root = Node()
+    # one working copy: every iteration redeals its hidden cards, plays down the tree and undoes back to the root
+    world = copy.deepcopy(game)
+    sampler = Determinizer(game, seat, beliefs)
+    deadline = time.perf_counter() + budget
+    done = 0
+    while (done < iterations) if iterations is not None else (time.perf_counter() < deadline):
+        sampler.deal(world, rng)
+        node = root
+        depth = 0
+
+        # selection and expansion
+        actions = legal_actions(world)
+        while actions:
+            untried = [a for a in actions if a not in node.children]
+            actor = seat_to_act(world)
+            if untried:
+                action = rng.choice(untried)
+                child = Node(node, action, actor)
+                node.children[action] = child
+                apply_action(world, action)
+                depth += 1
+                node = child
+                break
+            best, best_score = None, -1.0
+            for a in actions:
+                child = node.children[a]
+                child.available += 1
+                score = child.total / child.visits + exploration * math.sqrt(math.log(child.available) / child.visits)
+                if score > best_score:
+                    best, best_score = child, score
+            apply_action(world, best.action)
+            depth += 1
+            node = best
+            actions = legal_actions(world)
+
+        # rollout
+        actions = legal_actions(world)
+        while actions:
+            apply_action(world, rng.choice(actions))
+            depth += 1
+            actions = legal_actions(world)
+
+        # backpropagation
+        while node is not None:
+            node.visits += 1
+            if node.actor is not None:
+                node.total += reward(world, node.actor)
+            node = node.parent
+        for _ in range(depth):
+            world.undo()
+        done += 1
+
+    return {action: child.visits for action, child in root.children.items()}, done
+
+
+class Bot:
+    '''
+    Heuristic bot: bids on card points held (or the bidding advisor's estimate, when given one), calls the highest
+    rank it is missing and its longest suit, and plays a random card. With tables (briscola.tables.WinTables) it bids
+    on the points its hand is expected to take under its best trump, calls the suit its hand wins the most tricks
+    with and plays the card with the best expected points from the trick
+    :param bid_margin: points below the advisor's (or the tables') expected points to stop bidding at
+    '''
+
+    def __init__(self, seed=None, bid_margin=5, tables=None):
+        self.rng = random.Random(seed)
+        self.bid_margin = bid_margin
+        self.tables = tables
+
+    def choose_bid(self, game, seat, advice=None):
+        '''
+        :param advice: HandEvaluation of seat's hand from the bidding advisor; without one the limit comes from the
+        card points held
+        '''
+        player = game.players[seat]
+        if advice is not None:
+            limit = advice.bid_limit(self.bid_margin)
+        elif self.tables is not None:
+            # the partner is one of the four other hands, worth a fifth of the points on average
+            expected = max(self.hand_take(player.original_hand, suit) for suit in d.suits) + 120 / 5
+            limit = min(int(expected - self.bid_margin), 120)
+            limit = limit if limit >= 61 else -1
+        else:
+            held = sum(card.value for card in player.original_hand)
+            limit = min(61 + held - 20, 120) if held > 20 else -1
+        others_passed = all(p.bid == -1 for p in game.players if p.id != seat)
+        if game.bid_winner is None and others_passed:
+            # somebody has to open or the hand cannot be played
+            return 61
+        if game.bid + 1 <= limit:
+            return game.bid + 1
+        return -1
+
+    def choose_rank(self, game, seat):
+        held = game.players[seat].hand
+        for rank in reversed(d.ranks):
+            if sum(1 for card in held if card.rank == rank) < len(d.suits):
+                return rank
+        return d.ranks[-1]
+
+    def choose_suit(self, game, seat, beliefs=None):
+        held = game.players[seat].original_hand
+        suits = [suit for suit in d.suits if d.Card(suit, game.partner_rank) not in held] or d.suits
+        if self.tables is not None:
+            return max(suits, key=lambda suit: self.hand_wins(held, suit))
+        return max(suits, key=lambda suit: sum(1 for card in held if card.suit == suit))
+
+    def hand_wins(self, cards, suit):
+        '''
+        Tricks cards are expected to win with suit as trump, each played at a random position of a random trick
+        '''
+        trump = trump_index(suit)
+        return sum(self.tables.win_probability(trump, position, card.card_id)
+                   for card in cards for position in range(5)) / 5
+
+    def hand_take(self, cards, suit):
+        '''
+        Points cards are expected to take with suit as trump, each played at a random position of a random trick
+        '''
+        trump = trump_index(suit)
+        return sum(self.tables.expected_take(trump, position, card.card_id)
+                   for card in cards for position in range(5)) / 5
+
+    def choose_card(self, game, seat, beliefs=None):
+        if self.tables is None:
+            return self.rng.choice(game.players[seat].hand)
+        return max(game.players[seat].hand, key=lambda card: (self.card_score(game, seat, card), -card.card_id))
+
+    def card_score(self, game, seat, card):
+        '''
+        Expected points seat's side gains (negative: gives away) by playing card now, taking the trick's later cards
+        as random: a card that takes the trick scores what is on the table plus itself while it holds, weighed by its
+        hold probability; a card that does not gives its points to the current winner
+        '''
+        trump = trump_index(game.partner_suit)
+        winning = game.trick_winning_card
+        remaining = 4 - len(game.current_trick)
+        on_table = sum(c.value for c, _ in game.current_trick)
+        if winning is None or beats(winning, card, game.partner_suit):
+            held = self.tables.hold_probability(trump, card.card_id, remaining)
+            return held * (on_table + card.value) - (1 - held) * card.value
+        teams_known = game.partner is not None
+        calling = (game.bid_winner.id, game.partner.id) if teams_known else ()
+        if teams_known and (seat in calling) == (game.trick_winner_id in calling):
+            held = self.tables.hold_probability(trump, winning.card_id, remaining)
+            return held * card.value - (1 - held) * card.value
+        return -card.value
+
+
+class ISMCTSBot(Bot):
+    '''
+    Bot that searches card plays and the partner suit call with ISMCTS, switching to the exact endgame solver once
+    few enough cards are unknown
+    :param budget: wall-clock seconds per decision
+    :param workers: number of root-parallel trees; more than one runs them in the shared process pool
+    :param iterations: fixed iteration count per tree (and endgame sample count) instead of the time budget
+    :param endgame_threshold: solve exactly once at most this many cards are unknown (0 disables the solver)
+    :param pool: search in the shared process pool even with one tree, so that bots deciding on several threads at
+    once search in parallel
+    :param tables: briscola.tables.WinTables to bid from when there is no advice from the bidding advisor
+    '''
+
+    def __init__(self, budget=0.2, workers=None, iterations=None, seed=None, endgame_threshold=12, pool=False,
+                 tables=None):
+        super().__init__(seed, tables=tables)
+        self.budget = budget
+        self.workers = workers or os.cpu_count()
+        self.pool = pool
+        self.iterations = iterations
+        self.endgame_threshold = endgame_threshold
+        self.solver = EndgameSolver()
+        self.last_search = None # {'iterations', 'seconds', 'visits' or 'values', 'endgame'} for the last decision
+
+    def choose_action(self, game, seat, beliefs=None):
+        '''
+        :param beliefs: seat's BeliefTracker, in step with game; saves working out what seat has seen from the history
+        :return: action to take
+        '''
+        actions = legal_actions(game)
+        if len(actions) == 1:
+            return actions[0]
+
+        if self.endgame_threshold and game.partner is not None and game.state in ('play-tricks', 'trick-won'):
+            unknown = unknown_cards(game, seat)
+            if unknown <= self.endgame_threshold:
+                return self.solve_endgame(game, seat, unknown, beliefs)
+
+        started = time.perf_counter()
+        seeds = [self.rng.getrandbits(64) for _ in range(self.workers)]
+        if self.workers == 1 and not self.pool:
+            results = [search(game, seat, self.budget, self.iterations, seeds[0], beliefs=beliefs)]
+        else:
+            # leave headroom for shipping the game to the workers and the counts back
+            budget = self.budget * 0.85
+            futures = [get_executor().submit(search, game, seat, budget, self.iterations, s, beliefs=beliefs)
+                       for s in seeds]
+            results = [future.result() for future in futures]
+
+        visits = {}
+        for counts, _ in results:
+            for action, n in counts.items():
+                visits[action] = visits.get(action, 0) + n
+        self.last_search = {
+            'iterations': sum(done for _, done in results),
+            'seconds': time.perf_counter() - started,
+            'visits': visits,
+            'endgame': False,
+        }
+        return max(actions, key=lambda a: visits.get(a, 0))
+
+    def solve_endgame(self, game, seat, unknown, beliefs=None):
+        '''
+        Solve determinizations exactly until the budget runs out (a single one when nothing is unknown) and play the
+        move with the best average value for seat's team
+        '''
+        started = time.perf_counter()
+        totals = {}
+        samples = nodes = 0
+        while True:
+            result = self.solver.solve(determinize(game, seat, self.rng, beliefs), all_moves=True)
+            for move, value in result.move_values.items():
+                totals[move] = totals.get(move, 0) + value
+            samples += 1
+            nodes += result.nodes
+            if unknown == 0:
+                break
+            if self.iterations is not None:
+                if samples >= self.iterations:
+                    break
+            elif time.perf_counter() - started >= self.budget:
+                break
+
+        values = {move: total / samples for move, total in totals.items()}
+        self.last_search = {
+            'iterations': samples,
+            'nodes': nodes,
+            'seconds': time.perf_counter() - started,
+            'values': values,
+            'endgame': True,
+        }
+        calling = seat in (game.bid_winner.id, game.partner.id)
+        return (max if calling else min)(values, key=values.get)
+
+    def choose_suit(self, game, seat, beliefs=None):
+        return d.suits[self.choose_action(game, seat, beliefs) - SUIT_ACTION]
+
+    def choose_card(self, game, seat, beliefs=None):
+        return d.cards[self.choose_action(game, seat, beliefs)]
@@ -1,26 +1,158 @@
 import random as r
+import threading
+
 suits = ['cups', 'coins', 'swords', 'clubs']
 ranks = range(1, 11)
 values = [0, 0, 0, 0, 0, 2, 3, 4, 10, 11]
 
+# lookup tables indexed by card id (suit_index * 10 + rank - 1)
+card_suits = [suit for suit in suits for rank in ranks]
+card_ranks = [rank for suit in suits for rank in ranks]
+card_values = [values[rank - 1] for suit in suits for rank in ranks]
+
+
 class Card:
-    def __init__(self, suit, rank):
-        self.suit = suit
-        self.rank = rank
-        self.value = values[rank-1]
+    '''
+    One of the 40 cards in the deck. Cards are interned: Card(suit, rank) always returns the same object for the
+    same suit/rank, so equality is an identity check and cards can be used in sets and as dict keys.
+    '''
+    __slots__ = ('suit', 'rank', 'value', 'card_id')
+
+    def __new__(cls, suit, rank):
+        try:
+            return _card_index[(suit, rank)]
+        except (KeyError, TypeError):
+            raise ValueError('invalid card ' + str(suit) + ',' + str(rank)) from None
 
     def __str__(self):
         return str(self.suit) + ',' + str(self.rank)
 
+    def __repr__(self):
+        return 'Card(' + repr(self.suit) + ', ' + repr(self.rank) + ')'
+
     def __eq__(self, other):
-        return (self.suit == other.suit) and (self.rank == other.rank)
+        return self is other
+
+    def __hash__(self):
+        return self.card_id
+
+    # interned cards are never copied; pickling resolves back to the interned instance
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return card_from_id, (self.card_id,)
+
+
+def _make_card(card_id):
+    card = object.__new__(Card)
+    card.suit = card_suits[card_id]
+    card.rank = card_ranks[card_id]
+    card.value = card_values[card_id]
+    card.card_id = card_id
+    return card
+
+
+cards = tuple(_make_card(i) for i in range(len(suits) * len(ranks)))
+_card_index = {(card.suit, card.rank): card for card in cards}
+
+
+def card_from_id(card_id):
+    '''
+    Look up the interned card for a card id
+    :param card_id: suit_index * 10 + rank - 1
+    :return: Card object
+    '''
+    try:
+        if 0 <= card_id < len(cards):
+            return cards[card_id]
+    except TypeError:
+        pass
+    raise ValueError('invalid card id ' + str(card_id))
+
+
+def new_seed():
+    '''
+    Seed for a new game or deck, drawn from the module generator (itself seeded from the OS at import, or by
+    random.seed in tests)
+    '''
+    return r.getrandbits(64)
+
+
+class ShufflePool:
+    '''
+    Permutations of the 40 card ids, generated with NumPy a batch at a time so that dealing many games does not pay
+    for a Python shuffle each. Draw n is a pure function of (seed, n), so a deal taken from the pool can be
+    replayed from the draw numbers recorded for it. One pool can be shared by every game in a process.
+    :param seed: pool seed
+    :param batch: permutations generated at once
+    '''
+
+    def __init__(self, seed=0, batch=4096):
+        import numpy as np
+        self._np = np
+        self.seed = seed
+        self.batch = batch
+        self.draws = 0
+        self._block_number = None
+        self._block = None
+        self._lock = threading.Lock()
+
+    def _generate(self, block_number):
+        rng = self._np.random.default_rng([self.seed, block_number])
+        return self._np.argsort(rng.random((self.batch, len(cards))), axis=1).tolist()
+
+    def permutation(self, draw):
+        '''
+        :return: the list of card ids of draw number draw
+        '''
+        block_number, row = divmod(draw, self.batch)
+        if block_number == self._block_number:
+            return self._block[row]
+        return self._generate(block_number)[row]
+
+    def draw(self):
+        '''
+        :return: (draw number, list of card ids)
+        '''
+        with self._lock:
+            draw = self.draws
+            self.draws += 1
+            block_number, row = divmod(draw, self.batch)
+            if block_number != self._block_number:
+                self._block = self._generate(block_number)
+                self._block_number = block_number
+            return draw, list(self._block[row])
+
+    # copies of a game share its pool; pickles carry only what is needed to rebuild it
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return _restore_pool, (self.seed, self.batch, self.draws)
+
+
+def _restore_pool(seed, batch, draws):
+    pool = ShufflePool(seed, batch)
+    pool.draws = draws
+    return pool
+
 
 class Deck:
-    def __init__(self):
-        self.cards = []
-        for suit in suits:
-            for rank in ranks:
-                self.cards.append(Card(suit, rank))
+    '''
+    :param seed: seed of the deck's own random stream (a fresh one if not given)
+    :param pool: ShufflePool to deal from instead of shuffling with the stream
+    '''
+
+    def __init__(self, seed=None, pool=None):
+        self.cards = list(cards)
+        self.seed = new_seed() if seed is None else seed
+        self.rng = r.Random(self.seed)
+        self.pool = pool
+        self.pool_draws = [] # pool draw numbers used by the last deal
 
     def __str__(self):
         cards_str = []
@@ -29,11 +161,42 @@ class Deck:
 
         return str(cards_str)
 
+    def _permutation(self):
+        # next candidate order of card ids, from the pool or the deck's stream
+        if self.pool is not None:
+            draw, ids = self.pool.draw()
+            self.pool_draws.append(draw)
+            return ids
+        ids = [card.card_id for card in self.cards]
+        self.rng.shuffle(ids)
+        return ids
+
     def shuffle(self):
-        r.shuffle(self.cards)
+        self.pool_draws = []
+        self.cards = [cards[i] for i in self._permutation()]
 
     def deal_hands(self):
         self.shuffle()
 
         return [self.cards[i:i + 8] for i in range(0, len(self.cards), 8)]
 
+    def deal_valid_hands(self, minimum_hand_value=0, max_attempts=10000):
+        '''
+        Deals five hands of eight where every hand holds at least minimum_hand_value points. Candidate deals are
+        shuffled and checked as integer card ids, so a rejected deal costs no Card lookups or list copies.
+        :param minimum_hand_value: fewest points any hand may hold
+        :param max_attempts: give up after this many rejected shuffles
+        :return: (hands, number of shuffles it took)
+        '''
+        if minimum_hand_value * 5 > sum(card_values):
+            raise ValueError('no deal gives every hand ' + str(minimum_hand_value) + ' points')
+
+        self.pool_draws = []
+        for attempt in range(1, max_attempts + 1):
+            ids = self._permutation()
+            if all(sum([card_values[i] for i in ids[start:start + 8]]) >= minimum_hand_value
+                   for start in range(0, len(ids), 8)):
+                self.cards = [cards[i] for i in ids]
+                return [self.cards[i:i + 8] for i in range(0, len(self.cards), 8)], attempt
+
+        raise ValueError('no valid deal in ' + str(max_attempts) + ' shuffles')
@@ -0,0 +1,227 @@
+'''
+Exact endgame solver.
+
+Once the partner suit has been called the two teams are fixed, and with every remaining card placed (from the
+server's view, or in a determinization) the rest of the hand is a two-team, perfect-information game. The solver
+runs alpha-beta over it with a transposition table keyed by the remaining hands, the trick leader and the cards
+already in the current trick, and returns the move that maximises the calling team's points (or minimises them, when
+a defender is to play).
+'''
+import time
+
+import briscola.deck as d
+from briscola.game import _beats, trump_index
+
+_N = len(d.cards)
+_VALUES = d.card_values
+# transposition table bound flags
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class SolveResult:
+    '''
+    move: card id to play
+    value: calling team's final points with best play from here (points already taken included)
+    move_values: {card id: calling team final points} for every legal move, when requested
+    nodes, tt_hits: search effort for this solve
+    seconds: wall time of the solve
+    '''
+
+    def __init__(self, move, value, move_values, nodes, tt_hits, seconds):
+        self.move = move
+        self.value = value
+        self.move_values = move_values
+        self.nodes = nodes
+        self.tt_hits = tt_hits
+        self.seconds = seconds
+
+    def __repr__(self):
+        return 'SolveResult(move={}, value={}, nodes={}, tt_hits={}, seconds={:.6f})'.format(
+            self.move, self.value, self.nodes, self.tt_hits, self.seconds)
+
+
+class EndgameSolver:
+    '''
+    Alpha-beta solver with a transposition table shared across solves of the same hand (the table is cleared when
+    the trump suit or the teams change, or when it grows past max_entries)
+    '''
+
+    def __init__(self, max_entries=2000000):
+        self.max_entries = max_entries
+        self.table = {}
+        self._table_context = None
+        self.nodes = 0
+        self.tt_hits = 0
+        # running totals across solves, for tuning the cutover
+        self.total_nodes = 0
+        self.total_seconds = 0.0
+        self.solves = 0
+
+    def solve(self, game, all_moves=False):
+        '''
+        Solve the position of a Game whose partner has been called and whose hands are all known
+        :param game: Game in a play state after call_partner_suit
+        :param all_moves: also compute the exact value of every legal move, not only the best one
+        :return: SolveResult
+        '''
+        if game.partner is None or game.state not in ('play-tricks', 'trick-won'):
+            raise ValueError('endgame can only be solved once the partner suit is called')
+        hands = tuple(player.hand_mask for player in game.players)
+        if not any(hands):
+            raise ValueError('no cards left to play')
+
+        trump = trump_index(game.partner_suit)
+        team = (1 << game.bid_winner.id) | (1 << game.partner.id)
+        if self._table_context != (trump, team) or len(self.table) > self.max_entries:
+            self.table = {}
+            self._table_context = (trump, team)
+        self._offset = trump * _N
+        self._team = team
+
+        started = time.perf_counter()
+        self.nodes = 0
+        self.tt_hits = 0
+        trick = tuple(card.card_id for card, _ in game.current_trick)
+        leader = game.current_leader_id
+        win_card, win_pos = self._trick_state(trick)
+        banked, _ = game.team_points()
+
+        seat = (leader + len(trick)) % 5
+        if all_moves:
+            # every card gets a value, even ones interchangeable with another
+            moves = [card for card in range(_N) if (hands[seat] >> card) & 1]
+        else:
+            moves = self._ordered(hands, seat, leader, trick, win_card, win_pos)
+        maximizing = (team >> seat) & 1
+        move_values = {}
+        best_move, best = None, None
+        alpha, beta = -1, 121
+        for card in moves:
+            child_hands, child_win, child_pos = self._play(hands, seat, card, trick, win_card, win_pos)
+            if all_moves:
+                value = self._search(child_hands, leader, trick + (card,), child_win, child_pos, -1, 121)
+                move_values[card] = banked + value
+            else:
+                value = self._search(child_hands, leader, trick + (card,), child_win, child_pos, alpha, beta)
+            if best is None or (value > best if maximizing else value < best):
+                best_move, best = card, value
+                if not all_moves:
+                    if maximizing:
+                        alpha = max(alpha, value)
+                    else:
+                        beta = min(beta, value)
+
+        seconds = time.perf_counter() - started
+        self.total_nodes += self.nodes
+        self.total_seconds += seconds
+        self.solves += 1
+        return SolveResult(best_move, banked + best, move_values, self.nodes, self.tt_hits, seconds)
+
+    def _trick_state(self, trick):
+        # winning card id and its position in a partial trick
+        if not trick:
+            return None, None
+        win_card, win_pos = trick[0], 0
+        for pos in range(1, len(trick)):
+            if _beats[(self._offset + win_card) * _N + trick[pos]]:
+                win_card, win_pos = trick[pos], pos
+        return win_card, win_pos
+
+    def _play(self, hands, seat, card, trick, win_card, win_pos):
+        child_hands = hands[:seat] + (hands[seat] & ~(1 << card),) + hands[seat + 1:]
+        if win_card is None or _beats[(self._offset + win_card) * _N + card]:
+            return child_hands, card, len(trick)
+        return child_hands, win_card, win_pos
+
+    def _ordered(self, hands, seat, leader, trick, win_card, win_pos, first=None):
+        '''
+        Moves for seat, most promising first so cutoffs come early: if seat's team is already winning the trick,
+        high-value cards first; otherwise cards that take the trick first (highest value), then the cheapest
+        discards. Zero-point cards of one suit with no outstanding card between them are interchangeable, so only
+        the lowest of each such run is tried. first (the table's best move) goes to the front.
+        '''
+        mask = hands[seat]
+        outstanding = (hands[0] | hands[1] | hands[2] | hands[3] | hands[4]) & ~mask
+        for card in trick:
+            outstanding |= 1 << card
+        cards = []
+        previous = -1  # last zero-point card seen in the current run
+        while mask:
+            low = mask & -mask
+            card = low.bit_length() - 1
+            mask ^= low
+            if _VALUES[card]:
+                previous = -1
+            elif previous >= 0 and previous // 10 == card // 10 and not outstanding & (low - (2 << previous)):
+                previous = card
+                continue
+            else:
+                previous = card
+            cards.append(card)
+
+        team = self._team
+        if win_card is not None and ((team >> seat) & 1) == ((team >> ((leader + win_pos) % 5)) & 1):
+            cards.sort(key=lambda c: _VALUES[c], reverse=True)
+        elif win_card is not None:
+            row = (self._offset + win_card) * _N
+            cards.sort(key=lambda c: (_beats[row + c], _VALUES[c] if _beats[row + c] else -_VALUES[c]), reverse=True)
+        else:
+            cards.sort(key=lambda c: _VALUES[c], reverse=True)
+        if first is not None and first in cards:
+            cards.remove(first)
+            cards.insert(0, first)
+        return cards
+
+    def _search(self, hands, leader, trick, win_card, win_pos, alpha, beta):
+        '''
+        :return: points the calling team takes from the current trick onwards
+        '''
+        self.nodes += 1
+        if len(trick) == 5:
+            winner = (leader + win_pos) % 5
+            gained = sum(_VALUES[c] for c in trick) if (self._team >> winner) & 1 else 0
+            if not any(hands):
+                return gained
+            return gained + self._search(hands, winner, (), None, None, alpha - gained, beta - gained)
+
+        key = (hands, leader, trick)
+        entry = self.table.get(key)
+        first = None
+        if entry is not None:
+            self.tt_hits += 1
+            value, flag, first = entry
+            if flag == EXACT:
+                return value
+            if flag == LOWER:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                return value
+
+        seat = (leader + len(trick)) % 5
+        maximizing = (self._team >> seat) & 1
+        original_alpha, original_beta = alpha, beta
+        best, best_card = (-1 if maximizing else 121), None
+        for card in self._ordered(hands, seat, leader, trick, win_card, win_pos, first):
+            child_hands, child_win, child_pos = self._play(hands, seat, card, trick, win_card, win_pos)
+            value = self._search(child_hands, leader, trick + (card,), child_win, child_pos, alpha, beta)
+            if maximizing:
+                if value > best:
+                    best, best_card = value, card
+                alpha = max(alpha, best)
+            else:
+                if value < best:
+                    best, best_card = value, card
+                beta = min(beta, best)
+            if alpha >= beta:
+                break
+
+        if best <= original_alpha:
+            flag = UPPER
+        elif best >= original_beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table[key] = (best, flag, best_card)
+        return best
@@ -1,11 +1,60 @@
-import copy
 import random
+import time
+from operator import attrgetter
 
 import briscola.player as p
 import briscola.deck as d
 
 # Helper functions
 
+# trump index used before a trump suit has been called
+NO_TRUMP = len(d.suits)
+
+
+def _build_beats_table():
+    # _beats[(trump_index * 40 + winning_id) * 40 + card_id] is 1 when card_id takes the trick from winning_id
+    n = len(d.cards)
+    table = bytearray((NO_TRUMP + 1) * n * n)
+    for trump in range(NO_TRUMP + 1):
+        trump_suit = d.suits[trump] if trump < NO_TRUMP else None
+        for winning_id in range(n):
+            for card_id in range(n):
+                winning_suit, card_suit = d.card_suits[winning_id], d.card_suits[card_id]
+                higher = d.card_ranks[card_id] > d.card_ranks[winning_id]
+                if card_suit == trump_suit:
+                    # a trump beats a non-trump, or a lower trump
+                    wins = winning_suit != trump_suit or higher
+                else:
+                    # otherwise only a higher card of the winning card's suit wins
+                    wins = card_suit == winning_suit and higher
+                table[(trump * n + winning_id) * n + card_id] = wins
+    return table
+
+
+_beats = _build_beats_table()
+
+
+def trump_index(trump_suit=None):
+    '''
+    Index of the trump suit in the beats table
+    :param trump_suit: called suit, or None before it is called
+    :return: suit index, or NO_TRUMP
+    '''
+    return NO_TRUMP if trump_suit is None else d.suits.index(trump_suit)
+
+
+def beats(winning_card, card, trump_suit=None):
+    '''
+    Table lookup: does card take the trick from winning_card?
+    :param winning_card: card currently winning the trick
+    :param card: card being played
+    :param trump_suit: suit that can trump any other suit
+    :return: True if card becomes the winning card
+    '''
+    n = len(d.cards)
+    return _beats[(trump_index(trump_suit) * n + winning_card.card_id) * n + card.card_id] == 1
+
+
 def trick_winner(trick, trump_suit=None):
     '''
     Determines the best card in cards based on the trump_suit. first card in the list is the secondary trump
@@ -14,54 +63,98 @@ def trick_winner(trick, trump_suit=None):
     :return: Card object representing the best card in cards.
     '''
 
-    # first card is winning unless we find a higher card in that suit or a trump suit card
-    winning_card = trick[0][0]
-    winning_player_id = trick[0][1]
-    for card, player_id in trick:
-        # found a trump card
-        if card.suit == trump_suit:
+    # first card is winning unless a later card beats it
+    n = len(d.cards)
+    offset = trump_index(trump_suit) * n
+    winning_card, winning_player_id = trick[0]
+    for card, player_id in trick[1:]:
+        if _beats[(offset + winning_card.card_id) * n + card.card_id]:
+            winning_card = card
+            winning_player_id = player_id
 
-            # winning card is also trump card
-            if winning_card.suit == trump_suit:
+    return winning_card, winning_player_id
 
-                # assign winning card by rank
-                if card.rank > winning_card.rank:
-                    winning_card = card
-                    winning_player_id = player_id
 
-            # winning card is not a trump card, replace it
-            else:
-                winning_card = card
-                winning_player_id = player_id
+# Zobrist keys: the hash of a game is the XOR of one key per card location and one per scalar field
+GAME_STATES = ['idle', 'ready', 'bid', 'call-partner-rank', 'play-first-trick', 'call-partner-suit', 'play-tricks',
+               'trick-won']
+_zobrist_rng = random.Random(0x5EED)
 
-        #found a card matching winning card suit
-        elif card.suit == winning_card.suit:
 
-            #assign winning card by rank
-            if card.rank > winning_card.rank:
-                winning_card = card
-                winning_player_id = player_id
+def _zobrist_keys(*shape):
+    if len(shape) == 1:
+        return [_zobrist_rng.getrandbits(64) for _ in range(shape[0])]
+    return [_zobrist_keys(*shape[1:]) for _ in range(shape[0])]
 
-    return winning_card, winning_player_id
+
+_Z_HAND = _zobrist_keys(5, len(d.cards))    # card in a player's hand
+_Z_TRICK = _zobrist_keys(5, len(d.cards))   # card played by a player into the current trick
+_Z_WON = _zobrist_keys(5, len(d.cards))     # card in a trick won by a player
+_Z_STATE = dict(zip(GAME_STATES, _zobrist_keys(len(GAME_STATES))))
+_Z_CURRENT = _zobrist_keys(5)
+_Z_LEADER = _zobrist_keys(5)
+_Z_BID_WINNER = _zobrist_keys(5)
+_Z_PARTNER = _zobrist_keys(5)
+_Z_RANK = _zobrist_keys(len(d.ranks) + 1)
+_Z_SUIT = _zobrist_keys(len(d.suits))
+_Z_GAME_BID = _zobrist_keys(121)
+_Z_PLAYER_BID = _zobrist_keys(5, 122)     # indexed by bid + 1 (-1 pass, 0 no bid yet, 61-120)
+
+# fields restored wholesale by undo
+_UNDO_FIELDS = ('state', 'bid', 'bid_winner', 'partner', 'partner_rank', 'partner_suit', 'current_trick',
+                'trick_winning_card', 'trick_winner_id', '_trick_resolved', 'last_trick', 'last_trick_winner_id',
+                'current_leader_id', 'current_player_id', 'card_owner', '_zobrist_cards', '_zobrist_bids', 'zobrist')
+_undo_fields = attrgetter(*_UNDO_FIELDS)
 
 
 class Game:
-    def __init__(self):
+    '''
+    :param minimum_hand_value: fewest points a dealt hand may hold
+    :param seed: seed of the game's own random stream, which the deck is seeded from (a fresh one if not given);
+    the same seed deals the same hands
+    :param shuffle_pool: deck.ShufflePool to deal from instead
+    '''
+    def __init__(self, minimum_hand_value=5, seed=None, shuffle_pool=None):
         self.state = 'idle'
         self.bid = 60
         self.bid_winner = None
         self.partner = None
         self.players = [p.Player(i) for i in range(5)]
-        self.deck = d.Deck()
+        self.shuffle_pool = shuffle_pool
+        self.reseed(d.new_seed() if seed is None else seed)
         self.partner_rank = None
         self.partner_suit = None
         self.current_trick = []
+        self.trick_winning_card = None # running winner of current_trick, updated as each card is played
+        self.trick_winner_id = None
+        self._trick_resolved = 0 # number of cards of current_trick folded into the running winner
+        self.last_trick = []
+        self.last_trick_winner_id = None
         self.current_leader_id = None
         self.current_player_id = None
-        self.minimum_hand_value = 5 # consider making this an arg in the future
+        self.card_owner = None # card_id -> player id of the original holder, built at deal time
+        self.minimum_hand_value = minimum_hand_value # fewest points a dealt hand may hold
+        self.deal_stats = None # {'attempts': shuffles, 'seconds': time, 'pool_draws' when dealt from a pool}
+        self._undo = [] # one record per transition, popped by undo()
+        self.version = 0 # bumped by every change to the game (undo included), so it never repeats
+        self.rehash()
 
         pass
 
+    def __getstate__(self):
+        # the undo history belongs to the object that made the moves; copies and pickles start without it
+        state = self.__dict__.copy()
+        state['_undo'] = []
+        return state
+
+    def reseed(self, seed):
+        '''
+        Restart the game's random stream (and a fresh deck's) from seed, e.g. to replay a recorded game
+        '''
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.deck = d.Deck(seed=self.rng.getrandbits(64), pool=self.shuffle_pool)
+
     def bidding_complete(self):
         '''
         Check to see if bidding is complete
@@ -82,6 +175,16 @@ class Game:
         # if four players have passed bidding is complete
         return pass_count >= 4
 
+    def team_points(self):
+        '''
+        Points taken so far by the calling team (bid winner and partner) and by the other players
+        :return: (calling team points, defending team points)
+        '''
+        team = {self.bid_winner, self.partner}
+        calling = sum(player.points for player in self.players if player in team)
+        defending = sum(player.points for player in self.players if player not in team)
+        return calling, defending
+
 # Game Modifiers
     def start_game(self):
         """
@@ -89,6 +192,7 @@ class Game:
         :return: game state
         """
         self.state = 'ready'
+        self.version += 1
         return self.state
 
     def deal_cards(self):
@@ -100,19 +204,20 @@ class Game:
         if self.state != 'ready':
             raise GameStateError('ready', self.state)
 
-        hands_correct = False
-
-        while not hands_correct:
-
-            hands = self.deck.deal_hands()
+        started = time.perf_counter()
+        hands, attempts = self.deck.deal_valid_hands(self.minimum_hand_value)
+        self.deal_stats = {'attempts': attempts, 'seconds': time.perf_counter() - started}
+        if self.deck.pool is not None:
+            self.deal_stats['pool_draws'] = list(self.deck.pool_draws)
 
-            for hand, player in list(zip(hands, self.players)):
-                player.hand = hand
-                player.original_hand = copy.deepcopy(hand)
-
-            hands_correct = all([sum([card.value for card in player.hand]) >= self.minimum_hand_value for player in self.players])
+        for hand, player in zip(hands, self.players):
+            player.hand = hand
+            player.original_hand = list(hand)
 
+        self._build_card_owner_index()
         self.state = 'bid'
+        self._undo = []
+        self.rehash()
 
         return self.state, hands
 
@@ -131,7 +236,9 @@ class Game:
             raise GameStateError('bid', self.state)
 
         player = self.players[player_id]
+        undo = ('bid', _undo_fields(self), player_id, player.bid)
         player.bid = amount
+        self._zobrist_bids ^= _Z_PLAYER_BID[player_id][undo[3] + 1] ^ _Z_PLAYER_BID[player_id][amount + 1]
 
         if amount > self.bid:
             self.bid = amount
@@ -142,7 +249,11 @@ class Game:
             self.current_player_id = self.bid_winner.id
             self.state = "call-partner-rank"
 
-        return self.state, self.bid_winner.id, self.bid
+        self._undo.append(undo)
+        self.zobrist = self._zobrist_cards ^ self._scalar_hash()
+        self.version += 1
+
+        return self.state, self.bid_winner.id if self.bid_winner else None, self.bid
 
     def call_partner_rank(self, rank):
         if rank not in d.ranks:
@@ -151,9 +262,11 @@ class Game:
         if self.state != 'call-partner-rank':
             raise GameStateError('call-partner-rank', self.state)
 
-
+        self._undo.append(('rank', _undo_fields(self)))
         self.partner_rank = rank
         self.state = 'play-first-trick'
+        self.zobrist = self._zobrist_cards ^ self._scalar_hash()
+        self.version += 1
 
         return self.state, self.partner_rank
 
@@ -164,55 +277,67 @@ class Game:
         if self.state != 'call-partner-suit':
             raise GameStateError('call-partner-suit', self.state)
 
-        # record partner suit
-        self.partner_suit = suit
+        undo_fields = _undo_fields(self)
 
         # record partner card
-        partner_card = d.Card(self.partner_suit, self.partner_rank)
+        partner_card = d.Card(suit, self.partner_rank)
 
-        # search for partner
-        for player in self.players:
-            for card in player.original_hand:
-                if card == partner_card:
-                    self.partner = player
-                    break
-            if self.partner is not None:
-                break
-        if self.partner is None:
+        # look up partner
+        if self.card_owner is None:
+            self._build_card_owner_index()
+        owner_id = self.card_owner[partner_card.card_id]
+        if owner_id is None:
             raise ValueError('partner card not found')
 
-        print('partner is player ' + str(self.partner.id))
+        # record partner suit
+        self.partner_suit = suit
+        self.partner = self.players[owner_id]
 
         winning_card, winning_player_idx = trick_winner(self.current_trick, self.partner_suit)
+        undo = ('suit', undo_fields, winning_player_idx, self.players[winning_player_idx].points)
         self.end_trick(winning_card, winning_player_idx)
 
         self.state = 'trick-won'
+        self._undo.append(undo)
+        self.zobrist = self._zobrist_cards ^ self._scalar_hash()
+        self.version += 1
 
         return self.state, self.partner_suit, self.partner.id
 
     def end_trick(self, winning_card, winning_player_idx):
-        print('winner is ' + str(winning_card) + ' played by ' + str(winning_player_idx))
-
         # give winning player trick and update their points
         winning_player = self.players[winning_player_idx]
         winning_player.tricks_won.append(self.current_trick)
         winning_player.points += sum([card.value for card, player_id in self.current_trick])
+        for card, player_id in self.current_trick:
+            self._zobrist_cards ^= _Z_TRICK[player_id][card.card_id] ^ _Z_WON[winning_player_idx][card.card_id]
 
         # reset state for next trick
-        # print(self.current_trick)
+        self.last_trick = self.current_trick
+        self.last_trick_winner_id = winning_player_idx
         self.current_trick = []
+        self.trick_winning_card = None
+        self.trick_winner_id = None
+        self._trick_resolved = 0
         self.current_leader_id = winning_player_idx
         self.current_player_id = winning_player_idx
+        self.zobrist = self._zobrist_cards ^ self._scalar_hash()
 
     def play_card(self, player_id, card):
+        player = self.players[player_id]
+        if not player.has_card(card):
+            raise ValueError(str(card) + ' not in hand of player ' + str(player_id))
+        undo_fields = _undo_fields(self)
+        index = player.hand.index(card)
 
         # take card out of hand and put card in trick
-        self.players[player_id].hand.remove(card)
+        player.remove_card(card)
         self.current_trick.append((card, player_id))
+        self._zobrist_cards ^= _Z_HAND[player_id][card.card_id] ^ _Z_TRICK[player_id][card.card_id]
 
         # identify the current winning card and player
-        winning_card, winning_player_idx = trick_winner(self.current_trick, self.partner_suit)
-        winning_player = self.players[winning_player_idx]
+        winning_card, winning_player_idx = self._resolve_trick()
+        trick_won = None
 
         # the trick is complete
         if len(self.current_trick) == 5:
@@ -223,20 +348,189 @@ class Game:
 
             # it's not the first hand, handle normally
             else:
+                trick_won = (winning_player_idx, self.players[winning_player_idx].points)
+                self.end_trick(winning_card, winning_player_idx)
                 self.state = 'trick-won'
 
         # otherwise, keep playing
         else:
             self._inc_current_player()
-            self.state = 'play-tricks'
+            if self.state != 'play-first-trick':
+                self.state = 'play-tricks'
+
+        self._undo.append(('play', undo_fields, player_id, card, index, trick_won))
+        self.zobrist = self._zobrist_cards ^ self._scalar_hash()
+        self.version += 1
 
         return self.state, winning_card, winning_player_idx
 
+    def undo(self):
+        '''
+        Reverse the most recent player_bid, call_partner_rank, call_partner_suit or play_card, restoring the game
+        (including its zobrist hash) exactly. Lets a search walk the game tree without copying the game.
+        :return: kind of transition undone: 'bid', 'rank', 'suit' or 'play'
+        '''
+        if not self._undo:
+            raise GameError('nothing to undo')
+        record = self._undo.pop()
+        kind, fields = record[0], record[1]
+        self.__dict__.update(zip(_UNDO_FIELDS, fields))
+
+        if kind == 'bid':
+            self.players[record[2]].bid = record[3]
+        elif kind == 'suit':
+            winner = self.players[record[2]]
+            winner.tricks_won.pop()
+            winner.points = record[3]
+        elif kind == 'play':
+            _, _, player_id, card, index, trick_won = record
+            # the restored current_trick is the list the card was appended to
+            self.current_trick.pop()
+            self.players[player_id].restore_card(card, index)
+            if trick_won is not None:
+                winner = self.players[trick_won[0]]
+                winner.tricks_won.pop()
+                winner.points = trick_won[1]
+        self.version += 1
+        return kind
+
+    def checkpoint(self):
+        '''
+        Complete state of the game as plain data, cards as card ids: everything restore_checkpoint needs to resume
+        the game exactly (hands in display order, the current trick, every trick won)
+        :return: JSON-serialisable dict
+        '''
+        def ids(cards):
+            return [card.card_id for card in cards]
+
+        def trick_ids(trick):
+            return [[card.card_id, player_id] for card, player_id in trick]
+
+        return {
+            'state': self.state,
+            'bid': self.bid,
+            'bid_winner': self.bid_winner.id if self.bid_winner else None,
+            'partner': self.partner.id if self.partner else None,
+            'partner_rank': self.partner_rank,
+            'partner_suit': self.partner_suit,
+            'current_trick': trick_ids(self.current_trick),
+            'last_trick': trick_ids(self.last_trick),
+            'last_trick_winner_id': self.last_trick_winner_id,
+            'current_leader_id': self.current_leader_id,
+            'current_player_id': self.current_player_id,
+            'seed': self.seed,
+            'players': [
+                {'original_hand': ids(player.original_hand), 'hand': ids(player.hand), 'bid': player.bid,
+                 'tricks_won': [trick_ids(trick) for trick in player.tricks_won], 'points': player.points}
+                for player in self.players
+            ],
+        }
+
+    def restore_checkpoint(self, data):
+        '''
+        Resume the game from a checkpoint() (the undo history starts empty; the random stream restarts from the
+        checkpoint's seed unless the game already has that seed)
+        :param data: dict returned by checkpoint
+        :return: game state
+        '''
+        def cards(ids):
+            return [d.card_from_id(card_id) for card_id in ids]
+
+        def trick(entries):
+            return [(d.card_from_id(card_id), player_id) for card_id, player_id in entries]
+
+        if data['seed'] != self.seed:
+            self.reseed(data['seed'])
+        for player, saved in zip(self.players, data['players']):
+            player.original_hand = cards(saved['original_hand'])
+            player.hand = cards(saved['hand'])
+            player.bid = saved['bid']
+            player.tricks_won = [trick(entries) for entries in saved['tricks_won']]
+            player.points = saved['points']
+        self.state = data['state']
+        self.bid = data['bid']
+        self.bid_winner = None if data['bid_winner'] is None else self.players[data['bid_winner']]
+        self.partner = None if data['partner'] is None else self.players[data['partner']]
+        self.partner_rank = data['partner_rank']
+        self.partner_suit = data['partner_suit']
+        self.current_trick = trick(data['current_trick'])
+        self.last_trick = trick(data['last_trick'])
+        self.last_trick_winner_id = data['last_trick_winner_id']
+        self.current_leader_id = data['current_leader_id']
+        self.current_player_id = data['current_player_id']
+        self.trick_winning_card = None
+        self.trick_winner_id = None
+        self._trick_resolved = 0
+        self._resolve_trick()
+        self.card_owner = None
+        if any(player.original_hand for player in self.players):
+            self._build_card_owner_index()
+        self._undo = []
+        self.rehash()
+        return self.state
+
+    def rehash(self):
+        '''
+        Recompute the zobrist hash from scratch; needed after fields are assigned directly rather than through the
+        game transitions (e.g. when restoring or determinizing a game); counts as a change of version
+        :return: 64-bit hash
+        '''
+        self.version += 1
+        cards = 0
+        for player in self.players:
+            for card in player.hand:
+                cards ^= _Z_HAND[player.id][card.card_id]
+            for trick in player.tricks_won:
+                for card, player_id in trick:
+                    cards ^= _Z_WON[player.id][card.card_id]
+        for card, player_id in self.current_trick:
+            cards ^= _Z_TRICK[player_id][card.card_id]
+        self._zobrist_cards = cards
+        self._zobrist_bids = 0
+        for player in self.players:
+            self._zobrist_bids ^= _Z_PLAYER_BID[player.id][player.bid + 1]
+        self.zobrist = cards ^ self._scalar_hash()
+        return self.zobrist
+
+    def _scalar_hash(self):
+        h = _Z_STATE.get(self.state, 0) ^ _Z_GAME_BID[self.bid] ^ self._zobrist_bids
+        if self.current_player_id is not None:
+            h ^= _Z_CURRENT[self.current_player_id]
+        if self.current_leader_id is not None:
+            h ^= _Z_LEADER[self.current_leader_id]
+        if self.bid_winner is not None:
+            h ^= _Z_BID_WINNER[self.bid_winner.id]
+        if self.partner is not None:
+            h ^= _Z_PARTNER[self.partner.id]
+        if self.partner_rank is not None:
+            h ^= _Z_RANK[self.partner_rank]
+        if self.partner_suit is not None:
+            h ^= _Z_SUIT[d.suits.index(self.partner_suit)]
+        return h
+
+    def _resolve_trick(self):
+        '''
+        Fold cards played since the last call into the running trick winner, one table lookup per card
+        :return: winning card and player id of the current trick
+        '''
+        n = len(d.cards)
+        offset = trump_index(self.partner_suit) * n
+        for card, player_id in self.current_trick[self._trick_resolved:]:
+            if self.trick_winning_card is None or _beats[(offset + self.trick_winning_card.card_id) * n + card.card_id]:
+                self.trick_winning_card = card
+                self.trick_winner_id = player_id
+        self._trick_resolved = len(self.current_trick)
+        return self.trick_winning_card, self.trick_winner_id
+
+    def _build_card_owner_index(self):
+        self.card_owner = [None] * len(d.cards)
+        for player in self.players:
+            for card in player.original_hand:
+                self.card_owner[card.card_id] = player.id
 
     def _next_player_play_random_card(self):
-        card_idx = random.randint(0,4)
+        card_idx = self.rng.randrange(len(self.players[self.current_player_id].hand))
         player = self.players[self.current_player_id]
-        print(str(player.id) + ' played ' + str(player.hand[card_idx]))
         self.play_card(self.current_player_id, player.hand[card_idx])
 
     def _inc_current_player(self):
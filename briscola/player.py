@@ -1,4 +1,5 @@
 
+
 class Player:
     def __init__(self, id):
         self.id = id
@@ -7,3 +8,39 @@ class Player:
         self.bid = 0
         self.tricks_won = []
         self.points = 0
+
+    @property
+    def hand(self):
+        '''
+        Ordered list of cards in hand (display order). hand_mask is kept in sync with it: bit card_id is set for
+        every card held.
+        '''
+        return self._hand
+
+    @hand.setter
+    def hand(self, cards):
+        self._hand = list(cards)
+        mask = 0
+        for card in self._hand:
+            mask |= 1 << card.card_id
+        self.hand_mask = mask
+
+    def has_card(self, card):
+        return (self.hand_mask >> card.card_id) & 1 == 1
+
+    def remove_card(self, card):
+        '''
+        Take a card out of the hand, keeping the order of the remaining cards
+        :param card: Card object held by this player
+        '''
+        if not self.has_card(card):
+            raise ValueError(str(card) + ' not in hand of player ' + str(self.id))
+        self.hand_mask &= ~(1 << card.card_id)
+        self._hand.remove(card)
+
+    def restore_card(self, card, index):
+        '''
+        Put a card back at its old position in the hand (undoing remove_card)
+        '''
+        self._hand.insert(index, card)
+        self.hand_mask |= 1 << card.card_id
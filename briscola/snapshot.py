@@ -0,0 +1,122 @@
+'''
+Compact, versioned binary encoding of a complete Game: everything Game.checkpoint holds, in a few hundred bytes.
+
+Cards are single card-id bytes (see briscola.deck), so a hand is a length byte followed by its card ids in display
+order, and a trick is a length byte followed by (card id, player id) byte pairs. Layout of version 1:
+
+    header   version, seed (64-bit), state, bid, bid winner, partner, partner rank, partner suit,
+             last trick winner, current leader, current player
+    players  five times: bid (signed), points, original hand, hand, number of tricks won and each trick
+    tricks   current trick, last trick
+
+Missing players, ranks and suits are NONE. decode reads any version it knows and raises ValueError otherwise.
+'''
+import struct
+
+import briscola.deck as d
+from briscola.game import GAME_STATES, Game
+
+VERSION = 1
+NONE = 255
+
+_HEADER = struct.Struct('<BQ9B')
+_PLAYER = struct.Struct('<bB')
+
+
+def _byte(value):
+    return NONE if value is None else value
+
+
+def _value(byte):
+    return None if byte == NONE else byte
+
+
+def _cards(out, cards):
+    out.append(len(cards))
+    out.extend(card.card_id for card in cards)
+
+
+def _trick(out, trick):
+    out.append(len(trick))
+    for card, player_id in trick:
+        out.append(card.card_id)
+        out.append(player_id)
+
+
+def encode(game):
+    '''
+    :param game: Game to encode
+    :return: bytes that decode turns back into the same game
+    '''
+    out = bytearray(_HEADER.pack(
+        VERSION, game.seed, GAME_STATES.index(game.state), game.bid,
+        _byte(game.bid_winner.id if game.bid_winner else None), _byte(game.partner.id if game.partner else None),
+        _byte(game.partner_rank), _byte(None if game.partner_suit is None else d.suits.index(game.partner_suit)),
+        _byte(game.last_trick_winner_id), _byte(game.current_leader_id), _byte(game.current_player_id)))
+    for player in game.players:
+        out += _PLAYER.pack(player.bid, player.points)
+        _cards(out, player.original_hand)
+        _cards(out, player.hand)
+        out.append(len(player.tricks_won))
+        for trick in player.tricks_won:
+            _trick(out, trick)
+    _trick(out, game.current_trick)
+    _trick(out, game.last_trick)
+    return bytes(out)
+
+
+def decode(data, game=None):
+    '''
+    :param data: bytes from encode
+    :param game: Game to restore into (e.g. one sharing a shuffle pool); a new one if not given
+    :return: the restored game
+    '''
+    if not data or data[0] != VERSION:
+        raise ValueError('unknown snapshot version {}'.format(data[0] if data else None))
+    (_, seed, state, bid, bid_winner, partner, partner_rank, partner_suit, last_trick_winner_id, current_leader_id,
+     current_player_id) = _HEADER.unpack_from(data)
+    pos = _HEADER.size
+
+    def ids():
+        nonlocal pos
+        n = data[pos]
+        pos += n + 1
+        return list(data[pos - n:pos])
+
+    def trick():
+        nonlocal pos
+        n = data[pos]
+        pos += 2 * n + 1
+        return [list(data[i:i + 2]) for i in range(pos - 2 * n, pos, 2)]
+
+    players = []
+    for _ in range(5):
+        player_bid, points = _PLAYER.unpack_from(data, pos)
+        pos += _PLAYER.size
+        original_hand = ids()
+        hand = ids()
+        won = data[pos]
+        pos += 1
+        tricks_won = [trick() for _ in range(won)]
+        players.append({'original_hand': original_hand, 'hand': hand, 'bid': player_bid,
+                        'tricks_won': tricks_won, 'points': points})
+    current_trick = trick()
+    last_trick = trick()
+
+    game = game or Game(seed=seed)
+    game.restore_checkpoint({
+        'state': GAME_STATES[state],
+        'bid': bid,
+        'bid_winner': _value(bid_winner),
+        'partner': _value(partner),
+        'partner_rank': _value(partner_rank),
+        'partner_suit': None if partner_suit == NONE else d.suits[partner_suit],
+        'current_trick': current_trick,
+        'last_trick': last_trick,
+        'last_trick_winner_id': _value(last_trick_winner_id),
+        'current_leader_id': _value(current_leader_id),
+        'current_player_id': _value(current_player_id),
+        'seed': seed,
+        'players': players,
+    })
+    return game
@@ -0,0 +1,158 @@
+'''
+Precomputed card statistics, generated offline from the trick rules and shared between processes as read-only
+memory-mapped .npy files.
+
+Tables (trump is a suit index, or game.NO_TRUMP while the first trick's trump is not yet called):
+
+    hold[trump, card, remaining]: probability that card, once it is winning a trick, is not beaten by any of
+        remaining (0-4) further cards drawn at random from the other 39
+    win[trump, position, card]: probability that card played at position (0-4) of a trick of random cards wins it
+    take[trump, position, card]: expected points card takes from such a trick (its points if it wins, else 0)
+
+hold is exact; win and take are Monte Carlo estimates over random tricks. The table bot (briscola.bot.Bot) scores
+card plays with hold, bids on its hand's take and calls the suit its hand has the most wins with; the service's
+ISMCTS bots bid on take while the bidding advisor's evaluation of their hand is pending (or the advisor is off).
+Files are named <table>.v<VERSION>.npy so a rules or layout change bumps VERSION and old files are never read by
+mistake.
+
+    python -m briscola.tables [directory] [tricks]
+'''
+import os
+import sys
+from math import comb
+
+import numpy as np
+
+import briscola.deck as d
+import briscola.game as g
+
+VERSION = 1
+TRUMPS = g.NO_TRUMP + 1
+SEATS = 5
+DEFAULT_DIRECTORY = os.environ.get('BRISCOLA_TABLES_DIR', os.path.join(os.path.dirname(__file__), 'data'))
+SHAPES = {
+    'hold': (TRUMPS, len(d.cards), SEATS),
+    'win': (TRUMPS, SEATS, len(d.cards)),
+    'take': (TRUMPS, SEATS, len(d.cards)),
+}
+
+_N = len(d.cards)
+# BEATS[trump, winning card, card]: card takes the trick from winning card
+_BEATS = np.frombuffer(bytes(g._beats), dtype=np.uint8).reshape(TRUMPS, _N, _N).astype(bool)
+_VALUES = np.array(d.card_values, dtype=np.int64)
+
+_loaded = {}
+
+
+def path(name, directory=None):
+    return os.path.join(directory or DEFAULT_DIRECTORY, '{}.v{}.npy'.format(name, VERSION))
+
+
+def build_hold():
+    # cards that would take the trick from each card, per trump
+    beaten_by = _BEATS.sum(axis=2)
+    hold = np.empty(SHAPES['hold'], dtype=np.float32)
+    for remaining in range(SEATS):
+        total = comb(_N - 1, remaining)
+        counts = np.array([comb(n, remaining) for n in range(_N)], dtype=np.float64)
+        hold[:, :, remaining] = counts[_N - 1 - beaten_by] / total
+    return hold
+
+
+def build_win(tricks=1000000, seed=0, chunk=100000):
+    '''
+    :param tricks: random tricks to sample (each trick counts once per trump and position)
+    :return: (win, take) tables
+    '''
+    rng = np.random.default_rng(seed)
+    plays = np.zeros((TRUMPS, SEATS, _N), dtype=np.int64)
+    wins = np.zeros((TRUMPS, SEATS, _N), dtype=np.int64)
+    points = np.zeros((TRUMPS, SEATS, _N), dtype=np.int64)
+    done = 0
+    while done < tricks:
+        n = min(chunk, tricks - done)
+        trick = np.argpartition(rng.random((n, _N)), SEATS, axis=1)[:, :SEATS]
+        trick_points = _VALUES[trick].sum(axis=1)
+        rows = np.arange(n)
+        for trump in range(TRUMPS):
+            winning, position = trick[:, 0], np.zeros(n, dtype=np.int64)
+            for pos in range(1, SEATS):
+                takes = _BEATS[trump, winning, trick[:, pos]]
+                winning = np.where(takes, trick[:, pos], winning)
+                position = np.where(takes, pos, position)
+            for pos in range(SEATS):
+                cards = trick[:, pos]
+                won = position == pos
+                plays[trump, pos] += np.bincount(cards, minlength=_N)
+                wins[trump, pos] += np.bincount(cards[won], minlength=_N)
+                taken = np.bincount(cards[won], weights=trick_points[rows[won]], minlength=_N)
+                points[trump, pos] += taken.astype(np.int64)
+        done += n
+    played = np.maximum(plays, 1)
+    return (wins / played).astype(np.float32), (points / played).astype(np.float32)
+
+
+def generate(directory=None, tricks=1000000, seed=0):
+    '''
+    Build every table and save it under directory
+    :return: {table name: file path}
+    '''
+    directory = directory or DEFAULT_DIRECTORY
+    os.makedirs(directory, exist_ok=True)
+    win, take = build_win(tricks, seed)
+    paths = {}
+    for name, table in (('hold', build_hold()), ('win', win), ('take', take)):
+        paths[name] = path(name, directory)
+        # write then rename, so a process mapping the file never sees it half written
+        partial = paths[name] + '.partial'
+        with open(partial, 'wb') as f:
+            np.save(f, table)
+        os.replace(partial, paths[name])
+    return paths
+
+
+def load(name, directory=None):
+    '''
+    Memory-map a table read-only; every process mapping the same file shares its pages. Mapped once per process.
+    :param name: one of SHAPES
+    :return: read-only numpy array
+    '''
+    key = (name, directory or DEFAULT_DIRECTORY)
+    table = _loaded.get(key)
+    if table is None:
+        file_path = path(name, directory)
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(file_path + ' missing; generate the tables with python -m briscola.tables')
+        table = np.load(file_path, mmap_mode='r')
+        if table.shape != SHAPES[name]:
+            raise ValueError('{} has shape {}, expected {}'.format(file_path, table.shape, SHAPES[name]))
+        _loaded[key] = table
+    return table
+
+
+class WinTables:
+    '''
+    Lookups into the memory-mapped tables
+    :param directory: where the .npy files are, DEFAULT_DIRECTORY if not given
+    '''
+
+    def __init__(self, directory=None):
+        self.hold = load('hold', directory)
+        self.win = load('win', directory)
+        self.take = load('take', directory)
+
+    def hold_probability(self, trump, card_id, remaining):
+        return float(self.hold[trump, card_id, remaining])
+
+    def win_probability(self, trump, position, card_id):
+        return float(self.win[trump, position, card_id])
+
+    def expected_take(self, trump, position, card_id):
+        return float(self.take[trump, position, card_id])
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    written = generate(args[0] if args else None, int(args[1]) if len(args) > 1 else 1000000)
+    for name, file_path in written.items():
+        print(name, file_path)
@@ -0,0 +1,302 @@
+'''
+Bot tournaments: many full games through Game between bot strategies, spread over a process pool.
+
+With k strategies each deal is played 5k times: the lineup (seat j plays strategy j % k) is rotated one seat
+further for each of five games, and the strategies are shifted one place along the lineup for each of k such blocks,
+so over a deal every strategy plays every seat, and so every hand, exactly five times. Game number i plays deal
+i // 5k in rotation i % 5 and shift i // 5 % k, and the deal and every bot are seeded from the tournament seed and
+the game number, so a game replays exactly however the tournament is split across workers. A tournament whose game
+count is not a multiple of 5k leaves its last deal unbalanced.
+
+Results are streamed to a JSON lines file as chunks of games finish; the file is the checkpoint, and a resumed
+tournament only plays the games missing from it.
+
+    python -m briscola.tournament random,tables --games 10000 --workers 8 --out results.jsonl [--resume]
+'''
+import argparse
+import json
+import math
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import get_context
+
+from briscola import bot
+from briscola.game import Game
+
+SEATS = 5
+MAX_AUCTION_ROUNDS = 100
+Z = 1.96  # 95% confidence intervals
+
+
+def make_bot(name, seed, options):
+    '''
+    :param name: strategy name: random, tables (heuristic bids, calls and play from briscola.tables) or ismcts
+    :param options: {'iterations': ISMCTS iterations per decision, 'tables_dir': table directory}
+    '''
+    if name == 'random':
+        return bot.Bot(seed)
+    if name == 'tables':
+        from briscola.tables import WinTables
+        return bot.Bot(seed, tables=WinTables(options.get('tables_dir')))
+    if name == 'ismcts':
+        return bot.ISMCTSBot(workers=1, iterations=options.get('iterations', 100), seed=seed)
+    raise ValueError('unknown strategy ' + str(name))
+
+
+def games_per_deal(strategies):
+    return SEATS * len(strategies)
+
+
+def lineup(strategies, game_number):
+    '''
+    :return: strategy name per seat for a game: seat j plays strategies[j % k], rotated by the game's rotation and
+    shifted by its shift
+    '''
+    rotation = game_number % SEATS
+    shift = game_number // SEATS % len(strategies)
+    return [strategies[((seat + rotation) % SEATS + shift) % len(strategies)] for seat in range(SEATS)]
+
+
+def deal_seed(seed, deal):
+    return seed << 32 | deal
+
+
+def play_game(game_number, strategies, seed=0, options=None, minimum_hand_value=5):
+    '''
+    Play one tournament game to the end
+    :return: result record (a JSON-serialisable dict)
+    '''
+    options = options or {}
+    started = time.perf_counter()
+    names = lineup(strategies, game_number)
+    bots = [make_bot(name, '{}:{}:{}'.format(seed, game_number, seat), options) for seat, name in enumerate(names)]
+
+    game = Game(minimum_hand_value=minimum_hand_value, seed=deal_seed(seed, game_number // games_per_deal(strategies)))
+    game.start_game()
+    game.deal_cards()
+
+    for _ in range(MAX_AUCTION_ROUNDS):
+        if game.state != 'bid':
+            break
+        for seat in range(SEATS):
+            player = game.players[seat]
+            if game.state != 'bid' or player.bid == -1 or player is game.bid_winner:
+                continue
+            amount = bots[seat].choose_bid(game, seat)
+            # a bid that does not raise the current one counts as a pass
+            game.player_bid(seat, amount if amount > game.bid else -1)
+    else:
+        raise RuntimeError('auction of game ' + str(game_number) + ' did not finish')
+
+    caller = game.bid_winner.id
+    game.call_partner_rank(bots[caller].choose_rank(game, caller))
+    while True:
+        seat = bot.seat_to_act(game)
+        if seat is None:
+            break
+        if game.state == 'call-partner-suit':
+            game.call_partner_suit(bots[seat].choose_suit(game, seat))
+        else:
+            game.play_card(seat, bots[seat].choose_card(game, seat))
+
+    calling, defending = game.team_points()
+    return {
+        'game': game_number,
+        'seats': names,
+        'caller': caller,
+        'partner': game.partner.id,
+        'bid': game.bid,
+        'calling_points': calling,
+        'defending_points': defending,
+        'made': calling >= game.bid,
+        'seconds': time.perf_counter() - started,
+    }
+
+
+def play_games(game_numbers, strategies, seed=0, options=None, minimum_hand_value=5):
+    return [play_game(n, strategies, seed, options, minimum_hand_value) for n in game_numbers]
+
+
+def completed_games(path):
+    '''
+    :return: records already in a results file; a line cut short by a crash is dropped
+    '''
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            records[record['game']] = record
+    return records
+
+
+def run(strategies, games, out, workers=None, seed=0, options=None, chunk=SEATS * 4, resume=False,
+        minimum_hand_value=5, progress=None):
+    '''
+    Play games 0..games-1, appending each finished chunk's records to out
+    :param workers: pool size; 0 plays in this process
+    :param resume: keep the records already in out and only play the missing games
+    :param progress: called with (games done, games total) after each chunk
+    :return: (every record, stats) where stats has wall seconds, game seconds summed over workers, and workers
+    '''
+    records = completed_games(out) if resume else {}
+    if resume:
+        # rewrite the checkpoint without any line a crash cut short, so appends start on a fresh line
+        with open(out + '.partial', 'w') as f:
+            for n in sorted(records):
+                f.write(json.dumps(records[n]) + '\n')
+        os.replace(out + '.partial', out)
+    elif os.path.exists(out):
+        os.remove(out)
+    todo = [n for n in range(games) if n not in records]
+    chunks = [todo[i:i + chunk] for i in range(0, len(todo), chunk)]
+    workers = os.cpu_count() if workers is None else workers
+    played = []
+    started = time.perf_counter()
+
+    with open(out, 'a') as f:
+        def record(results):
+            for result in results:
+                f.write(json.dumps(result) + '\n')
+                records[result['game']] = result
+            f.flush()
+            played.extend(results)
+            if progress:
+                progress(len(records), games)
+
+        if workers == 0:
+            for numbers in chunks:
+                record(play_games(numbers, strategies, seed, options, minimum_hand_value))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn')) as pool:
+                pending = set()
+                queued = iter(chunks)
+                while True:
+                    # keep a few chunks per worker in flight rather than queueing the whole tournament
+                    for numbers in queued:
+                        pending.add(pool.submit(play_games, numbers, strategies, seed, options, minimum_hand_value))
+                        if len(pending) >= workers * 4:
+                            break
+                    if not pending:
+                        break
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        record(future.result())
+
+    stats = {
+        'wall_seconds': time.perf_counter() - started,
+        'game_seconds': sum(r['seconds'] for r in played),
+        'games_played': len(played),
+        'workers': max(workers, 1),
+    }
+    return [records[n] for n in sorted(records)], stats
+
+
+def wilson(successes, n):
+    '''
+    :return: (rate, low, high) with a Wilson score interval
+    '''
+    if n == 0:
+        return 0.0, 0.0, 0.0
+    rate = successes / n
+    centre = (rate + Z * Z / (2 * n)) / (1 + Z * Z / n)
+    spread = Z * math.sqrt(rate * (1 - rate) / n + Z * Z / (4 * n * n)) / (1 + Z * Z / n)
+    return rate, centre - spread, centre + spread
+
+
+def mean_interval(values):
+    '''
+    :return: (mean, low, high) with a normal approximation interval
+    '''
+    n = len(values)
+    if n == 0:
+        return 0.0, 0.0, 0.0
+    mean = sum(values) / n
+    if n == 1:
+        return mean, mean, mean
+    sd = math.sqrt(sum((v - mean) ** 2 for v in values) / (n - 1))
+    return mean, mean - Z * sd / math.sqrt(n), mean + Z * sd / math.sqrt(n)
+
+
+def summarize(records):
+    '''
+    Per strategy, over every seat it played: team win rate, the team's average points, and how often its bids
+    were made when it was the caller
+    :return: {strategy: {'seats', 'win_rate', 'points', 'bids', 'bid_success'}} with (value, low, high) tuples
+    '''
+    seats, wins, points, bids, made = {}, {}, {}, {}, {}
+    for r in records:
+        calling_team = {r['caller'], r['partner']}
+        for seat, name in enumerate(r['seats']):
+            calling = seat in calling_team
+            seats[name] = seats.get(name, 0) + 1
+            wins[name] = wins.get(name, 0) + (r['made'] == calling)
+            points.setdefault(name, []).append(r['calling_points'] if calling else r['defending_points'])
+        name = r['seats'][r['caller']]
+        bids[name] = bids.get(name, 0) + 1
+        made[name] = made.get(name, 0) + r['made']
+
+    return {
+        name: {
+            'seats': seats[name],
+            'win_rate': wilson(wins[name], seats[name]),
+            'points': mean_interval(points[name]),
+            'bids': bids.get(name, 0),
+            'bid_success': wilson(made.get(name, 0), bids.get(name, 0)),
+        }
+        for name in sorted(seats)
+    }
+
+
+def report(summary, stats):
+    lines = ['{:<10} {:>8} {:>22} {:>22} {:>7} {:>22}'.format(
+        'strategy', 'seats', 'win rate', 'team points', 'bids', 'bid success')]
+    for name, s in summary.items():
+        lines.append('{:<10} {:>8} {:>22} {:>22} {:>7} {:>22}'.format(
+            name, s['seats'], '{:.3f} [{:.3f}, {:.3f}]'.format(*s['win_rate']),
+            '{:.2f} [{:.2f}, {:.2f}]'.format(*s['points']), s['bids'],
+            '{:.3f} [{:.3f}, {:.3f}]'.format(*s['bid_success'])))
+    if stats['games_played']:
+        lines.append('{} games in {:.1f}s on {} worker(s): {:.1f} games/s, {:.1f} games/s per core'.format(
+            stats['games_played'], stats['wall_seconds'], stats['workers'],
+            stats['games_played'] / stats['wall_seconds'], stats['games_played'] / stats['game_seconds']))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Play a bot tournament')
+    parser.add_argument('strategies', help='comma separated strategy names: random, tables, ismcts')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=None, help='pool size (default: every core, 0: no pool)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='tournament.jsonl', help='results file, also the resume checkpoint')
+    parser.add_argument('--resume', action='store_true')
+    parser.add_argument('--chunk', type=int, default=SEATS * 4, help='games per task sent to a worker')
+    parser.add_argument('--iterations', type=int, default=100, help='ISMCTS iterations per decision')
+    parser.add_argument('--tables-dir', default=None)
+    parser.add_argument('--minimum-hand-value', type=int, default=5)
+    args = parser.parse_args(argv)
+    strategies = args.strategies.split(',')
+    if args.games % games_per_deal(strategies):
+        print('warning: {} games is not a multiple of {}, so the last deal does not give every strategy every '
+              'seat equally often'.format(args.games, games_per_deal(strategies)))
+
+    step = max(args.games // 20, 1)
+
+    def progress(done, total):
+        if done % step < args.chunk or done == total:
+            print('{}/{} games'.format(done, total), flush=True)
+
+    records, stats = run(strategies, args.games, args.out, args.workers, args.seed,
+                         {'iterations': args.iterations, 'tables_dir': args.tables_dir}, args.chunk, args.resume,
+                         args.minimum_hand_value, progress)
+    print(report(summarize(records), stats))
+
+
+if __name__ == '__main__':
+    main()
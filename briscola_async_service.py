@@ -0,0 +1,322 @@
+"""Asyncio service mode: one event loop serves every game on the node.
+
+A single pattern subscription on game.*.actions feeds an in-memory queue per game, and each game is a task that
+drains its queue into a GameServer. GameServers keep their synchronous code: their Redis writes go into a
+WriteBuffer that the loop sends through redis.asyncio after every action, in order, in one pipeline round trip.
+Bot decisions are made on the shared bot thread, so a bot's search does not stall the loop; each comes back to its
+game's queue as a BotMove.
+
+Selected with SERVICE_MODE=asyncio; the threaded BriscolaService stays the default.
+"""
+import asyncio
+import signal
+import time
+from typing import Callable, Dict, Optional, Set
+
+import redis.asyncio as aioredis
+
+import briscola_service as service
+from briscola_codec import ENCODING_ERRORS, decode as decode_message
+from briscola_leases import AsyncLeaseManager
+from briscola_persistence import FLUSH_STATE, PERSIST_MODE, WriteBehind
+from briscola_service import (
+    BOT_SEATS,
+    GAME_LEASE_TTL_MS,
+    GAME_LEASES,
+    HEARTBEAT_INTERVAL,
+    HEARTBEAT_TTL,
+    REDIS_PREFIX,
+    REDIS_URL,
+    BotMove,
+    GameServer,
+    game_id_from_channel,
+)
+
+
+class WriteBuffer:
+    """Stands in for a GameServer's Redis client: records its writes for the event loop to send."""
+
+    def __init__(self):
+        self.commands = []
+
+    def publish(self, channel, data):
+        self.commands.append(("publish", (channel, data), {}))
+
+    def set(self, key, value, ex=None):
+        self.commands.append(("set", (key, value), {"ex": ex}))
+
+    def setex(self, key, ttl, value):
+        self.commands.append(("setex", (key, ttl, value), {}))
+
+    def rpush(self, key, *values):
+        self.commands.append(("rpush", (key, *values), {}))
+
+    def expire(self, key, ttl):
+        self.commands.append(("expire", (key, ttl), {}))
+
+    def delete(self, *keys):
+        self.commands.append(("delete", keys, {}))
+
+    def pipeline(self, transaction=True):
+        # a GameServer batches each action's writes; they stay here until the loop flushes them
+        return self
+
+    def execute(self):
+        return []
+
+    async def flush(self, client):
+        """Send the buffered writes in order as one transaction."""
+        if not self.commands:
+            return
+        commands, self.commands = self.commands, []
+        pipe = client.pipeline(transaction=True)
+        for name, args, kwargs in commands:
+            getattr(pipe, name)(*args, **kwargs)
+        await pipe.execute()
+
+
+class AsyncBriscolaService:
+    """Creates/manages per-game servers as tasks on one event loop, sharing one Redis connection pool."""
+
+    def __init__(self, redis_client: Optional[aioredis.Redis] = None, game_filter: Optional[Callable[[str], bool]] = None):
+        self.redis = redis_client or aioredis.Redis.from_url(
+            REDIS_URL, decode_responses=True, encoding_errors=ENCODING_ERRORS
+        )
+        self.servers: Dict[str, GameServer] = {}
+        self.queues: Dict[str, asyncio.Queue] = {}
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.stopping: Set[str] = set()  # games whose task has been asked to stop for a restart
+        self.stop_event = asyncio.Event()
+        self.game_filter = game_filter  # set on a shard worker: the games it serves
+        self.leases = AsyncLeaseManager(self.redis, GAME_LEASE_TTL_MS, REDIS_PREFIX) if GAME_LEASES else None
+        self.write_behind = WriteBehind() if PERSIST_MODE == "write-behind" else None
+
+    async def restore_games(self):
+        """Start a server for every persisted game this service serves (a restarted shard worker's games)."""
+        restored = 0
+        async for key in self.redis.scan_iter(match=f"{REDIS_PREFIX}:*:state", count=1000):
+            game_id = key[len(REDIS_PREFIX) + 1:-len(":state")]
+            if game_id not in self.servers and (self.game_filter is None or self.game_filter(game_id)):
+                restored += await self.ensure_server(game_id)
+        return restored
+
+    async def ensure_server(self, game_id: str, restart: bool = False) -> bool:
+        """Start the game's task from its persisted state unless one is running; False if leased elsewhere."""
+        # restart: replace the running task (the heartbeat monitor's recovery)
+        task = self.tasks.get(game_id)
+        if not restart and game_id in self.servers and task is not None and not task.done():
+            return True
+        if restart and not await self.stop_task(game_id):
+            print(f"Task for {game_id} is still busy, restarting it later")
+            return True
+        if self.leases is not None and not await self.leases.acquire(game_id):
+            return False
+        server = GameServer(
+            game_id,
+            WriteBuffer(),
+            bot_seats=BOT_SEATS,
+            advisor=service.get_advisor() if BOT_SEATS else None,
+            write_behind=self.write_behind,
+            schedule_bot=self.bot_move_scheduler(game_id),
+        )
+        try:
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.get(server.state_key())
+            pipe.lrange(server.log_key(), 0, -1)
+            server.restore(*await pipe.execute())
+        except Exception as e:
+            print(f"Failed to load snapshot for {game_id}: {e}")
+        # a restarted game keeps the actions still queued for it
+        queue = self.queues.setdefault(game_id, asyncio.Queue())
+        self.servers[game_id] = server
+        self.tasks[game_id] = asyncio.create_task(self.server_loop(server, queue))
+        self.stopping.discard(game_id)
+        return True
+
+    def bot_move_scheduler(self, game_id: str):
+        """Called on the bot thread: hand a bot move to the loop, for the game's queue."""
+        loop = asyncio.get_running_loop()
+
+        def queue_move(move: BotMove):
+            queue = self.queues.get(game_id)
+            if queue is not None:
+                loop.call_soon_threadsafe(queue.put_nowait, move)
+
+        return queue_move
+
+    async def stop_task(self, game_id: str) -> bool:
+        """Have the game's task handle the actions queued ahead, write its pending state and exit.
+
+        The replacement then loads everything the old server wrote. False if the task has not stopped within
+        HEARTBEAT_INTERVAL (it still will, at its sentinel).
+        """
+        task, server = self.tasks.get(game_id), self.servers.get(game_id)
+        if task is None or task.done():
+            if server is not None:
+                server.flush_state()  # no task left to change the game meanwhile
+                await server.redis.flush(self.redis)
+            return True
+        if game_id not in self.stopping:  # asked once: a second sentinel would stop the replacement too
+            self.stopping.add(game_id)
+            queue = self.queues[game_id]
+            queue.put_nowait(FLUSH_STATE)
+            queue.put_nowait(None)
+        await asyncio.wait([task], timeout=HEARTBEAT_INTERVAL)
+        return task.done()
+
+    async def drop_server(self, game_id: str):
+        """Forget a game this node has lost the lease on, with the actions queued for it."""
+        print(f"Lost the lease on {game_id}, dropping its server")
+        self.servers.pop(game_id, None)
+        self.queues.pop(game_id, None)
+        task = self.tasks.pop(game_id, None)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+
+    async def owns(self, game_id: str) -> bool:
+        """Whether this node may still act for the game (checked before every action)."""
+        if self.leases is None or self.leases.holds(game_id):
+            return True
+        # renewals running late: extend the lease now if it is still ours
+        if await self.leases.acquire(game_id):
+            return True
+        await self.drop_server(game_id)
+        return False
+
+    async def server_loop(self, server: GameServer, queue: asyncio.Queue):
+        server.run_bots()  # a restored game may be waiting on a bot seat
+        while True:
+            envelope = await queue.get()
+            if envelope is None:
+                queue.task_done()
+                return
+            if not await self.owns(server.game_id):
+                return
+            try:
+                if envelope is FLUSH_STATE:
+                    server.flush_state()
+                elif isinstance(envelope, BotMove):
+                    server.handle_bot_move(envelope)
+                else:
+                    server.handle_action(envelope)
+            except Exception as exc:  # defensive
+                print(f"Error handling action for {server.game_id}: {exc}")
+            try:
+                await server.redis.flush(self.redis)
+            except Exception as exc:  # defensive
+                print(f"Error writing results for {server.game_id}: {exc}")
+            queue.task_done()
+
+    async def dispatch(self, envelope: dict, game_id: Optional[str] = None):
+        """Queue an action for its game: game_id, the one its channel names, or else the envelope's."""
+        game_id = game_id or envelope.get("game_id")
+        if not game_id:
+            return
+        if game_id not in self.servers and not await self.ensure_server(game_id):
+            return  # another node serves the game
+        self.queues[game_id].put_nowait(envelope)
+
+    async def monitor_actions(self):
+        pubsub = self.redis.pubsub()
+        await pubsub.psubscribe(f"{REDIS_PREFIX}.*.actions")
+        print("Async game service monitoring pattern game.*.actions")
+        async for msg in pubsub.listen():
+            if self.stop_event.is_set():
+                break
+            if msg["type"] not in ("message", "pmessage"):
+                continue
+            # routed by the channel, as in the threaded mode: the shard filter and the queue agree on the game
+            game_id = game_id_from_channel(msg.get("channel") or "")
+            if not game_id:
+                continue
+            if self.game_filter is not None and not self.game_filter(game_id):
+                continue  # another shard's game
+            try:
+                await self.dispatch(decode_message(msg["data"]), game_id)
+            except Exception as exc:  # defensive
+                print(f"Error monitoring actions: {exc}")
+
+    async def flush_dirty_games(self):
+        """Write-behind flusher: queue a snapshot write for every game that is due one."""
+        while not self.stop_event.is_set():
+            for game_id in self.write_behind.take_due():
+                queue = self.queues.get(game_id)
+                if queue is not None:
+                    queue.put_nowait(FLUSH_STATE)
+            due = self.write_behind.next_due()
+            delay = self.write_behind.window if due is None else due - time.monotonic()
+            try:
+                await asyncio.wait_for(self.stop_event.wait(), min(max(delay, 0.001), self.write_behind.window))
+            except asyncio.TimeoutError:
+                pass
+
+    async def monitor_heartbeats(self, once: bool = False):
+        """Renew the leases and heartbeats of this node's games; restart games whose task has died."""
+        while not self.stop_event.is_set():
+            if self.leases is not None:
+                for game_id in await self.leases.renew(list(self.servers.keys())):
+                    await self.drop_server(game_id)
+            pipe = self.redis.pipeline(transaction=False)
+            for game_id in list(self.servers.keys()):
+                task = self.tasks.get(game_id)
+                if task is None or task.done():
+                    print(f"Game task failed for {game_id}, restarting server")
+                    if not await self.ensure_server(game_id, restart=True):
+                        await self.drop_server(game_id)
+                        continue
+                pipe.setex(f"{REDIS_PREFIX}:{game_id}:heartbeat", HEARTBEAT_TTL, "alive")
+            await pipe.execute()
+            if once:
+                break
+            try:
+                await asyncio.wait_for(self.stop_event.wait(), HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def serve(self, restore: bool = False):
+        if restore:
+            print(f"Restored {await self.restore_games()} game(s)")
+        loops = [self.monitor_actions(), self.monitor_heartbeats()]
+        if self.write_behind is not None:
+            loops.append(self.flush_dirty_games())
+        await asyncio.gather(*loops)
+
+    async def stop(self):
+        self.stop_event.set()
+        # each task writes what it left to the write-behind flusher, then stops
+        stopped = await asyncio.gather(*(self.stop_task(game_id) for game_id in list(self.servers)))
+        for game_id, done in zip(list(self.servers), stopped):
+            if not done:
+                print(f"Task for {game_id} did not stop, its pending state is not written")
+                self.tasks[game_id].cancel()
+        if self.leases is not None:
+            # hand the games over now rather than when the leases expire
+            for game_id in list(self.servers):
+                await self.leases.release(game_id)
+
+    async def serve_until_stopped(self, restore: bool = False):
+        """Serve until SIGTERM or SIGINT (or the loops end), then stop(): write pending state, release leases."""
+        # without a handler, SIGTERM kills the process (python is PID 1 in the image) before anything is written
+        loop = asyncio.get_running_loop()
+        signals = (signal.SIGTERM, signal.SIGINT)
+        for signum in signals:
+            loop.add_signal_handler(signum, self.stop_event.set)
+        serving = asyncio.ensure_future(self.serve(restore))
+        stopped = asyncio.ensure_future(self.stop_event.wait())
+        try:
+            await asyncio.wait([serving, stopped], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for signum in signals:
+                loop.remove_signal_handler(signum)
+            serving.cancel()
+            stopped.cancel()
+            await self.stop()
+        if serving.done() and not serving.cancelled():
+            serving.result()  # a loop that failed
+
+    def run(self, restore: bool = False):
+        asyncio.run(self.serve_until_stopped(restore))
+
+
+if __name__ == "__main__":
+    AsyncBriscolaService().run()
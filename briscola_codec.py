@@ -0,0 +1,327 @@
+"""Wire codecs for action and event envelopes.
+
+Two wire formats are spoken:
+
+json     envelopes as JSON text, written by orjson when it is installed (WIRE_JSON=auto) or by the standard library.
+compact  a binary encoding: a MAGIC byte and a format version byte, then one tagged value. Cards ({suit, rank}
+         dicts, with or without card_id) are two bytes, a tag and the card id, and decode as {"card_id": id};
+         keys and frequent values (message types, phases, suits, ...) are two bytes, a tag and their index in
+         STRINGS; small ints are one byte. An event is typically a quarter of its JSON size.
+
+A node offers the formats in WIRE_CODECS and advertises them as the build metadata of its protocol version
+(protocol_version("1.0.0") -> "1.0.0+json.compact"). A client asks for formats the same way, in the version of the
+envelopes it sends; a client that states none reads JSON only. Every client of a game reads the same events channel,
+so a game settles its codec when a client joins: negotiate picks a format every joined client reads, in the first
+client's order of preference, and falls back to JSON. That codec writes every event of the game and is persisted with
+it (as its clients' formats). Incoming messages are decoded by their first byte whatever was negotiated, since MAGIC
+can never start JSON text.
+
+Compact messages travel through Redis clients that decode replies as text: those clients are made with
+encoding_errors=surrogateescape (ENCODING_ERRORS), which keeps the bytes recoverable.
+"""
+import json
+import os
+import struct
+from typing import Dict, Iterable, List, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # optional: the standard library writes the same JSON, slower
+    orjson = None
+
+WIRE_CODECS = [c.strip() for c in os.environ.get('WIRE_CODECS', 'json,compact').split(',') if c.strip()]
+WIRE_JSON = os.environ.get('WIRE_JSON', 'auto')  # auto: orjson if installed; json: the standard library
+ENCODING_ERRORS = 'surrogateescape'
+
+MAGIC = 0xC1  # never the first byte of UTF-8 text
+COMPACT_VERSION = 1
+
+SUITS = ('cups', 'coins', 'swords', 'clubs')
+
+# append only: an index, once given out, is part of the format
+STRINGS = (
+    # envelope
+    'message_type', 'game_id', 'action_id', 'player_id', 'role', 'ts', 'version', 'origin', 'payload',
+    # action.result
+    'status', 'code', 'reason', 'effects', 'recovery', 'ok', 'error', 'invalid_action', 'invalid_card', 'noop',
+    'retry', 'sync',
+    # payload fields
+    'state', 'winner_id', 'winning_bid', 'phase', 'caller_id', 'partner_id', 'partner_rank', 'trump_suit',
+    'partner_suit', 'card', 'trick', 'current_player_id', 'current_leader_id', 'points', 'trick_cards', 'scores',
+    'hand', 'snapshot', 'players', 'name', 'seat', 'trick_history', 'bids', 'bid', 'suit', 'rank', 'card_id',
+    # message types, roles and origins
+    'action.result', 'phase.change', 'trick.played', 'trick.won', 'hand.update', 'join', 'call-partner-rank',
+    'call-partner-suit', 'play', 'reorder', 'player', 'observer', 'bot', 'game',
+    # phases and suits
+    'idle', 'ready', 'play-first-trick', 'play-tricks', 'trick-won',
+) + SUITS
+_STRING_INDEX = {s: i for i, s in enumerate(STRINGS)}
+
+# tags: 0x00-0x7f int 0..127, 0xe0-0xff int -32..-1, 0x80|n map, 0x90|n list, 0xa0|n str of n < 32 bytes
+NONE, FALSE, TRUE, CARD, STRING, FLOAT, INT, STR8, STR16, LIST16, MAP16 = (
+    0xC0, 0xC2, 0xC3, 0xC7, 0xC8, 0xCB, 0xD3, 0xD9, 0xDA, 0xDC, 0xDE)
+
+_pack_int = struct.Struct('<q').pack
+_pack_float = struct.Struct('<d').pack
+_pack_u16 = struct.Struct('<H').pack
+_unpack_int = struct.Struct('<q').unpack_from
+_unpack_float = struct.Struct('<d').unpack_from
+_unpack_u16 = struct.Struct('<H').unpack_from
+
+Data = Union[str, bytes]
+
+
+def _card_id(value: dict) -> Optional[int]:
+    # a {suit, rank} dict (card_id optional) as its card id; None for any other dict
+    if not 2 <= len(value) <= 3 or (len(value) == 3 and 'card_id' not in value):
+        return None
+    suit, rank = value.get('suit'), value.get('rank')
+    if suit not in SUITS or type(rank) is not int or not 1 <= rank <= 10:
+        return None
+    return SUITS.index(suit) * 10 + rank - 1
+
+
+def _encode(value, out: bytearray):
+    kind = type(value)
+    if kind is str:
+        index = _STRING_INDEX.get(value)
+        if index is not None:
+            out.append(STRING)
+            out.append(index)
+            return
+        raw = value.encode('utf-8', ENCODING_ERRORS)
+        n = len(raw)
+        if n < 32:
+            out.append(0xA0 | n)
+        elif n < 256:
+            out.append(STR8)
+            out.append(n)
+        else:
+            out.append(STR16)
+            out += _pack_u16(n)
+        out += raw
+    elif kind is int:
+        if 0 <= value < 128:
+            out.append(value)
+        elif -32 <= value < 0:
+            out.append(value & 0xFF)
+        else:
+            out.append(INT)
+            out += _pack_int(value)
+    elif kind is dict:
+        card = _card_id(value)
+        if card is not None:
+            out.append(CARD)
+            out.append(card)
+            return
+        n = len(value)
+        if n < 16:
+            out.append(0x80 | n)
+        else:
+            out.append(MAP16)
+            out += _pack_u16(n)
+        for key, item in value.items():
+            _encode(key, out)
+            _encode(item, out)
+    elif kind is list or kind is tuple:
+        n = len(value)
+        if n < 16:
+            out.append(0x90 | n)
+        else:
+            out.append(LIST16)
+            out += _pack_u16(n)
+        for item in value:
+            _encode(item, out)
+    elif value is None:
+        out.append(NONE)
+    elif value is True:
+        out.append(TRUE)
+    elif value is False:
+        out.append(FALSE)
+    elif kind is float:
+        out.append(FLOAT)
+        out += _pack_float(value)
+    else:
+        raise TypeError(f"cannot encode {kind.__name__} in a compact message")
+
+
+def _decode(data: bytes, pos: int):
+    tag = data[pos]
+    pos += 1
+    if tag < 0x80:
+        return tag, pos
+    if tag >= 0xE0:
+        return tag - 0x100, pos
+    if tag == STRING:
+        return STRINGS[data[pos]], pos + 1
+    if tag == CARD:
+        return {'card_id': data[pos]}, pos + 1
+    if tag < 0x90 or tag == MAP16:
+        if tag == MAP16:
+            n, pos = _unpack_u16(data, pos)[0], pos + 2
+        else:
+            n = tag & 0x0F
+        value = {}
+        for _ in range(n):
+            key, pos = _decode(data, pos)
+            value[key], pos = _decode(data, pos)
+        return value, pos
+    if tag < 0xA0 or tag == LIST16:
+        if tag == LIST16:
+            n, pos = _unpack_u16(data, pos)[0], pos + 2
+        else:
+            n = tag & 0x0F
+        items = []
+        for _ in range(n):
+            item, pos = _decode(data, pos)
+            items.append(item)
+        return items, pos
+    if tag < 0xC0 or tag in (STR8, STR16):
+        if tag == STR8:
+            n, pos = data[pos], pos + 1
+        elif tag == STR16:
+            n, pos = _unpack_u16(data, pos)[0], pos + 2
+        else:
+            n = tag & 0x1F
+        return data[pos:pos + n].decode('utf-8', ENCODING_ERRORS), pos + n
+    if tag == NONE:
+        return None, pos
+    if tag == TRUE:
+        return True, pos
+    if tag == FALSE:
+        return False, pos
+    if tag == INT:
+        return _unpack_int(data, pos)[0], pos + 8
+    if tag == FLOAT:
+        return _unpack_float(data, pos)[0], pos + 8
+    raise ValueError(f"unknown compact tag {tag:#x} at {pos - 1}")
+
+
+class JsonCodec:
+    """JSON text through the standard library."""
+
+    name = 'json'
+
+    def encode(self, value) -> Data:
+        return json.dumps(value)
+
+    def decode(self, data: Data):
+        return json.loads(data)
+
+    def extend(self, message: Data, key: str, value: Data) -> Data:
+        """Add key, with its value already encoded, as the last member of an encoded map."""
+        if message == '{}':
+            return f'{{{json.dumps(key)}: {value}}}'
+        return f'{message[:-1]}, {json.dumps(key)}: {value}}}'
+
+
+class OrjsonCodec(JsonCodec):
+    """The same JSON, written and read by orjson (messages are bytes)."""
+
+    def encode(self, value) -> Data:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+
+    def decode(self, data: Data):
+        return orjson.loads(data)
+
+    def extend(self, message: Data, key: str, value: Data) -> Data:
+        if message == b'{}':
+            return b'{' + orjson.dumps(key) + b':' + value + b'}'
+        return message[:-1] + b',' + orjson.dumps(key) + b':' + value + b'}'
+
+
+class CompactCodec:
+    """The compact binary format (see the module docstring)."""
+
+    name = 'compact'
+
+    def encode(self, value) -> bytes:
+        out = bytearray((MAGIC, COMPACT_VERSION))
+        _encode(value, out)
+        return bytes(out)
+
+    def decode(self, data: Data):
+        if isinstance(data, str):
+            data = data.encode('utf-8', ENCODING_ERRORS)
+        if len(data) < 3 or data[0] != MAGIC:
+            raise ValueError('not a compact message')
+        if data[1] != COMPACT_VERSION:
+            raise ValueError(f"unknown compact format version {data[1]}")
+        value, pos = _decode(data, 2)
+        if pos != len(data):
+            raise ValueError('trailing bytes after compact message')
+        return value
+
+    def extend(self, message: bytes, key: str, value: bytes) -> bytes:
+        tag = message[2]
+        if tag < 0x8F:
+            head = bytes((MAGIC, COMPACT_VERSION, tag + 1))
+            body = message[3:]
+        elif tag == 0x8F:
+            head = bytes((MAGIC, COMPACT_VERSION, MAP16)) + _pack_u16(16)
+            body = message[3:]
+        elif tag == MAP16:
+            head = bytes((MAGIC, COMPACT_VERSION, MAP16)) + _pack_u16(_unpack_u16(message, 3)[0] + 1)
+            body = message[5:]
+        else:
+            raise ValueError('not a compact map')
+        out = bytearray(head)
+        out += body
+        _encode(key, out)
+        out += value[2:]
+        return bytes(out)
+
+
+def json_codec() -> JsonCodec:
+    """The configured JSON backend."""
+    if WIRE_JSON == 'orjson' or (WIRE_JSON == 'auto' and orjson is not None):
+        if orjson is None:
+            raise RuntimeError('WIRE_JSON=orjson but orjson is not installed')
+        return OrjsonCodec()
+    return JsonCodec()
+
+
+CODECS: Dict[str, object] = {'json': json_codec(), 'compact': CompactCodec()}
+
+
+def protocol_version(base: str, offered: List[str] = WIRE_CODECS) -> str:
+    """The protocol version with the offered wire formats as its build metadata."""
+    return f"{base}+{'.'.join(offered)}"
+
+
+def client_formats(version: Optional[str]) -> List[str]:
+    """The formats a client reads, in its order of preference, from the version of its envelopes.
+
+    A client that states none (e.g. one older than the codecs) reads JSON only.
+    """
+    if not version or '+' not in version:
+        return ['json']
+    return [name for name in version.split('+', 1)[1].split('.') if name]
+
+
+def negotiate(clients: Iterable[List[str]], offered: List[str] = WIRE_CODECS):
+    """The codec for a game: the first format, in the first client's order, that every client reads; else JSON."""
+    clients = list(clients)
+    if not clients:
+        return default_codec(offered)
+    for name in clients[0]:
+        if name in offered and name in CODECS and all(name in formats for formats in clients[1:]):
+            return CODECS[name]
+    return CODECS['json']
+
+
+def default_codec(offered: List[str] = WIRE_CODECS):
+    """Codec for a game until its client negotiates one: JSON, unless this node does not offer it."""
+    if 'json' in offered or not offered:
+        return CODECS['json']
+    return CODECS[offered[0]]
+
+
+def decode(data: Data):
+    """Decode an incoming message in whichever format it is written."""
+    if isinstance(data, str):
+        if data[:1] == '\udcc1':  # MAGIC, as decoded with surrogateescape
+            return CODECS['compact'].decode(data)
+    elif data[:1] == b'\xc1':
+        return CODECS['compact'].decode(data)
+    return CODECS['json'].decode(data)
@@ -0,0 +1,165 @@
+"""Game ownership leases in Redis, so that only one service node serves a game at a time.
+
+A node owns a game while <prefix>:<game_id>:owner holds its node id. The key expires after the lease TTL unless the
+owner renews it, which it does for all its games at once with the heartbeat. Once an owner stops renewing (it
+died, or lost Redis), the lease expires and the next node to see an action for the game acquires it and reloads
+the game from its persisted state.
+
+Every check-and-set runs as a Lua script, so acquiring, renewing and releasing are atomic. Renewal is one script
+call per LEASE_RENEW_BATCH games. Each node also keeps the local monotonic deadline of every lease it holds and
+stops handling a game's actions LEASE_MARGIN_MS before the lease could have expired in Redis, so two nodes never
+handle the same game even when the owner's renewals are late.
+
+Every node sees every game's actions, so a refused acquire returns how long the other node's lease has left, and
+the node skips that game without asking Redis again until the lease could have lapsed, or for LEASE_RECHECK_MS if
+that is sooner (an owner that shuts down releases its leases early). A lease renewed meanwhile is refused again.
+
+A node is named by SERVICE_NODE_ID (default: host name and process id). Give a node a stable name so that after
+a restart it takes its games' leases straight back instead of waiting for them to expire.
+"""
+import os
+import socket
+import time
+from typing import Dict, Iterable, List, Optional
+
+LEASE_MARGIN_MS = int(os.environ.get('GAME_LEASE_MARGIN_MS', 1000))
+LEASE_RECHECK_MS = int(os.environ.get('GAME_LEASE_RECHECK_MS', 1000))  # longest a refused game is skipped for
+LEASE_RENEW_BATCH = 1000
+
+ACQUIRE = """
+local owner = redis.call('GET', KEYS[1])
+if owner and owner ~= ARGV[1] then
+    return -math.max(redis.call('PTTL', KEYS[1]), 1)
+end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+return 1
+"""
+
+RENEW = """
+local renewed = {}
+for i, key in ipairs(KEYS) do
+    if redis.call('GET', key) == ARGV[1] then
+        redis.call('PEXPIRE', key, ARGV[2])
+        renewed[i] = 1
+    else
+        renewed[i] = 0
+    end
+end
+return renewed
+"""
+
+RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def default_node_id() -> str:
+    return os.environ.get('SERVICE_NODE_ID') or f"{socket.gethostname()}-{os.getpid()}"
+
+
+class LeaseManager:
+    """Leases held by one node, over a synchronous Redis client."""
+
+    def __init__(
+        self, client, ttl_ms: int, prefix: str = "game", node_id: Optional[str] = None, margin_ms: int = LEASE_MARGIN_MS,
+        recheck_ms: int = LEASE_RECHECK_MS,
+    ):
+        self.client = client
+        self.ttl_ms = ttl_ms
+        self.prefix = prefix
+        self.node_id = node_id or default_node_id()
+        self.margin = margin_ms / 1000
+        self.recheck = recheck_ms / 1000
+        self.deadlines: Dict[str, float] = {}  # game id -> monotonic time the lease may have expired by
+        self.foreign: Dict[str, float] = {}  # game id -> monotonic time another node's lease could lapse at
+        self.acquire_script = client.register_script(ACQUIRE)
+        self.renew_script = client.register_script(RENEW)
+        self.release_script = client.register_script(RELEASE)
+
+    def key(self, game_id: str) -> str:
+        return f"{self.prefix}:{game_id}:owner"
+
+    def holds(self, game_id: str) -> bool:
+        """Whether this node may still act for the game, going by its own clock."""
+        return time.monotonic() < self.deadlines.get(game_id, 0) - self.margin
+
+    def leased_elsewhere(self, game_id: str) -> bool:
+        """Whether another node's lease on the game is known to run for a while yet (no need to ask Redis)."""
+        until = self.foreign.get(game_id)
+        if until is None:
+            return False
+        if time.monotonic() < until:
+            return True
+        del self.foreign[game_id]
+        return False
+
+    def forget_lapsed(self):
+        now = time.monotonic()
+        for game_id in [g for g, until in self.foreign.items() if until <= now]:
+            del self.foreign[game_id]
+
+    def granted(self, game_id: str, started: float, ok) -> bool:
+        # the lease runs from before the request was sent, so the local deadline is never later than Redis's;
+        # a refusal is -(the other lease's remaining ms), counted from after the reply, so never earlier than Redis's
+        ok = ok or 0
+        if ok > 0:
+            self.deadlines[game_id] = started + self.ttl_ms / 1000
+            self.foreign.pop(game_id, None)
+        else:
+            self.deadlines.pop(game_id, None)
+            if ok < 0:
+                self.foreign[game_id] = time.monotonic() + min(-ok / 1000, self.recheck)
+        return ok > 0
+
+    def batches(self, game_ids: Iterable[str]) -> List[List[str]]:
+        game_ids = list(game_ids)
+        return [game_ids[i:i + LEASE_RENEW_BATCH] for i in range(0, len(game_ids), LEASE_RENEW_BATCH)]
+
+    def acquire(self, game_id: str) -> bool:
+        """Take the game's lease if it is free or already ours (then it is extended)."""
+        if self.leased_elsewhere(game_id):
+            return False
+        started = time.monotonic()
+        ok = self.acquire_script(keys=[self.key(game_id)], args=[self.node_id, self.ttl_ms])
+        return self.granted(game_id, started, ok)
+
+    def renew(self, game_ids: Iterable[str]) -> List[str]:
+        """Extend the leases on game_ids; returns the games whose lease this node no longer holds."""
+        self.forget_lapsed()
+        lost = []
+        for batch in self.batches(game_ids):
+            started = time.monotonic()
+            renewed = self.renew_script(keys=[self.key(g) for g in batch], args=[self.node_id, self.ttl_ms])
+            lost.extend(g for g, ok in zip(batch, renewed) if not self.granted(g, started, ok))
+        return lost
+
+    def release(self, game_id: str) -> bool:
+        self.deadlines.pop(game_id, None)
+        return bool(self.release_script(keys=[self.key(game_id)], args=[self.node_id]))
+
+
+class AsyncLeaseManager(LeaseManager):
+    """The same leases over a redis.asyncio client."""
+
+    async def acquire(self, game_id: str) -> bool:
+        if self.leased_elsewhere(game_id):
+            return False
+        started = time.monotonic()
+        ok = await self.acquire_script(keys=[self.key(game_id)], args=[self.node_id, self.ttl_ms])
+        return self.granted(game_id, started, ok)
+
+    async def renew(self, game_ids: Iterable[str]) -> List[str]:
+        self.forget_lapsed()
+        lost = []
+        for batch in self.batches(game_ids):
+            started = time.monotonic()
+            renewed = await self.renew_script(keys=[self.key(g) for g in batch], args=[self.node_id, self.ttl_ms])
+            lost.extend(g for g, ok in zip(batch, renewed) if not self.granted(g, started, ok))
+        return lost
+
+    async def release(self, game_id: str) -> bool:
+        self.deadlines.pop(game_id, None)
+        return bool(await self.release_script(keys=[self.key(game_id)], args=[self.node_id]))
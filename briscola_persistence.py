@@ -0,0 +1,72 @@
+"""Snapshot persistence policies for game servers.
+
+A game is persisted as a checkpoint in <prefix>:<game_id>:state (the full game, see Game.checkpoint) and a log in
+<prefix>:<game_id>:log of the moves made since it, one small entry appended per accepted action. A checkpoint is
+written when the cards are dealt, when a trick ends, and once the log holds CHECKPOINT_ACTIONS entries; writing one
+empties the log in the same transaction. A restarted game loads the checkpoint and replays the log through the Game
+methods, so it resumes exactly where it stopped.
+
+Write-behind (PERSIST_MODE=write-behind): an action that changes a game's state within a phase only marks the game
+dirty; its log entries are kept and written later, together with those of every action within the window. A dirty
+game is due PERSIST_WINDOW_MS after its last change, and never later than PERSIST_MAX_STALENESS_MS after its first
+unwritten change, so a game that never goes quiet is still written at that interval. Phase changes and checkpoints
+(including the end of every trick) are written with the action that makes them, and services write every dirty
+game when they stop.
+
+The service's flusher asks a due game's own worker to write it (by queueing FLUSH_STATE behind the game's
+actions), and so does a restart or shutdown before the worker's sentinel, so a checkpoint is never encoded while an
+action is changing the game.
+"""
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+PERSIST_MODE = os.environ.get('PERSIST_MODE', 'sync')  # sync: every change in its action's transaction
+PERSIST_WINDOW_MS = int(os.environ.get('PERSIST_WINDOW_MS', 50))
+PERSIST_MAX_STALENESS_MS = int(os.environ.get('PERSIST_MAX_STALENESS_MS', 500))
+CHECKPOINT_ACTIONS = int(os.environ.get('CHECKPOINT_ACTIONS', 16))  # most log entries between checkpoints
+
+FLUSH_STATE = object()  # queued for a game's worker in place of an action: write the game's pending state now
+
+
+class WriteBehind:
+    """Dirty games and the time each has to be written by. Thread safe."""
+
+    def __init__(self, window_ms: int = PERSIST_WINDOW_MS, max_staleness_ms: int = PERSIST_MAX_STALENESS_MS):
+        self.window = window_ms / 1000
+        self.max_staleness = max_staleness_ms / 1000
+        self.dirty: Dict[str, Tuple[float, float]] = {}  # game id -> (first unwritten change, due)
+        self.changed = threading.Condition()
+
+    def mark(self, game_id: str):
+        now = time.monotonic()
+        with self.changed:
+            first = self.dirty[game_id][0] if game_id in self.dirty else now
+            self.dirty[game_id] = (first, min(now + self.window, first + self.max_staleness))
+            self.changed.notify()
+
+    def discard(self, game_id: str):
+        with self.changed:
+            self.dirty.pop(game_id, None)
+
+    def next_due(self) -> Optional[float]:
+        with self.changed:
+            return min((due for _, due in self.dirty.values()), default=None)
+
+    def take_due(self, now: Optional[float] = None) -> List[str]:
+        """Games whose snapshot is due, no longer tracked as dirty (their writer is about to write them)."""
+        now = time.monotonic() if now is None else now
+        with self.changed:
+            due = [game_id for game_id, (_, at) in self.dirty.items() if at <= now]
+            for game_id in due:
+                del self.dirty[game_id]
+        return due
+
+    def wait(self, timeout: float):
+        """Sleep until the next game is due, a game is marked, or timeout."""
+        with self.changed:
+            due = min((at for _, at in self.dirty.values()), default=None)
+            delay = timeout if due is None else min(timeout, max(due - time.monotonic(), 0))
+            if delay > 0:
+                self.changed.wait(delay)
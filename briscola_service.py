@@ -1,23 +1,66 @@
 """Briscola game service: manages per-game servers and Redis IO."""
 
+import base64
+import copy
 import json
 import os
+import queue
 import random
+import signal
 import string
 import time
 import threading
-from typing import Dict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, NamedTuple, Optional, Set
 
 import redis
-from briscola import deck
-from briscola.game import Game, trick_winner
+from briscola import bidding, bot, deck
+from briscola.beliefs import BeliefTracker
+from briscola.game import Game
+from briscola.snapshot import decode as decode_game, encode as encode_game
+from briscola.tables import WinTables
+from briscola_codec import (
+    ENCODING_ERRORS, client_formats, decode as decode_message, default_codec, negotiate, protocol_version,
+)
+from briscola_leases import LeaseManager
+from briscola_persistence import CHECKPOINT_ACTIONS, FLUSH_STATE, PERSIST_MODE, WriteBehind
 
 REDIS_URL = os.environ.get('REDIS_URL', 'redis://redis:6379/0')
 REDIS_PREFIX = 'game'
-PROTOCOL_VERSION = os.environ.get('PROTOCOL_VERSION', '1.0.0')
+PROTOCOL_VERSION = protocol_version(os.environ.get('PROTOCOL_VERSION', '1.0.0'))  # + the wire formats offered
 HEARTBEAT_TTL = int(os.environ.get('HEARTBEAT_TTL_SECONDS', 20))
 HEARTBEAT_INTERVAL = int(os.environ.get('HEARTBEAT_INTERVAL_SECONDS', 5))
+GAME_LEASES = os.environ.get('GAME_LEASES', '1') == '1'  # lease each game to one node; 0 for a lone node
+GAME_LEASE_TTL_MS = int(os.environ.get('GAME_LEASE_TTL_MS', HEARTBEAT_TTL * 1000))
+SERVICE_MODE = os.environ.get('SERVICE_MODE', 'threaded')  # threaded: a thread per game; asyncio: one event loop
+SERVICE_TRANSPORT = os.environ.get('SERVICE_TRANSPORT', 'pubsub')  # pubsub, or streams: Redis Streams consumer groups
+SERVICE_WORKERS = int(os.environ.get('SERVICE_WORKERS', 1))  # more than one: shard games over worker processes
+REDIS_POOL_SIZE = int(os.environ.get('REDIS_POOL_SIZE', 64))  # connections shared by every game's writes
 STATE_TTL = int(os.environ.get('GAME_STATE_TTL_SECONDS', 3600))
+MINIMUM_HAND_VALUE = int(os.environ.get('MINIMUM_HAND_VALUE', 5))
+BOT_SEATS = [int(s) for s in os.environ.get('BOT_SEATS', '').split(',') if s.strip()]
+BOT_BUDGET_MS = int(os.environ.get('BOT_BUDGET_MS', 200))
+# bot decisions run this many at a time, each a search in the shared process pool; with more decisions waiting than
+# threads, each gets a share of BOT_BUDGET_MS (down to BOT_MIN_BUDGET_MS) so a move still takes about that long.
+# At most BOT_THREADS * 1000 / BOT_BUDGET_MS moves/s at the full budget (40 on 8 cores), up to
+# BOT_THREADS * 1000 / BOT_MIN_BUDGET_MS under load (400 on 8 cores), less the cost of shipping each search
+BOT_THREADS = int(os.environ.get('BOT_THREADS', os.cpu_count() or 1))
+BOT_MIN_BUDGET_MS = int(os.environ.get('BOT_MIN_BUDGET_MS', 20))
+BID_ADVISOR_SAMPLES = int(os.environ.get('BID_ADVISOR_SAMPLES', 256))  # 0 disables the bidding advisor
+BID_ADVISOR_CACHE = int(os.environ.get('BID_ADVISOR_CACHE', 4096))
+SHUFFLE_POOL_SIZE = int(os.environ.get('SHUFFLE_POOL_SIZE', 0))  # permutations per NumPy batch; 0 shuffles per game
+MAX_BOT_MOVES = 200  # guard against a bot loop that never hands control back
+BOT_RETRIES = 2  # failed or rejected decisions for one move before the bot seat makes a fallback move
+
+HEARTBEAT = object()  # stands in for an action when a game's worker has been idle for HEARTBEAT_INTERVAL
+
+
+class BotMove(NamedTuple):
+    """A bot decision made off the game's worker, queued back to it; stale once the game's version has moved on."""
+
+    server: "GameServer"
+    version: int
+    envelope: Optional[dict]  # None: the decision failed
 
 
 def id_generator(size=6, chars=string.ascii_uppercase + string.digits):
@@ -25,6 +68,96 @@ def id_generator(size=6, chars=string.ascii_uppercase + string.digits):
     return ''.join(random.choice(chars) for _ in range(size))
 
 
+_advisor = None
+
+
+def get_advisor() -> Optional[bidding.BiddingAdvisor]:
+    """Bidding advisor shared by every game in this process (its cache is shared too), None when disabled."""
+    global _advisor
+    if _advisor is None and BID_ADVISOR_SAMPLES > 0:
+        _advisor = bidding.BiddingAdvisor(
+            samples=BID_ADVISOR_SAMPLES,
+            cache_size=BID_ADVISOR_CACHE,
+            minimum_hand_value=MINIMUM_HAND_VALUE,
+            executor=bot.get_executor(),
+        )
+    return _advisor
+
+
+_tables = None
+_tables_missing = False
+
+
+def get_tables() -> Optional[WinTables]:
+    """Card statistics tables (briscola.tables, built into the image) mapped by this process, None if not generated."""
+    global _tables, _tables_missing
+    if _tables is None and not _tables_missing:
+        try:
+            _tables = WinTables()
+        except (OSError, ValueError) as exc:
+            print(f"Card tables unavailable, bots bid on card points while advice is pending: {exc}")
+            _tables_missing = True
+    return _tables
+
+
+_bots = threading.local()
+_bot_executor = None
+_bot_decisions = 0  # submitted to the bot threads and not yet made
+_bot_lock = threading.Lock()
+
+
+def get_bot(budget: Optional[float] = None) -> bot.ISMCTSBot:
+    """The calling thread's bot (a bot's rng and endgame solver serve one decision at a time), created on first use.
+
+    :param budget: seconds for the decision about to be made; the bot keeps its last budget if not given
+    """
+    player = getattr(_bots, "bot", None)
+    if player is None:
+        # the threads' searches share the pool's processes between them
+        trees = max((os.cpu_count() or 1) // BOT_THREADS, 1)
+        player = _bots.bot = bot.ISMCTSBot(budget=BOT_BUDGET_MS / 1000, workers=trees, pool=True, tables=get_tables())
+    if budget is not None:
+        player.budget = budget
+    return player
+
+
+def get_bot_executor() -> ThreadPoolExecutor:
+    """The BOT_THREADS threads every game's bot decisions are made on, off the games' workers."""
+    global _bot_executor
+    if _bot_executor is None:
+        _bot_executor = ThreadPoolExecutor(max_workers=BOT_THREADS, thread_name_prefix="bot")
+    return _bot_executor
+
+
+def submit_bot_decision(decide: Callable[[float], None]):
+    """Run decide(budget in seconds) on a bot thread, the budget cut to a share of BOT_BUDGET_MS under load."""
+    global _bot_decisions
+    with _bot_lock:
+        _bot_decisions += 1
+
+    def run():
+        global _bot_decisions
+        waiting = max(_bot_decisions, BOT_THREADS)
+        try:
+            decide(max(BOT_BUDGET_MS * BOT_THREADS / waiting, BOT_MIN_BUDGET_MS) / 1000)
+        finally:
+            with _bot_lock:
+                _bot_decisions -= 1
+
+    get_bot_executor().submit(run)
+
+
+_shuffle_pool = None
+
+
+def get_shuffle_pool() -> Optional[deck.ShufflePool]:
+    """Pre-generated deal permutations shared by every game in this process, None when disabled."""
+    global _shuffle_pool
+    if _shuffle_pool is None and SHUFFLE_POOL_SIZE > 0:
+        _shuffle_pool = deck.ShufflePool(seed=deck.new_seed(), batch=SHUFFLE_POOL_SIZE)
+    return _shuffle_pool
+
+
 def now_ms():
     """Current epoch milliseconds."""
     return int(time.time() * 1000)
@@ -33,65 +166,242 @@ def now_ms():
 class GameServer:
     """Per-game engine: consumes actions, publishes events/results, persists snapshots, writes heartbeat."""
 
-    def __init__(self, game_id: str, redis_client: redis.Redis):
+    def __init__(
+        self,
+        game_id: str,
+        redis_client: redis.Redis,
+        bot_seats: Iterable[int] = (),
+        bot_player: Optional[bot.Bot] = None,
+        advisor: Optional[bidding.BiddingAdvisor] = None,
+        write_behind: Optional[WriteBehind] = None,
+        schedule_bot: Optional[Callable[[BotMove], None]] = None,
+    ):
         self.game_id = game_id
         self.redis = redis_client
-        self.game = Game()
+        self.game = Game(minimum_hand_value=MINIMUM_HAND_VALUE, shuffle_pool=get_shuffle_pool())
         self.last_heartbeat = 0
         self.initialized = False
+        self.bot_seats = set(bot_seats)
+        self.bot = bot_player  # None: each decision is made by its thread's own bot (get_bot)
+        # hands bot moves, decided on the bot threads, back to the game's worker; without it they are made inline
+        self.schedule_bot = schedule_bot
+        self.bot_pending = None  # game version a bot decision is being made for
+        self.bot_failures = 0  # failed or rejected decisions for the move the game waits on
+        self._running_bots = False
+        self.advisor = advisor
+        self.bid_advice: Dict[int, Future] = {}
+        self.beliefs: Dict[int, BeliefTracker] = {}  # per bot seat, fed by the events this server publishes
+        self.last_action_id = None  # the incoming action being handled, persisted with the state it produces
+        self.pipe = None  # while an action is handled: its writes, sent together when it is done
+        self.state_dirty = False
+        self.write_behind = write_behind
+        self.state_pending = False  # log entries left to the write-behind flusher
+        self.phase_at_begin = None
+        self.log_entries = []  # moves not yet appended to the persisted log
+        self.logged = 0  # entries in the persisted log, i.e. since the last checkpoint
+        self.checkpoint_due = False
+        self.snapshot_cache = None  # (game version, public snapshot, {codec name: encoded snapshot})
+        self.clients: Dict[str, list] = {}  # "<role>:<player id>" -> wire formats the joined client reads
+        self.codec = default_codec()  # writes the game's events; settled by negotiate as clients join
+
+    @property
+    def writer(self):
+        return self.pipe if self.pipe is not None else self.redis
+
+    def begin_writes(self):
+        self.pipe = self.redis.pipeline(transaction=True)
+        self.state_dirty = False
+        self.phase_at_begin = self.game.state
+
+    def flush_writes(self):
+        """Send the action's writes in one MULTI/EXEC round trip: its events and log entries become visible together."""
+        pipe, self.pipe = self.pipe, None
+        if self.state_dirty:
+            self.state_dirty = False
+            if self.write_behind is None or self.checkpoint_due or self.game.state != self.phase_at_begin:
+                self.write_state(pipe)
+                self.forget_pending_state()
+            else:
+                self.state_pending = True
+                self.write_behind.mark(self.game_id)
+        pipe.execute()
+
+    def write_state(self, client):
+        """Queue the log entries not yet written, or the checkpoint (which empties the log) when one is due."""
+        entries, self.log_entries = self.log_entries, []
+        if self.checkpoint_due:
+            self.checkpoint_due = False
+            client.set(self.state_key(), self.encode_state(), ex=STATE_TTL)
+            client.delete(self.log_key())
+            self.logged = 0
+        elif entries:
+            client.rpush(self.log_key(), *entries)
+            client.expire(self.log_key(), STATE_TTL)
+            self.logged += len(entries)
+
+    def forget_pending_state(self):
+        if self.state_pending:
+            self.state_pending = False
+            self.write_behind.discard(self.game_id)
+
+    def flush_state(self):
+        """Write the log entries left to the write-behind flusher, if any (called by the game's own worker)."""
+        if self.state_pending:
+            self.forget_pending_state()
+            pipe = self.redis.pipeline(transaction=True)
+            self.write_state(pipe)
+            pipe.execute()
 
     def heartbeat(self):
         now = int(time.time())
         if now - self.last_heartbeat >= HEARTBEAT_INTERVAL:
             key = f"{REDIS_PREFIX}:{self.game_id}:heartbeat"
-            self.redis.setex(key, HEARTBEAT_TTL, "alive")
+            self.writer.setex(key, HEARTBEAT_TTL, "alive")
             self.last_heartbeat = now
 
+    def state_key(self):
+        return f"{REDIS_PREFIX}:{self.game_id}:state"
+
+    def log_key(self):
+        return f"{REDIS_PREFIX}:{self.game_id}:log"
+
+    def record(self, *move):
+        """Log an accepted move under the action it belongs to; a trick's end or a long log makes a checkpoint due."""
+        self.log_entries.append(json.dumps([self.last_action_id, *move], separators=(",", ":")))
+        if self.game.state == "trick-won" or self.logged + len(self.log_entries) >= CHECKPOINT_ACTIONS:
+            self.checkpoint_due = True
+        self.persist_state()
+
     def persist_state(self):
-        key = f"{REDIS_PREFIX}:{self.game_id}:state"
-        snapshot = self.build_snapshot()
-        self.redis.set(key, json.dumps(snapshot), ex=STATE_TTL)
-        return snapshot
+        """Save the game; during an action it is written once, with the action's other writes."""
+        if self.pipe is not None:
+            self.state_dirty = True
+            return
+        # outside an action: write a checkpoint now
+        self.forget_pending_state()
+        self.checkpoint_due = True
+        pipe = self.redis.pipeline(transaction=True)
+        self.write_state(pipe)
+        pipe.execute()
+
+    def encode_state(self) -> str:
+        """The persisted checkpoint: the game's compact snapshot and the action it follows; never sent to players."""
+        # base64: the service's clients decode every reply as text
+        return json.dumps({
+            "snapshot": base64.b64encode(encode_game(self.game)).decode(),
+            "last_action_id": self.last_action_id,
+            "clients": self.clients,
+        })
+
+    def public_snapshot(self):
+        """The part of the snapshot every client sees, and its encoding; built once per game state version."""
+        version = self.game.version
+        if self.snapshot_cache is None or self.snapshot_cache[0] != version:
+            trick = [
+                {"player_id": pid, "card": {"suit": c.suit, "rank": c.rank}}
+                for c, pid in self.game.current_trick
+            ]
+            snapshot = {
+                "message_type": "sync",
+                "game_id": self.game_id,
+                "phase": self.game.state,
+                "players": [
+                    {"player_id": p.id, "name": f"Player {p.id}", "seat": p.id}
+                    for p in self.game.players
+                ],
+                "scores": [
+                    {"player_id": p.id, "points": p.points} for p in self.game.players
+                ],
+                "current_player_id": self.game.current_player_id,
+                "current_leader_id": self.game.current_leader_id,
+                "trick": trick,
+                "trick_history": [],
+                "caller_id": self.game.bid_winner.id if self.game.bid_winner else None,
+                "partner_id": self.game.partner.id if self.game.partner else None,
+                "partner_rank": self.game.partner_rank,
+                "trump_suit": self.game.partner_suit,
+                "bids": [{"player_id": p.id, "bid": p.bid} for p in self.game.players],
+            }
+            self.snapshot_cache = (version, snapshot, {})
+        _, snapshot, encoded = self.snapshot_cache
+        data = encoded.get(self.codec.name)
+        if data is None:
+            data = encoded[self.codec.name] = self.codec.encode(snapshot)
+        return snapshot, data
+
+    def hand_overlay(self, requesting_player_id=None, role=None):
+        """The requesting player's own hand, added to the public snapshot per request; None for observers."""
+        if role == "observer" or requesting_player_id is None:
+            return None
+        return [
+            {"suit": c.suit, "rank": c.rank, "card_id": card_id(c)}
+            for c in self.game.players[requesting_player_id].hand
+        ]
 
     def build_snapshot(self, requesting_player_id=None, role=None):
         """Construct snapshot dict; include hand for owner unless observer."""
-        trick = [
-            {"player_id": pid, "card": {"suit": c.suit, "rank": c.rank}}
-            for c, pid in self.game.current_trick
-        ]
-        snapshot = {
-            "message_type": "sync",
-            "game_id": self.game_id,
-            "phase": self.game.state,
-            "players": [
-                {"player_id": p.id, "name": f"Player {p.id}", "seat": p.id}
-                for p in self.game.players
-            ],
-            "scores": [
-                {"player_id": p.id, "points": p.points} for p in self.game.players
-            ],
-            "current_player_id": self.game.current_player_id,
-            "current_leader_id": self.game.current_leader_id,
-            "trick": trick,
-            "trick_history": [],
-            "caller_id": self.game.bid_winner.id if self.game.bid_winner else None,
-            "partner_id": self.game.partner.id if self.game.partner else None,
-            "partner_rank": self.game.partner_rank,
-            "trump_suit": self.game.partner_suit,
-            "bids": [{"player_id": p.id, "bid": p.bid} for p in self.game.players],
-        }
-        if role != "observer" and requesting_player_id is not None:
-            hand = [
-                {"suit": c.suit, "rank": c.rank, "card_id": card_id(c)}
-                for c in self.game.players[requesting_player_id].hand
-            ]
+        snapshot = dict(self.public_snapshot()[0])
+        hand = self.hand_overlay(requesting_player_id, role)
+        if hand is not None:
             snapshot["hand"] = hand
         return snapshot
 
+    def snapshot_data(self, requesting_player_id=None, role=None):
+        """build_snapshot encoded by the game's codec, reusing the cached encoding of the public part."""
+        public_data = self.public_snapshot()[1]
+        hand = self.hand_overlay(requesting_player_id, role)
+        return public_data if hand is None else self.codec.extend(public_data, "hand", self.codec.encode(hand))
+
+    def load(self):
+        """Resume the game from Redis: its last checkpoint, then the moves logged since."""
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.get(self.state_key())
+        pipe.lrange(self.log_key(), 0, -1)
+        saved, log = pipe.execute()
+        self.restore(saved, log)
+
+    def restore(self, saved: Optional[str], log: Iterable[str] = ()):
+        """Load a persisted checkpoint and replay the logged moves through the game's own methods."""
+        if saved:
+            self.load_state(json.loads(saved))
+        log = list(log or ())
+        for entry in log:
+            self.replay(json.loads(entry))
+        self.logged = len(log)
+
+    def replay(self, entry: list):
+        action_id, move, *args = entry
+        if move == "bid":
+            self.game.player_bid(*args)
+        elif move == "rank":
+            self.game.call_partner_rank(*args)
+        elif move == "suit":
+            self.game.call_partner_suit(*args)
+        elif move == "play":
+            self.game.play_card(args[0], card_from_id(args[1]))
+        elif move == "order":
+            self.game.players[args[0]].hand = [card_from_id(i) for i in args[1]]
+        else:
+            raise ValueError(f"unknown logged move {move!r}")
+        self.last_action_id = action_id
+
     def load_state(self, snapshot: dict):
-        """Hydrate game state from snapshot (minimal for restart)."""
+        """Hydrate game state from a checkpoint, or (minimally) from an older snapshot without the full game."""
         if not snapshot:
             return
+        if "snapshot" in snapshot or "game" in snapshot:
+            if "snapshot" in snapshot:
+                decode_game(base64.b64decode(snapshot["snapshot"]), self.game)
+            else:
+                self.game.restore_checkpoint(snapshot["game"])
+            self.initialized = self.game.state not in ("idle", "ready")
+            self.last_action_id = snapshot.get("last_action_id")
+            self.clients = snapshot.get("clients", {})
+            self.codec = negotiate(self.clients.values())
+            return
+        if snapshot.get("seed") is not None:
+            self.game.reseed(snapshot["seed"])
+        self.last_action_id = snapshot.get("last_action_id")
         self.game.state = snapshot.get("phase", self.game.state)
         self.game.current_player_id = snapshot.get("current_player_id", self.game.current_player_id)
         self.game.current_leader_id = snapshot.get("current_leader_id", self.game.current_leader_id)
@@ -115,8 +425,10 @@ class GameServer:
             self.game.partner = self.game.players[partner_id]
         self.game.partner_rank = snapshot.get("partner_rank")
         self.game.partner_suit = snapshot.get("trump_suit")
+        self.game.rehash()
 
-    def publish_event(self, payload: dict, action_id=None, player_id=None, role=None):
+    def publish_event(self, payload: dict, action_id=None, player_id=None, role=None, payload_data=None):
+        """Publish payload in an event envelope; payload_data, if given, is payload already encoded."""
         envelope = {
             "message_type": payload.get("message_type"),
             "game_id": self.game_id,
@@ -126,12 +438,20 @@ class GameServer:
             "ts": now_ms(),
             "version": PROTOCOL_VERSION,
             "origin": "game",
-            "payload": payload,
         }
         channel = f"{REDIS_PREFIX}.{self.game_id}.events"
-        self.redis.publish(channel, json.dumps(envelope))
+        codec = self.codec
+        if payload_data is None:
+            payload_data = codec.encode(payload)
+        self.writer.publish(channel, codec.extend(codec.encode(envelope), "payload", payload_data))
+        for tracker in self.beliefs.values():
+            tracker.on_event(payload)
 
-    def action_result(self, action_id, status, code=None, reason=None, effects=None, recovery=None, player_id=None, role=None):
+    def action_result(
+        self, action_id, status, code=None, reason=None, effects=None, recovery=None, player_id=None, role=None,
+        effects_data=None,
+    ):
+        """Publish an action.result; effects_data, if given, is the effects already encoded."""
         payload = {
             "message_type": "action.result",
             "action_id": action_id,
@@ -141,25 +461,67 @@ class GameServer:
             "effects": effects or {},
             "recovery": recovery,
         }
-        self.publish_event(payload, action_id=action_id, player_id=player_id, role=role)
+        payload_data = None
+        if effects_data is not None:
+            del payload["effects"]
+            payload_data = self.codec.extend(self.codec.encode(payload), "effects", effects_data)
+        self.publish_event(payload, action_id=action_id, player_id=player_id, role=role, payload_data=payload_data)
 
     def handle_action(self, envelope: dict):
+        """Handle one action, then the bot moves it leads to; each action's writes go out in one transaction."""
+        if self.pipe is not None:
+            self.apply_action(envelope)
+            return
+        self.begin_writes()
+        try:
+            self.apply_action(envelope)
+        finally:
+            self.flush_writes()
+        self.run_bots()
+
+    def apply_action(self, envelope: dict):
         self.heartbeat()
         payload = envelope.get("payload", {})
         action_id = envelope.get("action_id") or payload.get("action_id") or id_generator()
+        if not self._running_bots:  # bot moves belong to the action that triggered them
+            self.last_action_id = action_id
         player_id = envelope.get("player_id")
         role = envelope.get("role")
         mtype = payload.get("message_type")
 
         if not self.initialized:
             self.game.start_game()
-            self.game.deal_cards()
+            try:
+                self.game.deal_cards()
+            except ValueError as exc:  # no deal found that gives every hand MINIMUM_HAND_VALUE points
+                print(f"Could not deal game {self.game_id}: {exc}")
+                self.action_result(
+                    action_id,
+                    "error",
+                    code="deal_failed",
+                    reason=str(exc),
+                    recovery="retry",
+                    player_id=player_id,
+                    role=role,
+                )
+                return
             self.initialized = True
+            stats = self.game.deal_stats
+            print(f"Dealt game {self.game_id} in {stats['attempts']} shuffle(s), {stats['seconds'] * 1000:.3f} ms")
+            self.request_bid_advice()
+            self.beliefs = {seat: BeliefTracker(seat, self.game.players[seat].hand) for seat in self.bot_seats}
+            self.checkpoint_due = True  # the log's starting point: the dealt hands
+            self.persist_state()
 
+        if mtype == "join":
+            self.join_client(player_id, role, envelope.get("version"))
         if mtype in ["join", "sync"]:
-            snapshot = self.build_snapshot(requesting_player_id=player_id, role=role)
-            self.action_result(action_id, "ok", effects={"snapshot": snapshot}, player_id=player_id, role=role)
-            self.publish_event(snapshot, action_id=action_id, player_id=player_id, role=role)
+            # a reconnecting client costs its hand; the rest is encoded once per game state version
+            snapshot_data = self.snapshot_data(requesting_player_id=player_id, role=role)
+            effects_data = self.codec.extend(self.codec.encode({}), "snapshot", snapshot_data)
+            self.action_result(action_id, "ok", player_id=player_id, role=role, effects_data=effects_data)
+            self.publish_event({"message_type": "sync"}, action_id=action_id, player_id=player_id, role=role,
+                               payload_data=snapshot_data)
             return
 
         try:
@@ -194,6 +556,174 @@ class GameServer:
                 role=role,
             )
 
+    def join_client(self, player_id, role, version):
+        """Note the formats a joining client reads; the game's codec becomes one every joined client reads."""
+        key = f"{role}:{player_id}"
+        formats = client_formats(version)
+        if self.clients.get(key) == formats:
+            return
+        self.clients[key] = formats
+        self.codec = negotiate(self.clients.values())
+        self.checkpoint_due = True  # the clients' formats are persisted with the checkpoint
+        self.persist_state()
+
+    def run_bots(self):
+        """Make moves for bot seats until the game waits on a human seat (or is over)."""
+        if not self.bot_seats or self._running_bots:
+            return
+        if self.schedule_bot is not None:
+            self.request_bot_move()
+            return
+        self._running_bots = True
+        try:
+            for _ in range(MAX_BOT_MOVES):
+                envelope = self.next_bot_action()
+                if envelope is None:
+                    return
+                self.handle_action(envelope)
+        finally:
+            self._running_bots = False
+
+    def request_bot_move(self):
+        """Have a bot thread decide the next bot move on a copy of the game, if a bot seat has to act."""
+        seat = self.bot_to_act()
+        version = self.game.version
+        if seat is None or self.bot_pending == version:
+            return
+        self.bot_pending = version
+        # the shuffle pool is shared, not copied; the search never deals
+        game = copy.deepcopy(self.game, {id(self.game.shuffle_pool): self.game.shuffle_pool})
+        in_auction = game.state == "bid"
+        advice = self.bid_advice_for(seat) if in_auction else None
+        beliefs = None if in_auction else copy.deepcopy(self.beliefs_for(seat))
+
+        def decide(budget):
+            envelope = None
+            try:
+                player = self.bot or get_bot(budget)
+                envelope = self.bot_envelope(seat, self.bot_payload(game, seat, beliefs, advice, player))
+            except Exception as exc:  # defensive
+                print(f"Bot decision failed for seat {seat} in {self.game_id}: {exc!r}")
+            self.schedule_bot(BotMove(self, version, envelope))
+
+        submit_bot_decision(decide)
+
+    def handle_bot_move(self, move: BotMove):
+        """Make a bot move decided on a bot thread, unless the game has changed since (then decide again).
+
+        A decision that failed or was rejected is made again, up to BOT_RETRIES times; then the seat makes a
+        fallback move (the heuristic bot's), so a game of bots never stalls.
+        """
+        if move.server is not self or move.version != self.bot_pending:
+            return  # meant for a server this one replaced, or superseded
+        self.bot_pending = None
+        if move.version == self.game.version:
+            if move.envelope is not None:
+                self.make_bot_move(move.envelope)
+            if self.game.version == move.version:
+                self.bot_failures += 1
+                if self.bot_failures <= BOT_RETRIES:
+                    self.run_bots()
+                    return
+                print(f"Bot seat failed {self.bot_failures} times in {self.game_id}, making a fallback move")
+                self.make_bot_move(self.fallback_bot_action())
+                if self.game.version == move.version:
+                    return  # nothing legal to fall back on: the next action retries
+        self.bot_failures = 0
+        self.run_bots()
+
+    def make_bot_move(self, envelope: dict):
+        self._running_bots = True  # the move belongs to the action that triggered it
+        try:
+            self.handle_action(envelope)
+        finally:
+            self._running_bots = False
+
+    def fallback_bot_action(self):
+        """Envelope for a legal move by the heuristic bot (a pass, a random card) for the bot seat that has to act."""
+        seat = self.bot_to_act()
+        player = bot.Bot(seed=self.game.version, tables=get_tables())
+        return self.bot_envelope(seat, self.bot_payload(self.game, seat, player=player))
+
+    def next_bot_action(self):
+        """Envelope for the next bot decision, made now, or None if no bot seat has to act."""
+        seat = self.bot_to_act()
+        if seat is None:
+            return None
+        player = self.bot or get_bot()
+        if self.game.state == "bid":
+            advice = self.bid_advice_for(seat)
+            return self.bot_envelope(seat, self.bot_payload(self.game, seat, advice=advice, player=player))
+        return self.bot_envelope(seat, self.bot_payload(self.game, seat, self.beliefs_for(seat), player=player))
+
+    def bot_to_act(self):
+        """The bot seat the game is waiting on, or None."""
+        game = self.game
+        if game.state == "bid":
+            for seat in sorted(self.bot_seats):
+                player = game.players[seat]
+                if player.bid != -1 and player is not game.bid_winner:
+                    return seat
+            return None
+        seat = bot.seat_to_act(game)
+        return seat if seat in self.bot_seats else None
+
+    def bot_payload(self, game, seat, beliefs=None, advice=None, player=None):
+        """player's decision for seat (the game's bot if not given), as an action payload."""
+        player = player or self.bot
+        if game.state == "bid":
+            return {"message_type": "bid", "bid": player.choose_bid(game, seat, advice)}
+        if game.state == "call-partner-rank":
+            return {"message_type": "call-partner-rank", "partner_rank": player.choose_rank(game, seat)}
+        if game.state == "call-partner-suit":
+            return {"message_type": "call-partner-suit", "partner_suit": player.choose_suit(game, seat, beliefs)}
+        card = player.choose_card(game, seat, beliefs)
+        return {"message_type": "play", "card": {"suit": card.suit, "rank": card.rank}}
+
+    def beliefs_for(self, seat):
+        """Bot seat's belief tracker, rebuilt from the game if it has fallen out of step (e.g. after a restore)."""
+        tracker = self.beliefs.get(seat)
+        played = sum(len(p.original_hand) - len(p.hand) for p in self.game.players)
+        if tracker is None or tracker.plays != played:
+            tracker = self.beliefs[seat] = BeliefTracker.from_game(self.game, seat)
+        return tracker
+
+    def request_bid_advice(self):
+        """Start evaluating the bot seats' hands in the background as soon as they are dealt."""
+        if self.advisor is None:
+            return
+        for seat in self.bot_seats:
+            self.bid_advice[seat] = self.advisor.submit(self.game.players[seat].original_hand)
+
+    def bid_advice_for(self, seat):
+        """Advisor's evaluation of a bot seat's hand if it is ready; None (bid on the heuristic) rather than wait."""
+        if self.advisor is None:
+            return None
+        future = self.bid_advice.get(seat)
+        if future is None:
+            # e.g. a game restored mid-auction: use a cached evaluation, or start one for the seat's next bid
+            hand = self.game.players[seat].original_hand
+            advice = self.advisor.peek(hand)
+            if advice is not None:
+                return advice
+            future = self.bid_advice[seat] = self.advisor.submit(hand)
+        if not future.done() or future.cancelled() or future.exception() is not None:
+            return None
+        return future.result()
+
+    def bot_envelope(self, seat, payload):
+        return {
+            "message_type": payload["message_type"],
+            "game_id": self.game_id,
+            "action_id": id_generator(),
+            "player_id": seat,
+            "role": "bot",
+            "ts": now_ms(),
+            "version": PROTOCOL_VERSION,
+            "origin": "bot",
+            "payload": payload,
+        }
+
     def handle_bid(self, action_id, player_id, payload, role):
         if self.game.state != "bid":
             self.action_result(
@@ -208,7 +738,7 @@ class GameServer:
             return
         bid_val = payload.get("bid")
         state, winner_id, winning_bid = self.game.player_bid(player_id, bid_val)
-        self.persist_state()
+        self.record("bid", player_id, bid_val)
         effects = {"state": state, "winner_id": winner_id, "winning_bid": winning_bid}
         self.action_result(action_id, "ok", effects=effects, player_id=player_id, role=role)
         self.publish_event(
@@ -236,7 +766,7 @@ class GameServer:
             return
         partner_rank = payload.get("partner_rank")
         state, partner_rank = self.game.call_partner_rank(partner_rank)
-        self.persist_state()
+        self.record("rank", partner_rank)
         effects = {"state": state, "partner_rank": partner_rank}
         self.action_result(action_id, "ok", effects=effects, player_id=player_id, role=role)
         self.publish_event(
@@ -260,7 +790,7 @@ class GameServer:
             return
         partner_suit = payload.get("partner_suit")
         state, partner_suit, partner_id = self.game.call_partner_suit(partner_suit)
-        self.persist_state()
+        self.record("suit", partner_suit)
         effects = {"state": state, "partner_suit": partner_suit, "partner_id": partner_id}
         self.action_result(action_id, "ok", effects=effects, player_id=player_id, role=role)
         self.publish_event(
@@ -296,9 +826,11 @@ class GameServer:
                 role=role,
             )
             return
-        card_payload = payload.get("card")
-        card_obj = card_from_payload(card_payload)
-        if card_obj not in self.game.players[player_id].hand:
+        try:
+            card_obj = card_from_payload(payload.get("card") or {})
+        except ValueError:
+            card_obj = None
+        if card_obj is None or not self.game.players[player_id].has_card(card_obj):
             self.action_result(
                 action_id,
                 "error",
@@ -310,7 +842,9 @@ class GameServer:
             )
             return
         state, _, _ = self.game.play_card(player_id, card_obj)
-        self.persist_state()
+        self.record("play", player_id, card_obj.card_id)
+        # a completed trick has already been moved to last_trick by the game
+        trick_cards = self.game.last_trick if state == "trick-won" else self.game.current_trick
         trick_event = {
             "message_type": "trick.played",
             "game_id": self.game_id,
@@ -318,7 +852,7 @@ class GameServer:
             "card": {"suit": card_obj.suit, "rank": card_obj.rank},
             "trick": [
                 {"player_id": pid, "card": {"suit": c.suit, "rank": c.rank}}
-                for c, pid in self.game.current_trick
+                for c, pid in trick_cards
             ],
             "current_player_id": self.game.current_player_id,
         }
@@ -328,8 +862,9 @@ class GameServer:
         self.action_result(action_id, "ok", effects={"state": state}, player_id=player_id, role=role)
 
     def emit_trick_won(self, action_id, player_id, role):
-        trick_cards = self.game.current_trick
-        _, winner_id = trick_winner(trick_cards, self.game.partner_suit)
+        # the game resolved the trick as it was played; reuse its result
+        trick_cards = self.game.last_trick
+        winner_id = self.game.last_trick_winner_id
         points = sum(c.value for c, _ in trick_cards)
         scores = [{"player_id": p.id, "points": p.points} for p in self.game.players]
         event = {
@@ -345,26 +880,31 @@ class GameServer:
             "current_player_id": self.game.current_player_id,
         }
         self.publish_event(event, action_id=action_id, player_id=player_id, role=role)
-        self.persist_state()
 
     def handle_reorder(self, action_id, player_id, payload, role):
         new_order = payload.get("hand", [])
         player = self.game.players[player_id]
         ordered = []
+        placed = 0  # mask of cards already in the new order
         # Build card objects based on provided order
         for entry in new_order:
-            if isinstance(entry, dict):
-                c = card_from_payload(entry)
-            else:
-                c = card_from_id(entry)
-            if c in player.hand and c not in ordered:
+            try:
+                if isinstance(entry, dict):
+                    c = card_from_payload(entry)
+                else:
+                    c = card_from_id(entry)
+            except ValueError:
+                continue
+            bit = 1 << c.card_id
+            if player.hand_mask & bit and not placed & bit:
                 ordered.append(c)
+                placed |= bit
         # append any remaining cards not specified
         for c in player.hand:
-            if c not in ordered:
+            if not placed & (1 << c.card_id):
                 ordered.append(c)
         player.hand = ordered
-        self.persist_state()
+        self.record("order", player_id, [c.card_id for c in ordered])
         hand_event = {
             "message_type": "hand.update",
             "game_id": self.game_id,
@@ -387,49 +927,190 @@ class GameServer:
 class BriscolaService:
     """Creates/manages per-game servers; per-game servers handle Redis IO themselves."""
 
-    def __init__(self):
-        self.redis = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+    def __init__(self, redis_client: Optional[redis.Redis] = None, game_filter: Optional[Callable[[str], bool]] = None):
+        self.redis = redis_client or make_redis_client()
         self.servers: Dict[str, GameServer] = {}
+        self.queues: Dict[str, queue.Queue] = {}  # per game, fed by the one pattern subscription
         self.threads: Dict[str, threading.Thread] = {}
+        self.stopping: Set[str] = set()  # games whose worker has been asked to stop for a restart
+        self.lock = threading.Lock()  # creating, restarting and dropping servers
         self.stop_event = threading.Event()
+        self.game_filter = game_filter  # set on a shard worker: the games it serves
+        self.leases = LeaseManager(self.redis, GAME_LEASE_TTL_MS, REDIS_PREFIX) if GAME_LEASES else None
+        self.write_behind = WriteBehind() if PERSIST_MODE == "write-behind" else None
 
-    def ensure_server(self, game_id: str):
-        server = GameServer(game_id, self.redis)
+    def restore_games(self):
+        """Start a server for every persisted game this service serves (a restarted shard worker's games)."""
+        restored = 0
+        for key in self.redis.scan_iter(match=f"{REDIS_PREFIX}:*:state", count=1000):
+            game_id = key[len(REDIS_PREFIX) + 1:-len(":state")]
+            if game_id not in self.servers and (self.game_filter is None or self.game_filter(game_id)):
+                restored += self.ensure_server(game_id)
+        return restored
+
+    def ensure_server(self, game_id: str, restart: bool = False) -> bool:
+        """Start the game's server from its persisted state unless one is running; False if leased elsewhere."""
+        # restart: replace the running server (the heartbeat monitor's recovery), once its worker has stopped
+        if restart and not self.stop_worker(game_id):
+            print(f"Worker for {game_id} is still busy, restarting it later")
+            return True
+        with self.lock:
+            thread = self.threads.get(game_id)
+            if not restart and game_id in self.servers and thread is not None and thread.is_alive():
+                return True
+            return self.start_server(game_id)
+
+    def stop_worker(self, game_id: str) -> bool:
+        """Have the game's worker handle the actions queued ahead, write its pending state and exit.
+
+        False if it has not stopped within HEARTBEAT_INTERVAL (it still will, at its sentinel).
+        """
+        thread, work = self.threads.get(game_id), self.queues.get(game_id)
+        if thread is None or not thread.is_alive():
+            server = self.servers.get(game_id)
+            if server is not None:
+                server.flush_state()  # no worker left to change the game meanwhile
+            return True
+        if game_id not in self.stopping:  # asked once: a second sentinel would stop the replacement too
+            self.stopping.add(game_id)
+            work.put(FLUSH_STATE)
+            work.put(None)
+        thread.join(HEARTBEAT_INTERVAL)
+        return not thread.is_alive()
+
+    def start_server(self, game_id: str) -> bool:
+        if self.leases is not None and not self.leases.acquire(game_id):
+            return False
+        server = GameServer(
+            game_id,
+            self.redis,
+            bot_seats=BOT_SEATS,
+            advisor=get_advisor() if BOT_SEATS else None,
+            write_behind=self.write_behind,
+            schedule_bot=lambda move: self.queue_bot_move(game_id, move),
+        )
         # Attempt to load persisted state
-        snap_key = f"{REDIS_PREFIX}:{game_id}:state"
         try:
-            saved = self.redis.get(snap_key)
-            if saved:
-                server.load_state(json.loads(saved))
+            server.load()
         except Exception as e:
             print(f"Failed to load snapshot for {game_id}: {e}")
-        thread = threading.Thread(target=self.server_loop, args=(server,), daemon=True)
+        # a restarted game keeps its queue: the actions queued after the old worker's sentinel are the new one's
+        work = self.queues.get(game_id) or queue.Queue()
+        thread = threading.Thread(target=self.server_loop, args=(server, work), daemon=True)
         self.servers[game_id] = server
+        self.queues[game_id] = work
         self.threads[game_id] = thread
+        self.stopping.discard(game_id)
         thread.start()
+        return True
 
-    def server_loop(self, server: GameServer):
-        pubsub = self.redis.pubsub()
-        channel = f"{REDIS_PREFIX}.{server.game_id}.actions"
-        pubsub.subscribe(channel)
-        print(f"Game server {server.game_id} listening on {channel}")
-        for msg in pubsub.listen():
-            if msg["type"] != "message":
-                continue
+    def queue_bot_move(self, game_id: str, move: BotMove):
+        work = self.queues.get(game_id)
+        if work is not None:
+            work.put(move)
+
+    def drop_server(self, game_id: str):
+        """Forget a game this node has lost the lease on; its server loop exits at its next action."""
+        print(f"Lost the lease on {game_id}, dropping its server")
+        with self.lock:
+            self.servers.pop(game_id, None)
+            self.threads.pop(game_id, None)
+            work = self.queues.pop(game_id, None)
+        if work is not None:
+            work.put(None)
+
+    def owns(self, server: GameServer) -> bool:
+        """Whether server is still this node's server for its game (checked before every action)."""
+        if self.servers.get(server.game_id) is not server:
+            return False
+        if self.leases is None or self.leases.holds(server.game_id):
+            return True
+        # renewals running late: extend the lease now if it is still ours
+        if self.leases.acquire(server.game_id):
+            return True
+        self.drop_server(server.game_id)
+        return False
+
+    def server_loop(self, server: GameServer, work: queue.Queue):
+        server.heartbeat()
+        server.run_bots()  # a restored game may be waiting on a bot seat
+        while True:
+            try:
+                data = work.get(timeout=HEARTBEAT_INTERVAL)
+            except queue.Empty:
+                data = HEARTBEAT
+            if data is None:
+                return
             try:
-                envelope = json.loads(msg["data"])
-                server.handle_action(envelope)
+                if not self.owns(server):
+                    return
+                if data is HEARTBEAT:
+                    server.heartbeat()  # idle but responsive: only a stuck or dead worker lets its heartbeat lapse
+                elif data is FLUSH_STATE:
+                    server.flush_state()
+                elif isinstance(data, BotMove):
+                    server.handle_bot_move(data)
+                else:
+                    server.handle_action(decode_message(data))
             except Exception as exc:  # defensive
                 print(f"Error handling action for {server.game_id}: {exc}")
 
-    def run(self):
-        action_thread = threading.Thread(target=self.monitor_actions, daemon=True)
-        heartbeat_thread = threading.Thread(target=self.monitor_heartbeats, daemon=True)
-        action_thread.start()
-        heartbeat_thread.start()
-        action_thread.join()
+    def flush_dirty_games(self):
+        """Write-behind flusher: queue a snapshot write for every game that is due one."""
+        while not self.stop_event.is_set():
+            self.write_behind.wait(HEARTBEAT_INTERVAL)
+            for game_id in self.write_behind.take_due():
+                work = self.queues.get(game_id)
+                if work is not None:
+                    work.put(FLUSH_STATE)
+
+    def flush_all_states(self):
+        """Have every game's worker write what it left to the write-behind flusher, and stop (on shutdown)."""
+        for game_id in list(self.servers):
+            try:
+                if not self.stop_worker(game_id):
+                    print(f"Worker for {game_id} did not stop, its pending state is not written")
+            except Exception as exc:  # defensive
+                print(f"Error writing state for {game_id}: {exc}")
+
+    def stop(self, signum=None, frame=None):
+        """SIGTERM/SIGINT handler: stop taking actions; run() then writes pending state and releases the leases."""
+        self.stop_event.set()
+
+    def run(self, restore: bool = False):
+        """Serve until SIGTERM or SIGINT (or the subscription ends), then shut down cleanly."""
+        # without a handler, SIGTERM kills the process (python is PID 1 in the image) before the finally runs
+        handlers = {}
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                handlers[signum] = signal.signal(signum, self.stop)
+        try:
+            if restore:
+                print(f"Restored {self.restore_games()} game(s)")
+            action_thread = threading.Thread(target=self.monitor_actions, daemon=True)
+            heartbeat_thread = threading.Thread(target=self.monitor_heartbeats, daemon=True)
+            action_thread.start()
+            heartbeat_thread.start()
+            if self.write_behind is not None:
+                threading.Thread(target=self.flush_dirty_games, daemon=True).start()
+            while action_thread.is_alive():
+                if self.stop_event.wait(1.0):
+                    break
+        finally:
+            self.stop_event.set()
+            self.flush_all_states()
+            self.release_leases()
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+
+    def release_leases(self):
+        """Hand this node's games over now rather than when their leases expire."""
+        if self.leases is not None:
+            for game_id in list(self.servers):
+                self.leases.release(game_id)
 
     def monitor_actions(self):
+        """The node's one subscription: route each action by its channel name to its game's queue."""
         pubsub = self.redis.pubsub()
         pubsub.psubscribe(f"{REDIS_PREFIX}.*.actions")
         print("Game service monitoring pattern game.*.actions")
@@ -438,47 +1119,93 @@ class BriscolaService:
                 break
             if msg["type"] not in ("message", "pmessage"):
                 continue
+            game_id = game_id_from_channel(msg.get("channel") or "")
+            if not game_id:
+                continue
+            if self.game_filter is not None and not self.game_filter(game_id):
+                continue  # another shard's game
             try:
-                envelope = json.loads(msg["data"])
-                game_id = envelope.get("game_id")
-                if not game_id:
-                    continue
-                first_time = game_id not in self.servers
-                self.ensure_server(game_id)
-                if first_time:
-                    # re-publish the first message so the new server can consume it
-                    channel = f"{REDIS_PREFIX}.{game_id}.actions"
-                    self.redis.publish(channel, json.dumps(envelope))
+                work = self.queues.get(game_id)
+                if work is None:
+                    if not self.ensure_server(game_id):
+                        continue  # another node serves the game
+                    work = self.queues[game_id]
+                work.put(msg["data"])
             except Exception as exc:  # defensive
                 print(f"Error monitoring actions: {exc}")
 
     def monitor_heartbeats(self, once: bool = False):
-        """Monitor heartbeat keys and thread liveness; restart servers when needed."""
+        """Renew this node's leases; restart servers whose worker has died or stopped writing its heartbeat."""
         while not self.stop_event.is_set():
+            if self.leases is not None:
+                for game_id in self.leases.renew(list(self.servers.keys())):
+                    self.drop_server(game_id)
             for game_id in list(self.servers.keys()):
                 key = f"{REDIS_PREFIX}:{game_id}:heartbeat"
                 ttl = self.redis.ttl(key)
                 thread_alive = self.threads.get(game_id) and self.threads[game_id].is_alive()
                 if (ttl == -2 or (ttl is not None and ttl <= 0)) or not thread_alive:
                     print(f"Heartbeat or thread failed for {game_id}, restarting server")
-                    self.ensure_server(game_id)
+                    if not self.ensure_server(game_id, restart=True):
+                        self.drop_server(game_id)
             if once:
                 break
             time.sleep(HEARTBEAT_INTERVAL)
+
+
+def check_deal_settings():
+    """Fail fast when hands of MINIMUM_HAND_VALUE points cannot be dealt (within the shuffles a deal may take)."""
+    try:
+        deck.Deck().deal_valid_hands(MINIMUM_HAND_VALUE)
+    except ValueError as exc:
+        raise SystemExit(f"MINIMUM_HAND_VALUE={MINIMUM_HAND_VALUE} cannot be dealt: {exc}")
+
+
+def make_redis_client() -> redis.Redis:
+    """Client over a bounded pool: game threads block for a free connection rather than each opening one."""
+    # replies are text, but compact (binary) actions survive the decoding: see briscola_codec
+    pool = redis.BlockingConnectionPool.from_url(
+        REDIS_URL, decode_responses=True, encoding_errors=ENCODING_ERRORS, max_connections=REDIS_POOL_SIZE
+    )
+    return redis.Redis(connection_pool=pool)
+
+
+def game_id_from_channel(channel: str) -> str:
+    """game.<id>.actions -> <id>"""
+    return channel[len(REDIS_PREFIX) + 1:channel.rfind(".")]
+
+
 def card_id(card: deck.Card):
-    suit_index = deck.suits.index(card.suit)
-    return suit_index * 10 + (card.rank - 1)
+    return card.card_id
 
 
 def card_from_id(card_id_val: int) -> deck.Card:
-    suit_index = card_id_val // 10
-    rank = (card_id_val % 10) + 1
-    return deck.Card(deck.suits[suit_index], rank)
+    return deck.card_from_id(card_id_val)
 
 
 def card_from_payload(data: dict) -> deck.Card:
-    return deck.Card(data["suit"], int(data["rank"]))
+    """Resolve a {suit, rank} (or card_id) payload to the interned card; raises ValueError if invalid."""
+    try:
+        if "card_id" in data:
+            return deck.card_from_id(data["card_id"])
+        return deck.Card(data["suit"], int(data["rank"]))
+    except (KeyError, TypeError) as exc:
+        raise ValueError(f"invalid card payload {data!r}") from exc
 
 
 if __name__ == "__main__":
-    BriscolaService().run()
+    check_deal_settings()
+    if SERVICE_TRANSPORT == "streams":
+        from briscola_streams import StreamsBriscolaService
+
+        StreamsBriscolaService().run()
+    elif SERVICE_WORKERS > 1:
+        from briscola_sharding import ShardSupervisor
+
+        ShardSupervisor(SERVICE_WORKERS).run()
+    elif SERVICE_MODE == "asyncio":
+        from briscola_async_service import AsyncBriscolaService
+
+        AsyncBriscolaService().run()
+    else:
+        BriscolaService().run()
@@ -0,0 +1,147 @@
+"""Sharded service: a supervisor process and N worker processes, each serving its own subset of games.
+
+Games are assigned to workers by consistent hashing of the game id, so every worker can tell from an action's
+channel name alone whether the game is its own, without any routing hop through the supervisor. Every worker runs
+an ordinary service (SERVICE_MODE threaded or asyncio) restricted to its games. When a worker dies the supervisor
+starts a replacement for the same shard, which restarts the shard's games from their persisted game:<id>:state.
+
+On SIGTERM the supervisor sends SIGTERM on to the workers, whose services write their games' pending state and
+release their leases before exiting; a worker still running after SHARD_STOP_TIMEOUT_SECONDS is killed.
+
+Selected with SERVICE_WORKERS > 1.
+"""
+import bisect
+import hashlib
+import os
+import signal
+import socket
+import threading
+import time
+from multiprocessing import get_context
+from typing import Callable, Dict, Iterable, Optional
+
+from briscola_service import SERVICE_MODE
+
+# docker stop waits 10 s before SIGKILL: leave the workers most of that to flush and release their leases
+SHARD_STOP_TIMEOUT = float(os.environ.get("SHARD_STOP_TIMEOUT_SECONDS", 8))
+
+
+class HashRing:
+    """Consistent hash ring: each node owns the keys hashing just below its virtual points."""
+
+    def __init__(self, nodes: Iterable[str], replicas: int = 128):
+        self.points = []
+        self.owners = []
+        for point, node in sorted((self.hash(f"{node}#{i}"), node) for node in nodes for i in range(replicas)):
+            self.points.append(point)
+            self.owners.append(node)
+
+    @staticmethod
+    def hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def node_for(self, key: str) -> str:
+        i = bisect.bisect(self.points, self.hash(key))
+        return self.owners[i % len(self.owners)]
+
+
+def shard_name(index: int) -> str:
+    return f"shard-{index}"
+
+
+def shard_filter(index: int, workers: int) -> Callable[[str], bool]:
+    """Predicate for the game ids shard index of workers serves."""
+    ring = HashRing(shard_name(i) for i in range(workers))
+    name = shard_name(index)
+    return lambda game_id: ring.node_for(game_id) == name
+
+
+def serve_shard(index: int, workers: int, mode: str, restore: bool):
+    """Worker process body: run a service for one shard until SIGTERM (or SIGINT) stops it."""
+    # not the supervisor's handler, inherited through fork: the service's run() installs its own clean stop
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    owns = shard_filter(index, workers)
+    # the same lease owner name across restarts, so a replacement worker takes its games' leases straight back
+    base = os.environ.get("SERVICE_NODE_ID") or f"{socket.gethostname()}-{os.getppid()}"
+    os.environ["SERVICE_NODE_ID"] = f"{base}-{shard_name(index)}"
+    print(f"Shard worker {index}/{workers} starting ({mode})")
+    if mode == "asyncio":
+        from briscola_async_service import AsyncBriscolaService
+
+        AsyncBriscolaService(game_filter=owns).run(restore=restore)
+    else:
+        from briscola_service import BriscolaService
+
+        BriscolaService(game_filter=owns).run(restore=restore)
+
+
+class ShardSupervisor:
+    """Starts one worker process per shard and replaces any that exits."""
+
+    def __init__(
+        self,
+        workers: int,
+        mode: str = SERVICE_MODE,
+        start_method: str = "fork",
+        check_interval: float = 1.0,
+        target: Optional[Callable] = None,
+        stop_timeout: float = SHARD_STOP_TIMEOUT,
+    ):
+        self.workers = workers
+        self.mode = mode
+        self.context = get_context(start_method)
+        self.check_interval = check_interval
+        self.target = target or serve_shard
+        self.stop_timeout = stop_timeout
+        self.processes: Dict[int, object] = {}
+        self.restarts = 0
+        self.stop_event = threading.Event()
+
+    def start_worker(self, index: int, restore: bool = False):
+        proc = self.context.Process(
+            target=self.target,
+            args=(index, self.workers, self.mode, restore),
+            name=f"briscola-{shard_name(index)}",
+        )
+        proc.start()
+        self.processes[index] = proc
+
+    def start(self):
+        for index in range(self.workers):
+            self.start_worker(index)
+
+    def check(self):
+        """Replace dead workers; the replacement reloads the shard's persisted games. Returns restarted shards."""
+        restarted = []
+        for index, proc in list(self.processes.items()):
+            if not proc.is_alive():
+                print(f"Shard worker {index} exited with {proc.exitcode}, restarting")
+                proc.join()
+                self.start_worker(index, restore=True)
+                self.restarts += 1
+                restarted.append(index)
+        return restarted
+
+    def stop(self):
+        """SIGTERM every worker so it stops cleanly; kill those still running after stop_timeout."""
+        self.stop_event.set()
+        for proc in self.processes.values():
+            if proc.is_alive():
+                proc.terminate()
+        deadline = time.monotonic() + self.stop_timeout
+        for index, proc in self.processes.items():
+            proc.join(max(deadline - time.monotonic(), 0))
+            if proc.is_alive():
+                print(f"Shard worker {index} did not stop within {self.stop_timeout}s, killing it")
+                proc.kill()
+                proc.join()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stop_event.set())
+        self.start()
+        try:
+            while not self.stop_event.is_set():
+                self.check()
+                time.sleep(self.check_interval)
+        finally:
+            self.stop()
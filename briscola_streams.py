@@ -0,0 +1,293 @@
+"""Redis Streams transport: actions are read from partitioned streams through a consumer group.
+
+Unlike pubsub, a stream keeps an action until it is acknowledged, so nothing is lost while a game restarts and
+several service nodes can share the load. A game's actions go to stream game:actions:<partition>, the partition
+being a stable hash of the game id, so one game's actions stay in order on one stream. Each node consumes the
+partitions a consistent hash ring over the live nodes assigns to it (a node name is also its consumer name in the
+group), reading new entries with batched XREADGROUP.
+
+Nodes are live while they keep their entry in the <prefix>:stream-nodes:<group> sorted set fresh, which they do
+every STREAM_NODE_REFRESH_MS; one not seen for STREAM_NODE_TTL_MS is dropped from the ring, so its partitions pass
+to the surviving nodes, which read their new entries and claim the ones it left pending. A node that loses a
+partition (e.g. to a node that joined) drops its servers for the partition's games, since another node now changes
+them. The STREAM_NODES a node is configured with count as live for its first STREAM_NODE_TTL_MS, so nodes started
+together do not each take every partition before they have seen one another.
+
+An entry is acknowledged only after its game server has handled it, which includes persisting the resulting
+state, so an action is never acknowledged before its effect is durable. On start a node first re-reads its own
+pending entries (delivered to it before it stopped, never acknowledged), then periodically claims entries another
+consumer has left pending for longer than STREAM_CLAIM_IDLE_MS. A redelivered action whose id matches the one the
+persisted state already follows is acknowledged without being handled again.
+
+Producers add actions with add_action. Selected with SERVICE_TRANSPORT=streams.
+"""
+import json
+import os
+import queue
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import redis
+
+from briscola_codec import decode as decode_message
+from briscola_service import (
+    BOT_SEATS,
+    REDIS_PREFIX,
+    BotMove,
+    GameServer,
+    get_advisor,
+    make_redis_client,
+    now_ms,
+)
+from briscola_sharding import HashRing
+
+STREAM_PARTITIONS = int(os.environ.get('STREAM_PARTITIONS', 16))
+STREAM_GROUP = os.environ.get('STREAM_GROUP', 'briscola')
+STREAM_NODES = [n.strip() for n in os.environ.get('STREAM_NODES', 'node-0').split(',') if n.strip()]
+STREAM_NODE = os.environ.get('STREAM_NODE', STREAM_NODES[0])
+STREAM_BATCH = int(os.environ.get('STREAM_BATCH', 128))  # entries per XREADGROUP
+STREAM_BLOCK_MS = int(os.environ.get('STREAM_BLOCK_MS', 1000))
+STREAM_CLAIM_IDLE_MS = int(os.environ.get('STREAM_CLAIM_IDLE_MS', 30000))
+STREAM_MAXLEN = int(os.environ.get('STREAM_MAXLEN', 100000))  # approximate cap per partition stream
+STREAM_NODE_TTL_MS = int(os.environ.get('STREAM_NODE_TTL_MS', 10000))  # a node not seen for this long is dead
+STREAM_NODE_REFRESH_MS = int(os.environ.get('STREAM_NODE_REFRESH_MS', 2000))
+
+Entry = Tuple[str, str, dict, bool]  # stream, entry id, envelope, redelivered
+
+
+def partition_for(game_id: str, partitions: int = STREAM_PARTITIONS) -> int:
+    return zlib.crc32(game_id.encode()) % partitions
+
+
+def stream_key(partition: int) -> str:
+    return f"{REDIS_PREFIX}:actions:{partition}"
+
+
+def add_action(client: redis.Redis, envelope: dict, partitions: int = STREAM_PARTITIONS, maxlen: int = STREAM_MAXLEN):
+    """Queue an action envelope on its game's partition stream; returns the entry id."""
+    key = stream_key(partition_for(envelope["game_id"], partitions))
+    return client.xadd(key, {"data": json.dumps(envelope)}, maxlen=maxlen, approximate=True)
+
+
+class StreamsBriscolaService:
+    """Creates/manages per-game servers fed from the partition streams this node consumes."""
+
+    def __init__(
+        self,
+        redis_client: Optional[redis.Redis] = None,
+        node: str = STREAM_NODE,
+        nodes: Iterable[str] = STREAM_NODES,
+        partitions: int = STREAM_PARTITIONS,
+        group: str = STREAM_GROUP,
+    ):
+        self.redis = redis_client or make_redis_client()
+        self.node = node
+        self.group = group
+        self.partitions = partitions
+        self.nodes = list(nodes)
+        self.started = now_ms()
+        self.streams = self.assigned(nodes)
+        self.servers: Dict[str, GameServer] = {}
+        self.queues: Dict[str, queue.Queue] = {}
+        self.threads: Dict[str, threading.Thread] = {}
+        self.inflight: Set[Tuple[str, str]] = set()  # (stream, entry id) queued or being handled here
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    def nodes_key(self) -> str:
+        return f"{REDIS_PREFIX}:stream-nodes:{self.group}"
+
+    def assigned(self, nodes: Iterable[str]) -> List[str]:
+        """The partition streams the ring over nodes assigns to this node."""
+        ring = HashRing(set(nodes) | {self.node})
+        return [stream_key(p) for p in range(self.partitions) if ring.node_for(stream_key(p)) == self.node]
+
+    def live_nodes(self) -> List[str]:
+        """Mark this node live and return every node seen within STREAM_NODE_TTL_MS."""
+        now = now_ms()
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.zadd(self.nodes_key(), {self.node: now})
+        pipe.zremrangebyscore(self.nodes_key(), 0, now - STREAM_NODE_TTL_MS)
+        pipe.zrange(self.nodes_key(), 0, -1)
+        return pipe.execute()[-1]
+
+    def rebalance(self) -> bool:
+        """Take the partitions the ring over the live nodes assigns to this node; True if they changed."""
+        nodes = set(self.live_nodes())
+        if now_ms() - self.started < STREAM_NODE_TTL_MS:
+            nodes.update(self.nodes)
+        streams = self.assigned(nodes)
+        if streams == self.streams:
+            return False
+        lost = set(self.streams) - set(streams)
+        self.streams = streams
+        if lost:
+            self.release_partitions(lost)
+        self.ensure_groups()
+        print(f"Streams service {self.node} now consuming {len(self.streams)} partition(s)")
+        return True
+
+    def release_partitions(self, streams: Set[str]):
+        """Drop the servers of games on partitions another node now consumes, with their queued entries."""
+        # the entries stay pending in the group: the partition's new consumer claims them
+        with self.lock:
+            self.inflight = {(stream, entry_id) for stream, entry_id in self.inflight if stream not in streams}
+        for game_id in [g for g in self.servers if stream_key(partition_for(g, self.partitions)) in streams]:
+            self.servers.pop(game_id)
+            work = self.queues.pop(game_id)
+            while not work.empty():
+                work.get_nowait()
+            work.put(None)
+            thread = self.threads.pop(game_id, None)
+            if thread is not None:
+                thread.join(STREAM_BLOCK_MS / 1000)  # let an action being handled finish first
+
+    def ensure_groups(self):
+        for key in self.streams:
+            try:
+                # from the start of the stream: actions added before the group existed are served too
+                self.redis.xgroup_create(key, self.group, id="0", mkstream=True)
+            except redis.ResponseError as exc:
+                if "BUSYGROUP" not in str(exc):
+                    raise
+
+    def ensure_server(self, game_id: str):
+        server = GameServer(
+            game_id,
+            self.redis,
+            bot_seats=BOT_SEATS,
+            advisor=get_advisor() if BOT_SEATS else None,
+            schedule_bot=lambda move: self.queues[game_id].put((None, None, move, False)),
+        )
+        try:
+            server.load()
+        except Exception as e:
+            print(f"Failed to load snapshot for {game_id}: {e}")
+        self.servers[game_id] = server
+        self.queues.setdefault(game_id, queue.Queue())
+        self.start_worker(game_id)
+
+    def start_worker(self, game_id: str):
+        thread = threading.Thread(target=self.server_loop, args=(game_id,), daemon=True)
+        self.threads[game_id] = thread
+        thread.start()
+
+    def server_loop(self, game_id: str):
+        work = self.queues[game_id]
+        self.servers[game_id].run_bots()  # a restored game may be waiting on a bot seat
+        while not self.stop_event.is_set():
+            entry = work.get()
+            if entry is None:  # the game's partition has passed to another node
+                return
+            self.handle(game_id, entry)
+
+    def handle(self, game_id: str, entry: Entry):
+        """Handle one entry and acknowledge it; an entry whose handling raised stays pending for a later claim."""
+        stream, entry_id, envelope, redelivered = entry
+        server = self.servers[game_id]
+        if isinstance(envelope, BotMove):  # not a stream entry: nothing to acknowledge
+            try:
+                server.handle_bot_move(envelope)
+            except Exception as exc:  # defensive
+                print(f"Error making a bot move for {game_id}: {exc}")
+            return
+        try:
+            action_id = envelope.get("action_id")
+            if not (redelivered and action_id and action_id == server.last_action_id):
+                server.handle_action(envelope)  # persists the state the action produces
+            self.redis.xack(stream, self.group, entry_id)
+        except Exception as exc:  # defensive
+            print(f"Error handling action {entry_id} for {game_id}: {exc}")
+        finally:
+            with self.lock:
+                self.inflight.discard((stream, entry_id))
+
+    def dispatch(self, stream: str, entries: List[Tuple[str, Optional[dict]]], redelivered: bool = False) -> int:
+        """Queue entries on their games' servers; returns how many were queued."""
+        queued = 0
+        for entry_id, fields in entries:
+            with self.lock:
+                if (stream, entry_id) in self.inflight:
+                    continue
+            try:
+                envelope = decode_message(fields["data"]) if fields else None
+            except ValueError:
+                envelope = None
+            game_id = envelope.get("game_id") if envelope else None
+            if not game_id:
+                # trimmed away or malformed: nothing will ever handle it
+                self.redis.xack(stream, self.group, entry_id)
+                continue
+            with self.lock:
+                self.inflight.add((stream, entry_id))
+            if game_id not in self.servers:
+                self.ensure_server(game_id)
+            self.queues[game_id].put((stream, entry_id, envelope, redelivered))
+            queued += 1
+        return queued
+
+    def read_pending(self) -> int:
+        """Re-deliver this consumer's own unacknowledged entries (read before a restart)."""
+        queued = 0
+        for key in self.streams:
+            start = "0"
+            while True:
+                response = self.redis.xreadgroup(self.group, self.node, {key: start}, count=STREAM_BATCH)
+                entries = response[0][1] if response else []
+                if not entries:
+                    break
+                queued += self.dispatch(key, entries, redelivered=True)
+                start = entries[-1][0]
+                if len(entries) < STREAM_BATCH:
+                    break
+        return queued
+
+    def claim_stale(self, min_idle_ms: int = STREAM_CLAIM_IDLE_MS) -> int:
+        """Take over entries other consumers have left unacknowledged for min_idle_ms."""
+        queued = 0
+        for key in self.streams:
+            start = "0-0"
+            while True:
+                next_start, entries, *_ = self.redis.xautoclaim(
+                    key, self.group, self.node, min_idle_ms, start_id=start, count=STREAM_BATCH
+                )
+                queued += self.dispatch(key, entries, redelivered=True)
+                if next_start in ("0-0", b"0-0"):
+                    break
+                start = next_start
+        return queued
+
+    def poll(self, block_ms: Optional[int] = STREAM_BLOCK_MS) -> int:
+        """Read up to STREAM_BATCH new entries per partition in one XREADGROUP and queue them."""
+        if not self.streams:
+            time.sleep((block_ms or 0) / 1000)
+            return 0
+        response = self.redis.xreadgroup(
+            self.group, self.node, {key: ">" for key in self.streams}, count=STREAM_BATCH, block=block_ms
+        )
+        return sum(self.dispatch(key, entries) for key, entries in response or [])
+
+    def run(self):
+        self.rebalance()
+        self.ensure_groups()
+        print(f"Streams service {self.node} consuming {len(self.streams)} partition(s) as group {self.group}")
+        print(f"Re-delivered {self.read_pending()} pending action(s)")
+        last_claim = last_refresh = time.time()
+        while not self.stop_event.is_set():
+            now = time.time()
+            if now - last_refresh >= STREAM_NODE_REFRESH_MS / 1000:
+                try:
+                    self.rebalance()
+                except redis.ConnectionError as exc:
+                    print(f"Error refreshing stream nodes: {exc}")
+                last_refresh = now
+            if now - last_claim >= STREAM_CLAIM_IDLE_MS / 2000:
+                self.claim_stale()
+                last_claim = now
+            try:
+                self.poll()
+            except redis.ConnectionError as exc:
+                print(f"Error reading actions: {exc}")
+                time.sleep(1)
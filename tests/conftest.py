@@ -1,5 +1,10 @@
-import json
+import fnmatch
+import time
+
 import pytest
+import redis
+
+from briscola_codec import decode
 
 
 class DummyRedis:
@@ -10,6 +15,9 @@ class DummyRedis:
         self.store = {}
         self.ttl_store = {}
         self.pubsub_obj = DummyPubSub(self)
+        self.streams = {}
+        self.groups = {}
+        self.executed = []  # command names of each executed pipeline
 
     def publish(self, channel, data):
         self.published.append((channel, data))
@@ -26,15 +34,163 @@ class DummyRedis:
     def get(self, key):
         return self.store.get(key)
 
+    def rpush(self, key, *values):
+        self.store.setdefault(key, []).extend(values)
+        return len(self.store[key])
+
+    def lrange(self, key, start, end):
+        values = self.store.get(key, [])
+        return values[start:] if end == -1 else values[start:end + 1]
+
+    def expire(self, key, ttl):
+        if key in self.store:
+            self.ttl_store[key] = ttl
+
+    def delete(self, *keys):
+        return sum(self.store.pop(key, None) is not None for key in keys)
+
     def ttl(self, key):
         return self.ttl_store.get(key, -2 if key not in self.ttl_store else 0)
 
     def pubsub(self):
         return self.pubsub_obj
 
+    def pipeline(self, transaction=True):
+        return DummyPipeline(self)
+
+    def register_script(self, script):
+        return DummyScript(self, script)
+
+    def zadd(self, key, mapping):
+        self.store.setdefault(key, {}).update(mapping)
+        return len(mapping)
+
+    def zremrangebyscore(self, key, low, high):
+        members = self.store.get(key, {})
+        removed = [m for m, score in members.items() if low <= score <= high]
+        for member in removed:
+            del members[member]
+        return len(removed)
+
+    def zrange(self, key, start, end):
+        members = sorted(self.store.get(key, {}).items(), key=lambda item: item[1])
+        return [m for m, _ in (members[start:] if end == -1 else members[start:end + 1])]
+
+    def scan_iter(self, match=None, count=None):
+        return iter([key for key in list(self.store) if match is None or fnmatch.fnmatchcase(key, match)])
+
+    # streams: entries are (id, fields); a group is {"next": index of the next new entry, "pending": {id: [consumer, ms]}}
+
+    def xadd(self, name, fields, id="*", maxlen=None, approximate=True):
+        entries = self.streams.setdefault(name, [])
+        entry_id = f"{len(entries) + 1}-0"
+        entries.append((entry_id, dict(fields)))
+        return entry_id
+
+    def xgroup_create(self, name, groupname, id="$", mkstream=False):
+        if (name, groupname) in self.groups:
+            raise redis.ResponseError("BUSYGROUP Consumer Group name already exists")
+        entries = self.streams.setdefault(name, [])
+        self.groups[(name, groupname)] = {"next": len(entries) if id == "$" else 0, "pending": {}}
+        return True
+
+    def xreadgroup(self, groupname, consumername, streams, count=None, block=None, noack=False):
+        result = []
+        for name, start in streams.items():
+            group = self.groups[(name, groupname)]
+            entries = self.streams.get(name, [])
+            if start == ">":
+                batch = entries[group["next"]:group["next"] + (count or len(entries))]
+                group["next"] += len(batch)
+                for entry_id, _ in batch:
+                    group["pending"][entry_id] = [consumername, time.time() * 1000]
+            else:
+                mine = [i for i, (c, _) in group["pending"].items() if c == consumername]
+                batch = [e for e in entries if e[0] in mine][:count]
+            if batch:
+                result.append([name, batch])
+        return result
+
+    def xack(self, name, groupname, *ids):
+        pending = self.groups[(name, groupname)]["pending"]
+        return sum(pending.pop(i, None) is not None for i in ids)
+
+    def xautoclaim(self, name, groupname, consumername, min_idle_time, start_id="0-0", count=None, justid=False):
+        pending = self.groups[(name, groupname)]["pending"]
+        now = time.time() * 1000
+        claimed = []
+        for entry_id, fields in self.streams.get(name, []):
+            owner = pending.get(entry_id)
+            if owner and now - owner[1] >= min_idle_time:
+                pending[entry_id] = [consumername, now]
+                claimed.append((entry_id, fields))
+        return ["0-0", claimed, []]
+
+
+class DummyPipeline:
+    """Queues commands and applies them to the DummyRedis on execute, counting round trips."""
+
+    def __init__(self, target):
+        self.target = target
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        commands, self.commands = self.commands, []
+        self.target.executed.append([name for name, _, _ in commands])
+        return [getattr(self.target, name)(*args, **kwargs) for name, args, kwargs in commands]
+
+
+class DummyScript:
+    """The lease scripts, run in Python against the DummyRedis store (TTLs are recorded, never enforced)."""
+
+    def __init__(self, parent, script):
+        from briscola_leases import ACQUIRE, RELEASE, RENEW
+        self.parent = parent
+        self.run = {ACQUIRE: self.acquire, RENEW: self.renew, RELEASE: self.release}[script]
+
+    def __call__(self, keys=(), args=(), client=None):
+        return self.run(keys, args)
+
+    def acquire(self, keys, args):
+        owner = self.parent.store.get(keys[0])
+        if owner is not None and owner != args[0]:
+            return -max(int(self.parent.ttl_store.get(keys[0], 0) * 1000), 1)
+        self.parent.set(keys[0], args[0], ex=int(args[1]) / 1000)
+        return 1
+
+    def renew(self, keys, args):
+        renewed = []
+        for key in keys:
+            renewed.append(int(self.parent.store.get(key) == args[0]))
+            if renewed[-1]:
+                self.parent.ttl_store[key] = int(args[1]) / 1000
+        return renewed
+
+    def release(self, keys, args):
+        if self.parent.store.get(keys[0]) != args[0]:
+            return 0
+        del self.parent.store[keys[0]]
+        self.parent.ttl_store.pop(keys[0], None)
+        return 1
+
+
+def restored(dummy: DummyRedis, game_id):
+    """A fresh GameServer resumed from what the game persisted in dummy (its checkpoint and log)."""
+    from briscola_service import GameServer
+
+    server = GameServer(game_id, dummy)
+    server.load()
+    return server
+
 
 def extract_payloads(dummy: DummyRedis):
-    return [json.loads(data) for _, data in dummy.published]
+    return [decode(data) for _, data in dummy.published]
 
 
 class DummyPubSub:
@@ -54,6 +210,9 @@ class DummyPubSub:
         while self.messages:
             yield self.messages.pop(0)
 
+    def close(self):
+        pass
+
     def push_message(self, channel, data, pmessage=False):
         msg_type = "pmessage" if pmessage else "message"
         self.messages.append({"type": msg_type, "data": data, "channel": channel})
@@ -62,3 +221,70 @@ class DummyPubSub:
 @pytest.fixture
 def dummy_redis():
     return DummyRedis()
+
+
+class AsyncDummyRedis:
+    """Async facade over DummyRedis for the asyncio service mode."""
+
+    def __init__(self, sync=None):
+        self.sync = sync or DummyRedis()
+        self.pubsub_obj = AsyncDummyPubSub()
+
+    async def get(self, key):
+        return self.sync.get(key)
+
+    async def ttl(self, key):
+        return self.sync.ttl(key)
+
+    async def publish(self, channel, data):
+        self.sync.publish(channel, data)
+
+    def pipeline(self, transaction=True):
+        return AsyncDummyPipeline(self.sync)
+
+    def pubsub(self):
+        return self.pubsub_obj
+
+    async def scan_iter(self, match=None, count=None):
+        for key in self.sync.scan_iter(match, count):
+            yield key
+
+    def register_script(self, script):
+        run = self.sync.register_script(script)
+
+        async def call(keys=(), args=(), client=None):
+            return run(keys, args)
+        return call
+
+
+class AsyncDummyPipeline:
+    def __init__(self, target):
+        self.target = target
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        commands, self.commands = self.commands, []
+        return [getattr(self.target, name)(*args, **kwargs) for name, args, kwargs in commands]
+
+
+class AsyncDummyPubSub:
+    def __init__(self):
+        self.patterns = set()
+        self.messages = []
+
+    async def psubscribe(self, pattern):
+        self.patterns.add(pattern)
+
+    async def listen(self):
+        while self.messages:
+            yield self.messages.pop(0)
+
+    def push_message(self, channel, data):
+        self.messages.append({"type": "pmessage", "data": data, "channel": channel})
+
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import random
+
+from briscola_async_service import AsyncBriscolaService, WriteBuffer
+from briscola_persistence import WriteBehind
+from briscola_service import GameServer
+from tests.conftest import AsyncDummyRedis, DummyRedis, extract_payloads, restored
+
+
+def join(game_id, player_id=0):
+    return {"message_type": "join", "game_id": game_id, "action_id": f"{game_id}-{player_id}",
+            "payload": {"message_type": "join"}, "player_id": player_id, "role": "player"}
+
+
+def bid(game_id, player_id, amount):
+    return {"message_type": "bid", "game_id": game_id, "action_id": f"{game_id}-bid-{player_id}",
+            "payload": {"message_type": "bid", "bid": amount}, "player_id": player_id, "role": "player"}
+
+
+def strip_ts(payloads):
+    for p in payloads:
+        p.pop("ts", None)
+        if isinstance(p.get("payload"), dict):
+            p["payload"].pop("ts", None)
+    return payloads
+
+
+def test_write_buffer_flushes_in_order():
+    buffer = WriteBuffer()
+    buffer.setex("a", 5, "x")
+    buffer.publish("chan", "1")
+    buffer.set("b", "y", ex=10)
+    redis = AsyncDummyRedis()
+    asyncio.run(buffer.flush(redis))
+    assert buffer.commands == []
+    assert redis.sync.store == {"a": "x", "b": "y"}
+    assert redis.sync.published == [("chan", "1")]
+
+
+def test_games_share_one_loop_and_match_threaded_output():
+    async def scenario():
+        redis = AsyncDummyRedis()
+        service = AsyncBriscolaService(redis)
+        for game_id in ("G1", "G2", "G3"):
+            random.seed(game_id)
+            await service.dispatch(join(game_id))
+        await service.dispatch(bid("G2", 0, 70))
+        await asyncio.gather(*(q.join() for q in service.queues.values()))
+        await service.stop()
+        return service, redis
+
+    service, redis = asyncio.run(scenario())
+    assert sorted(service.servers) == ["G1", "G2", "G3"]
+    assert service.servers["G2"].game.players[0].bid == 70
+
+    # the same actions through a threaded-mode server publish the same events
+    random.seed("G2")
+    threaded = DummyRedis()
+    server = GameServer("G2", threaded)
+    server.handle_action(join("G2"))
+    server.handle_action(bid("G2", 0, 70))
+    async_events = [json.loads(d) for c, d in redis.sync.published if c == "game.G2.events"]
+    assert strip_ts(async_events) == strip_ts(extract_payloads(threaded))
+    assert restored(redis.sync, "G2").game.players[0].bid == 70
+
+
+def test_monitor_actions_dispatches_pattern_messages():
+    async def scenario():
+        redis = AsyncDummyRedis()
+        service = AsyncBriscolaService(redis)
+        redis.pubsub_obj.push_message("game.A1.actions", json.dumps(join("A1")))
+        redis.pubsub_obj.push_message("game.A1.actions", "not json")
+        redis.pubsub_obj.push_message("game.B1.actions", json.dumps(join("B1")))
+        await service.monitor_actions()
+        await asyncio.gather(*(q.join() for q in service.queues.values()))
+        await service.stop()
+        return service, redis
+
+    service, redis = asyncio.run(scenario())
+    assert redis.pubsub_obj.patterns == {"game.*.actions"}
+    assert sorted(service.servers) == ["A1", "B1"]
+    channels = {c for c, _ in redis.sync.published}
+    assert channels == {"game.A1.events", "game.B1.events"}
+
+
+def test_actions_are_routed_by_their_channel_like_the_shard_filter():
+    async def scenario():
+        redis = AsyncDummyRedis()
+        service = AsyncBriscolaService(redis, game_filter=lambda game_id: game_id == "MINE")
+        # the envelope names another shard's game: the channel decides, for the filter and the queue alike
+        redis.pubsub_obj.push_message("game.MINE.actions", json.dumps(join("THEIRS")))
+        redis.pubsub_obj.push_message("game.THEIRS.actions", json.dumps(join("MINE")))
+        await service.monitor_actions()
+        await asyncio.gather(*(q.join() for q in service.queues.values()))
+        await service.stop()
+        return service
+
+    assert sorted(asyncio.run(scenario()).servers) == ["MINE"]
+
+
+def test_heartbeat_monitor_restarts_dead_tasks():
+    async def scenario():
+        redis = AsyncDummyRedis()
+        service = AsyncBriscolaService(redis)
+        await service.dispatch(join("H1"))
+        await service.queues["H1"].join()
+        redis.sync.store["game:H1:state"] = json.dumps({"phase": "play-tricks"})
+        dead = service.tasks["H1"]
+        dead.cancel()
+        await asyncio.gather(dead, return_exceptions=True)
+        await service.monitor_heartbeats(once=True)
+        restarted = service.tasks["H1"] is not dead and not service.tasks["H1"].done()
+        state = service.servers["H1"].game.state
+        await service.stop()
+        return redis, restarted, state
+
+    redis, restarted, state = asyncio.run(scenario())
+    assert restarted
+    assert state == "play-tricks"
+    assert redis.sync.store["game:H1:heartbeat"] == "alive"
+
+
+def test_restart_waits_for_the_old_task_and_its_pending_writes():
+    async def scenario():
+        redis = AsyncDummyRedis()
+        service = AsyncBriscolaService(redis)
+        service.write_behind = WriteBehind(window_ms=60000, max_staleness_ms=60000)
+        await service.dispatch(join("R1"))
+        await service.dispatch(bid("R1", 0, 70))
+        old = service.tasks["R1"]
+        await service.ensure_server("R1", restart=True)  # the bid may still be queued
+        server = service.servers["R1"]
+        await service.stop()
+        return redis, old, server
+
+    redis, old, server = asyncio.run(scenario())
+    assert old.done() and server.game.players[0].bid == 70
+    assert restored(redis.sync, "R1").game.checkpoint() == server.game.checkpoint()
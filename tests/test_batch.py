@@ -0,0 +1,50 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from briscola import batch
+from briscola import deck
+
+
+def test_deal_respects_minimum_hand_value():
+    hands = batch.deal(500, np.random.default_rng(1), minimum_hand_value=10)
+    assert hands.shape == (500, 5, 8)
+    # every card dealt exactly once per game
+    assert (np.sort(hands.reshape(500, -1), axis=1) == np.arange(40)).all()
+    assert (batch.CARD_VALUES[hands].sum(axis=2) >= 10).all()
+
+
+def test_auction():
+    limits = np.array([[-1, 70, 65, -1, -1], [-1, -1, -1, -1, -1], [80, 80, -1, -1, -1], [61, -1, -1, -1, -1]])
+    winner, bid, void = batch.auction(limits)
+    assert list(winner[[0, 2, 3]]) == [1, 0, 0]
+    assert list(bid[[0, 2, 3]]) == [66, 80, 61]
+    assert list(void) == [False, True, False, False]
+
+
+def test_points_conserved():
+    result = batch.simulate(2000, play_policy=batch.random_play, seed=3)
+    live = ~result.void
+    assert (result.points[live].sum(axis=1) == 120).all()
+    calling, defending = result.team_points()
+    assert (calling[live] + defending[live] == 120).all()
+    assert (result.partner != result.bid_winner).all()
+
+
+@pytest.mark.parametrize("play_policy", [batch.random_play, batch.lowest_card_play])
+def test_matches_reference_game(play_policy):
+    result = batch.simulate(60, bid_policy=batch.random_bids, play_policy=play_policy, seed=11)
+    checked = 0
+    for i in range(len(result)):
+        if result.void[i]:
+            continue
+        game = batch.replay_game(result, i)
+        assert game.bid_winner.id == result.bid_winner[i]
+        assert game.partner.id == result.partner[i]
+        assert game.partner_suit == deck.suits[result.partner_suit[i]]
+        assert [p.points for p in game.players] == list(result.points[i])
+        assert [len(p.tricks_won) for p in game.players] == list(np.bincount(result.trick_winners[i], minlength=5))
+        assert game.team_points() == tuple(int(x[i]) for x in result.team_points())
+        assert all(not p.hand for p in game.players)
+        checked += 1
+    assert checked > 0
@@ -0,0 +1,110 @@
+import random
+
+from briscola import bot, deck
+from briscola.beliefs import BeliefTracker, mask_cards
+from briscola_service import GameServer
+from tests.test_bot import started_game
+
+
+def play_through(g, observer, rng):
+    '''Play a game out at random, yielding the tracker for observer after every transition'''
+    tracker = BeliefTracker(observer, g.players[observer].original_hand)
+    tracker.caller_won(g.bid_winner.id)
+    tracker.partner_rank_called(g.partner_rank)
+    yield tracker
+    while any(p.hand for p in g.players):
+        if g.state == 'call-partner-suit':
+            suit = rng.choice(deck.suits)
+            g.call_partner_suit(suit)
+            tracker.partner_revealed(g.partner.id, suit)
+        else:
+            seat = g.current_player_id
+            card = rng.choice(g.players[seat].hand)
+            g.play_card(seat, card)
+            tracker.card_played(seat, card.card_id)
+        yield tracker
+
+
+def test_probabilities_are_consistent_with_the_deal():
+    rng = random.Random(1)
+    g = started_game(1)
+    for tracker in play_through(g, 3, rng):
+        matrix = tracker.card_probabilities()
+        for player in g.players:
+            # expected number of cards held is the hand size, and every card held is possible
+            assert abs(sum(row[player.id] for row in matrix) - len(player.hand)) < 1e-9
+            for card in player.hand:
+                assert matrix[card.card_id][player.id] > 0
+        for card in g.players[3].hand:
+            assert matrix[card.card_id][3] == 1.0
+        held = set(c for p in g.players for c in p.hand)
+        for card in deck.cards:
+            assert abs(sum(matrix[card.card_id]) - (card in held)) < 1e-9
+
+
+def test_partner_probabilities():
+    g = started_game(2)
+    tracker = BeliefTracker(1, g.players[1].original_hand)
+    assert tracker.partner_probabilities() == [0.2] * 5
+    tracker.caller_won(g.bid_winner.id)
+    tracker.partner_rank_called(g.partner_rank)
+    probabilities = tracker.partner_probabilities()
+    assert abs(sum(probabilities) - 1) < 1e-9
+    held = sum(1 for c in g.players[1].hand if c.rank == g.partner_rank)
+    assert abs(probabilities[1] - held / 4) < 1e-9
+    while g.state != 'call-partner-suit':
+        seat = g.current_player_id
+        card = g.players[seat].hand[0]
+        g.play_card(seat, card)
+        tracker.card_played(seat, card.card_id)
+    g.call_partner_suit('cups')
+    tracker.partner_revealed(g.partner.id, 'cups')
+    assert tracker.partner_probabilities()[g.partner.id] == 1.0
+    called = deck.Card('cups', g.partner_rank)
+    if g.partner.has_card(called):
+        assert tracker.card_probabilities()[called.card_id][g.partner.id] == 1.0
+
+
+def test_from_game_matches_incremental_updates():
+    rng = random.Random(3)
+    g = started_game(3)
+    for step, tracker in enumerate(play_through(g, 0, rng)):
+        if step % 7 == 0:
+            rebuilt = BeliefTracker.from_game(g, 0)
+            assert rebuilt.possible == tracker.possible
+            assert rebuilt.known == tracker.known
+            assert rebuilt.played == tracker.played
+            assert rebuilt.hand_sizes == tracker.hand_sizes
+
+
+def test_determinizer_reads_beliefs():
+    g = started_game(4)
+    while g.state != 'call-partner-suit':
+        g.play_card(g.current_player_id, g.players[g.current_player_id].hand[0])
+    g.call_partner_suit('swords')
+    g.play_card(g.current_player_id, g.players[g.current_player_id].hand[0])
+    observer = next(p.id for p in g.players if p is not g.partner and p is not g.bid_winner)
+    tracker = BeliefTracker.from_game(g, observer)
+    a = bot.determinize(g, observer, random.Random(5))
+    b = bot.determinize(g, observer, random.Random(5), beliefs=tracker)
+    for p, q in zip(a.players, b.players):
+        assert p.hand == q.hand
+        assert sorted(p.original_hand, key=lambda c: c.card_id) == sorted(q.original_hand, key=lambda c: c.card_id)
+    assert mask_cards(tracker.unknown()) == sorted(
+        (c for p in g.players if p.id != observer for c in p.hand if not tracker.known[p.id] >> c.card_id & 1),
+        key=lambda c: c.card_id)
+
+
+def test_server_feeds_bot_trackers_from_events(dummy_redis):
+    random.seed(6)
+    server = GameServer("BELIEF1", dummy_redis, bot_seats=[1, 2, 3, 4], bot_player=bot.Bot(seed=6))
+    server.handle_action({"message_type": "join", "game_id": "BELIEF1", "payload": {"message_type": "join"}, "player_id": 0, "role": "player"})
+    server.handle_action({"message_type": "bid", "game_id": "BELIEF1", "payload": {"message_type": "bid", "bid": -1}, "player_id": 0, "role": "player"})
+    game = server.game
+    assert server.beliefs[1].plays > 0
+    for seat in [1, 2, 3, 4]:
+        tracker = server.beliefs[seat]
+        rebuilt = BeliefTracker.from_game(game, seat)
+        assert tracker.plays == rebuilt.plays
+        assert tracker.possible == rebuilt.possible and tracker.known == rebuilt.known
+        assert tracker.caller == rebuilt.caller and tracker.partner == rebuilt.partner
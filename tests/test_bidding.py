@@ -0,0 +1,99 @@
+import random
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from briscola import batch, bidding, bot, deck
+from briscola_service import GameServer
+
+HAND = [deck.Card(s, r) for s, r in [("cups", 1), ("cups", 3), ("coins", 10), ("coins", 9), ("coins", 2),
+                                      ("swords", 8), ("swords", 5), ("clubs", 4)]]
+
+
+def relabel(cards, mapping):
+    return [deck.Card(mapping[c.suit], c.rank) for c in cards]
+
+
+def test_canonical_ignores_suit_labels():
+    mapping = {"cups": "clubs", "coins": "cups", "swords": "coins", "clubs": "swords"}
+    key, order = bidding.canonical(HAND)
+    other_key, other_order = bidding.canonical(relabel(HAND, mapping))
+    assert key == other_key
+    # canonical suit 0 is the three-card coins suit, wherever it was relabelled to
+    assert deck.suits[order[0]] == "coins" and deck.suits[other_order[0]] == "cups"
+
+
+def test_deal_around_fixed_hand():
+    fixed = [c.card_id for c in HAND]
+    hands = batch.deal(200, np.random.default_rng(0), minimum_hand_value=5, fixed=fixed)
+    assert (hands[:, 0] == fixed).all()
+    assert (np.sort(hands.reshape(200, -1), axis=1) == np.arange(40)).all()
+    assert (batch.CARD_VALUES[hands[:, 1:]].sum(axis=2) >= 5).all()
+
+
+def test_evaluation_is_cached_and_relabelled():
+    advisor = bidding.BiddingAdvisor(samples=32)
+    evaluation = advisor.evaluate(HAND)
+    assert len(evaluation.expected) == 40
+    assert all(0 <= v <= 120 for v in evaluation.expected.values())
+    assert advisor.misses == 1
+
+    mapping = {"cups": "swords", "coins": "clubs", "swords": "cups", "clubs": "coins"}
+    relabelled = advisor.evaluate(relabel(HAND, mapping))
+    assert advisor.hits == 1 and advisor.misses == 1
+    for (rank, suit), value in evaluation.expected.items():
+        assert relabelled.expected[(rank, mapping[suit])] == value
+    assert advisor.peek(HAND).expected == evaluation.expected
+
+
+def test_suits_held_alike_share_values():
+    hand = [deck.Card(s, r) for s in ("cups", "coins") for r in (1, 2, 3, 4)]
+    evaluation = bidding.BiddingAdvisor(samples=16).evaluate(hand)
+    for rank in deck.ranks:
+        assert evaluation.expected[(rank, "cups")] == evaluation.expected[(rank, "coins")]
+        assert evaluation.expected[(rank, "swords")] == evaluation.expected[(rank, "clubs")]
+
+
+def test_cache_is_bounded_lru():
+    advisor = bidding.BiddingAdvisor(samples=8, cache_size=2)
+    hands = [random.Random(i).sample(deck.cards, 8) for i in range(3)]
+    advisor.evaluate(hands[0])
+    advisor.evaluate(hands[1])
+    advisor.evaluate(hands[0])
+    advisor.evaluate(hands[2])
+    assert advisor.peek(hands[1]) is None
+    assert advisor.peek(hands[0]) is not None and advisor.peek(hands[2]) is not None
+
+
+def test_submit_shares_running_evaluations():
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        advisor = bidding.BiddingAdvisor(samples=16, executor=executor)
+        first, second = advisor.submit(HAND), advisor.submit(HAND)
+        assert first.result().expected == second.result().expected
+    assert advisor.misses == 2 and len(advisor.cache) == 1
+    assert advisor.submit(HAND).done()
+
+
+def test_server_bids_bot_seats_from_advice(dummy_redis):
+    random.seed(7)
+    advisor = bidding.BiddingAdvisor(samples=16)
+    server = GameServer("BIDS01", dummy_redis, bot_seats=[1, 2, 3, 4], bot_player=bot.ISMCTSBot(workers=1, iterations=5, seed=7), advisor=advisor)
+    server.handle_action({"message_type": "join", "game_id": "BIDS01", "payload": {"message_type": "join"}, "player_id": 0, "role": "player"})
+    assert sorted(server.bid_advice) == [1, 2, 3, 4]
+    for seat in [1, 2, 3, 4]:
+        assert server.bid_advice[seat].done()
+        assert advisor.peek(server.game.players[seat].original_hand) is not None
+
+
+def test_server_bids_on_the_heuristic_while_advice_is_pending(dummy_redis):
+    advisor = bidding.BiddingAdvisor(samples=16)
+    server = GameServer("BIDS02", dummy_redis, bot_seats=[1], advisor=advisor)
+    server.bid_advice[1] = Future()  # still being evaluated
+    started = time.perf_counter()
+    assert server.bid_advice_for(1) is None
+    assert time.perf_counter() - started < 0.05
+    server.bid_advice[1].set_result("advice")
+    assert server.bid_advice_for(1) == "advice"
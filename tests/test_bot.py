@@ -0,0 +1,210 @@
+import queue
+import random
+import threading
+
+import briscola_service as service
+from briscola import bot, deck
+from briscola.game import Game
+from briscola_service import GameServer
+from tests.conftest import extract_payloads, restored
+
+
+def started_game(seed=0):
+    random.seed(seed)
+    g = Game()
+    g.start_game()
+    g.deal_cards()
+    g.player_bid(0, 70)
+    for pid in [1, 2, 3, 4]:
+        g.player_bid(pid, -1)
+    g.call_partner_rank(10)
+    return g
+
+
+def test_determinize_keeps_own_hand_and_counts():
+    g = started_game()
+    for _ in range(3):
+        g.play_card(g.current_player_id, g.players[g.current_player_id].hand[0])
+    rng = random.Random(1)
+    for _ in range(20):
+        clone = bot.determinize(g, 3, rng)
+        assert clone.players[3].hand == g.players[3].hand
+        dealt = [c for p in clone.players for c in p.hand] + [c for c, _ in clone.current_trick]
+        assert sorted(c.card_id for c in dealt) == list(range(40))
+        for p, q in zip(clone.players, g.players):
+            assert len(p.hand) == len(q.hand)
+    # the real game is untouched
+    assert g.players[0].hand is not clone.players[0].hand
+
+
+def test_determinize_places_called_card_with_partner():
+    g = started_game()
+    while g.state != 'call-partner-suit':
+        g.play_card(g.current_player_id, g.players[g.current_player_id].hand[-1])
+    g.call_partner_suit('coins')
+    partner_card = deck.Card('coins', 10)
+    observer = next(p.id for p in g.players if p is not g.partner)
+    played = set(c for p in g.players for trick in p.tricks_won for c, _ in trick)
+    rng = random.Random(2)
+    for _ in range(20):
+        clone = bot.determinize(g, observer, rng)
+        assert partner_card in played or clone.players[g.partner.id].has_card(partner_card)
+
+
+def test_ismcts_chooses_legal_card_and_suit():
+    g = started_game()
+    player = g.bid_winner
+    b = bot.ISMCTSBot(workers=1, iterations=60, seed=3)
+    card = b.choose_card(g, player.id)
+    assert player.has_card(card)
+    assert b.last_search['iterations'] == 60
+    while g.state != 'call-partner-suit':
+        g.play_card(g.current_player_id, g.players[g.current_player_id].hand[0])
+    assert b.choose_suit(g, player.id) in deck.suits
+
+
+def test_root_parallel_search_merges_visits():
+    g = started_game()
+    b = bot.ISMCTSBot(workers=2, iterations=30, seed=6)
+    card = b.choose_card(g, g.bid_winner.id)
+    assert g.bid_winner.has_card(card)
+    assert b.last_search['iterations'] == 60
+    assert sum(b.last_search['visits'].values()) == 60
+
+
+def test_heuristic_bids_open_when_everyone_else_passed():
+    g = started_game()
+    g.state = 'bid'
+    g.bid, g.bid_winner = 60, None
+    for p in g.players:
+        p.bid = -1
+    g.players[2].bid = 0
+    assert bot.Bot().choose_bid(g, 2) == 61
+
+
+def test_server_plays_bot_seats_to_the_end(dummy_redis):
+    random.seed(4)
+    server = GameServer("BOTS01", dummy_redis, bot_seats=range(5), bot_player=bot.ISMCTSBot(workers=1, iterations=15, seed=4, endgame_threshold=8))
+    server.handle_action({"message_type": "join", "game_id": "BOTS01", "payload": {"message_type": "join"}, "player_id": 0, "role": "player"})
+    game = server.game
+    assert all(not p.hand for p in game.players)
+    assert sum(p.points for p in game.players) == 120
+    payloads = extract_payloads(dummy_redis)
+    results = [p["payload"] for p in payloads if p["message_type"] == "action.result"]
+    assert all(r["status"] == "ok" for r in results)
+    assert sum(1 for p in payloads if p["message_type"] == "trick.won") == 8
+
+
+def test_server_waits_for_human_seat(dummy_redis):
+    random.seed(5)
+    server = GameServer("BOTS02", dummy_redis, bot_seats=[1, 2, 3, 4], bot_player=bot.ISMCTSBot(workers=1, iterations=5, seed=5))
+    server.handle_action({"message_type": "join", "game_id": "BOTS02", "payload": {"message_type": "join"}, "player_id": 0, "role": "player"})
+    # bots have acted in the auction but seat 0 has not
+    assert server.game.state == "bid"
+    assert server.game.players[0].bid == 0
+
+
+def test_each_bot_thread_decides_with_its_own_bot(dummy_redis):
+    assert GameServer("BOTS03", dummy_redis, bot_seats=[1]).bot is None  # no bot made for the game itself
+    mine = service.get_bot(0.05)
+    assert mine is service.get_bot() and mine.budget == 0.05 and mine.pool
+    other = []
+    thread = threading.Thread(target=lambda: other.append(service.get_bot()))
+    thread.start()
+    thread.join()
+    assert other[0] is not mine
+
+
+def test_bot_budget_is_shared_out_under_load(monkeypatch):
+    monkeypatch.setattr(service, "BOT_THREADS", 2)
+    monkeypatch.setattr(service, "_bot_executor", None)
+    release = threading.Event()
+    budgets = queue.Queue()
+
+    def decide(budget):
+        budgets.put(budget)
+        release.wait(5)
+
+    full = service.BOT_BUDGET_MS / 1000
+    for _ in range(2):
+        service.submit_bot_decision(decide)
+    assert [budgets.get(timeout=5) for _ in range(2)] == [full, full]  # no more decisions than threads
+    for _ in range(6):
+        service.submit_bot_decision(decide)  # queued behind the two running
+    release.set()
+    rest = [budgets.get(timeout=5) for _ in range(6)]
+    service.get_bot_executor().shutdown(wait=True)
+    assert rest[0] <= full * 2 / 6
+    assert all(budget >= service.BOT_MIN_BUDGET_MS / 1000 for budget in rest)
+    assert rest[-1] == full
+
+
+def test_scheduled_bot_moves_are_decided_off_the_action_path(dummy_redis):
+    random.seed(6)
+    moves = queue.Queue()
+    server = GameServer("BOTS05", dummy_redis, bot_seats=range(5), bot_player=bot.Bot(seed=6), schedule_bot=moves.put)
+    server.handle_action({"message_type": "join", "game_id": "BOTS05", "payload": {"message_type": "join"},
+                          "player_id": 0, "role": "player", "action_id": "join"})
+    assert server.game.state == "bid" and all(p.bid == 0 for p in server.game.players)  # nothing decided inline
+
+    stale = moves.get(timeout=5)
+    server.handle_action({"message_type": "sync", "game_id": "BOTS05", "payload": {"message_type": "sync"},
+                          "player_id": 0, "role": "player", "action_id": "sync"})
+    assert moves.empty()  # the game has not changed: the pending decision still stands
+    server.bot_pending, server.game.version = None, server.game.version + 1  # as if a human had moved meanwhile
+    server.run_bots()
+    server.handle_bot_move(stale)  # superseded by the new request
+    assert all(p.bid == 0 for p in server.game.players)
+
+    while any(p.hand for p in server.game.players):
+        server.handle_bot_move(moves.get(timeout=5))
+    assert sum(p.points for p in server.game.players) == 120
+    assert server.last_action_id == "sync"  # every bot move belongs to the action that set them going
+    assert restored(dummy_redis, "BOTS05").game.checkpoint() == server.game.checkpoint()
+
+
+class FailingBot(bot.Bot):
+    """Raises on its first `failures` decisions (every one if None)."""
+
+    def __init__(self, failures=None, seed=None):
+        super().__init__(seed)
+        self.failures = failures
+
+    def choose_bid(self, game, seat, advice=None):
+        if self.failures is None or self.failures > 0:
+            self.failures = None if self.failures is None else self.failures - 1
+            raise RuntimeError("search failed")
+        return super().choose_bid(game, seat, advice)
+
+    def choose_card(self, game, seat, beliefs=None):
+        if self.failures is None:
+            raise RuntimeError("search failed")
+        return super().choose_card(game, seat, beliefs)
+
+
+def play_scheduled(server, moves):
+    server.handle_action({"message_type": "join", "game_id": server.game_id, "payload": {"message_type": "join"},
+                          "player_id": 0, "role": "player", "action_id": "join"})
+    for _ in range(1000):
+        if not any(p.hand for p in server.game.players):
+            break
+        server.handle_bot_move(moves.get(timeout=5))
+
+
+def test_a_failed_bot_decision_is_made_again(dummy_redis):
+    random.seed(7)
+    moves = queue.Queue()
+    player = FailingBot(failures=1, seed=7)
+    server = GameServer("BOTS06", dummy_redis, bot_seats=range(5), bot_player=player, schedule_bot=moves.put)
+    play_scheduled(server, moves)
+    assert player.failures == 0
+    assert sum(p.points for p in server.game.players) == 120
+
+
+def test_a_bot_seat_that_keeps_failing_falls_back_to_legal_moves(dummy_redis):
+    random.seed(8)
+    moves = queue.Queue()
+    server = GameServer("BOTS07", dummy_redis, bot_seats=range(5), bot_player=FailingBot(), schedule_bot=moves.put)
+    play_scheduled(server, moves)
+    assert sum(p.points for p in server.game.players) == 120
+    assert server.bot_failures == 0
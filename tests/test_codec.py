@@ -0,0 +1,140 @@
+import json
+
+import pytest
+
+import briscola_codec as codec
+from briscola_codec import CODECS, CompactCodec, JsonCodec, client_formats, decode, negotiate, protocol_version
+from briscola_service import GameServer
+from tests.conftest import extract_payloads, restored
+
+ENVELOPE = {
+    "message_type": "trick.played",
+    "game_id": "ABC123",
+    "action_id": "7f1c2a9e-0b6d-4c8e-9a51-3d2e4f6a8b10",
+    "player_id": 3,
+    "role": "player",
+    "ts": 1760700000.125,
+    "version": "1.0.0+json.compact",
+    "origin": "game",
+    "payload": {
+        "message_type": "trick.played",
+        "player_id": 3,
+        "card": {"suit": "swords", "rank": 10, "card_id": 29},
+        "trick": [[{"suit": "cups", "rank": 1, "card_id": 0}, 2], [{"suit": "swords", "rank": 10, "card_id": 29}, 3]],
+        "current_player_id": 4,
+        "scores": {"0": 11, "1": 0},
+        "note": "é" * 40,
+        "big": 2 ** 40,
+        "negative": -1000,
+        "flags": [True, False, None],
+    },
+}
+
+
+def test_strings_table_has_no_duplicates_and_fits_a_byte():
+    assert len(set(codec.STRINGS)) == len(codec.STRINGS) < 256
+
+
+@pytest.mark.parametrize("name", sorted(CODECS))
+def test_round_trip(name):
+    c = CODECS[name]
+    decoded = c.decode(c.encode(ENVELOPE))
+    if name == "compact":
+        # cards come back as their ids
+        assert decoded["payload"]["card"] == {"card_id": 29}
+        assert decoded["payload"]["trick"] == [[{"card_id": 0}, 2], [{"card_id": 29}, 3]]
+        for key in ("card", "trick"):
+            decoded["payload"][key] = ENVELOPE["payload"][key]
+    assert decoded == ENVELOPE
+
+
+def test_compact_is_smaller_than_json():
+    assert len(CompactCodec().encode(ENVELOPE)) * 2 < len(JsonCodec().encode(ENVELOPE))
+
+
+def test_compact_sizes_switch_to_wider_headers():
+    c = CompactCodec()
+    value = {str(i): list(range(20)) for i in range(20)}
+    value["s"] = "x" * 300
+    assert c.decode(c.encode(value)) == value
+
+
+def test_card_like_dicts_that_are_not_cards_stay_maps():
+    c = CompactCodec()
+    for value in ({"suit": "cups", "rank": 11}, {"suit": "hearts", "rank": 1}, {"suit": "cups", "rank": 1, "x": 1}):
+        assert c.decode(c.encode(value)) == value
+
+
+@pytest.mark.parametrize("name", sorted(CODECS))
+@pytest.mark.parametrize("message", [{}, {"a": 1}, {str(i): i for i in range(15)}, {str(i): i for i in range(16)}])
+def test_extend_adds_the_last_member(name, message):
+    c = CODECS[name]
+    extended = c.extend(c.encode(message), "payload", c.encode({"card": {"suit": "coins", "rank": 3}}))
+    expected = dict(message, payload={"card": {"suit": "coins", "rank": 3}})
+    if name == "compact":
+        expected["payload"]["card"] = {"card_id": 12}
+    assert c.decode(extended) == expected
+
+
+def test_compact_decode_rejects_bad_messages():
+    c = CompactCodec()
+    data = c.encode({"a": 1})
+    with pytest.raises(ValueError):
+        c.decode(data + b"\x00")
+    with pytest.raises(ValueError):
+        c.decode(bytes((codec.MAGIC, codec.COMPACT_VERSION + 1)) + data[2:])
+    with pytest.raises(ValueError):
+        c.decode(b'{"a": 1}')
+
+
+def test_decode_detects_the_format():
+    compact = CompactCodec().encode(ENVELOPE)
+    # a client that decodes replies as text hands over the bytes as surrogates
+    text = compact.decode("utf-8", codec.ENCODING_ERRORS)
+    assert decode(compact) == decode(text) == CompactCodec().decode(compact)
+    assert decode(json.dumps(ENVELOPE)) == decode(json.dumps(ENVELOPE).encode()) == ENVELOPE
+
+
+def test_protocol_version_and_negotiation():
+    assert protocol_version("1.0.0", ["json", "compact"]) == "1.0.0+json.compact"
+    assert client_formats("1.0.0+compact.json") == ["compact", "json"]
+    assert client_formats("1.0.0") == client_formats(None) == ["json"]
+    assert negotiate([["compact", "json"]], ["json", "compact"]) is CODECS["compact"]
+    assert negotiate([["msgpack", "json"]], ["json", "compact"]) is CODECS["json"]
+    assert negotiate([["compact"]], ["json"]) is CODECS["json"]
+    assert negotiate([["compact", "json"], ["json"]], ["json", "compact"]) is CODECS["json"]
+    assert negotiate([["compact", "json"], ["json", "compact"]], ["json", "compact"]) is CODECS["compact"]
+    assert negotiate([], ["json", "compact"]) is CODECS["json"]
+
+
+def join(server, player_id, version, message_type="join"):
+    server.handle_action({"message_type": message_type, "game_id": server.game_id, "player_id": player_id,
+                          "role": "player", "version": version, "payload": {"message_type": message_type}})
+
+
+def test_game_negotiates_compact_events(dummy_redis):
+    server = GameServer("WIRE01", dummy_redis)
+    join(server, 0, "1.0.0+compact.json")
+    assert server.codec is CODECS["compact"]
+    assert all(data[0] == codec.MAGIC for _, data in dummy_redis.published)
+    sync = [p["payload"] for p in extract_payloads(dummy_redis) if p["payload"].get("message_type") == "sync"]
+    assert [c["card_id"] for c in sync[0]["hand"]] == [c.card_id for c in server.game.players[0].hand]
+    join(server, 1, "1.0.0+json.compact")
+    assert server.codec is CODECS["compact"]
+    # the choice survives a restart
+    assert restored(dummy_redis, "WIRE01").codec is CODECS["compact"]
+
+
+def test_only_joins_settle_the_codec_on_one_every_client_reads(dummy_redis):
+    server = GameServer("WIRE02", dummy_redis)
+    join(server, 0, "1.0.0+compact")
+    join(server, 1, "1.0.0+json", message_type="sync")  # not a join: the format stays
+    assert server.codec is CODECS["compact"]
+    join(server, 2, "1.0.0")  # an older client: JSON only, so the whole game falls back to it
+    assert server.codec is CODECS["json"]
+    dummy_redis.published.clear()
+    join(server, 0, "1.0.0+compact", message_type="sync")
+    assert server.codec is CODECS["json"]
+    result, event = extract_payloads(dummy_redis)
+    assert result["payload"]["effects"]["snapshot"] == event["payload"] == server.build_snapshot(0, "player")
+    assert restored(dummy_redis, "WIRE02").codec is CODECS["json"]
@@ -16,6 +16,19 @@ class TestCard(TestCase):
         card2 = d.Card('cups', 2)
         self.assertNotEqual(card, card2)
 
+    def test_interned(self):
+        card = d.Card('swords', 9)
+        self.assertIs(card, d.Card('swords', 9))
+        self.assertIs(card, d.card_from_id(card.card_id))
+        self.assertEqual(card.card_id, 28)
+        self.assertEqual(card.value, 10)
+        self.assertEqual(len({card, d.Card('swords', 9), d.Card('swords', 8)}), 2)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, d.Card, 'spades', 1)
+        self.assertRaises(ValueError, d.Card, 'cups', 11)
+        self.assertRaises(ValueError, d.card_from_id, 40)
+
 
 class TestDeck(TestCase):
 
@@ -23,3 +36,57 @@ class TestDeck(TestCase):
         deck = d.Deck()
         deck.shuffle()
         self.assertNotEqual(str(deck), str(d.Deck()))
+
+    def test_deal_valid_hands(self):
+        deck = d.Deck()
+        hands, attempts = deck.deal_valid_hands(15)
+        self.assertGreaterEqual(attempts, 1)
+        self.assertEqual(len(hands), 5)
+        self.assertEqual(sorted(c.card_id for hand in hands for c in hand), list(range(40)))
+        for hand in hands:
+            self.assertEqual(len(hand), 8)
+            self.assertGreaterEqual(sum(c.value for c in hand), 15)
+
+    def test_deal_valid_hands_impossible(self):
+        self.assertRaises(ValueError, d.Deck().deal_valid_hands, 25)
+
+    def test_seeded_decks_deal_alike(self):
+        import random
+        state = random.getstate()
+        first, _ = d.Deck(seed=42).deal_valid_hands(5)
+        second, _ = d.Deck(seed=42).deal_valid_hands(5)
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, d.Deck(seed=43).deal_valid_hands(5)[0])
+        # a seeded deck leaves the module generator alone
+        self.assertEqual(random.getstate(), state)
+
+
+class TestShufflePool(TestCase):
+
+    def setUp(self):
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            self.skipTest('numpy not installed')
+
+    def test_draws_are_replayable(self):
+        pool = d.ShufflePool(seed=3, batch=16)
+        draws = [pool.draw() for _ in range(40)]
+        self.assertEqual([n for n, _ in draws], list(range(40)))
+        for n, ids in draws:
+            self.assertEqual(sorted(ids), list(range(40)))
+            self.assertEqual(d.ShufflePool(seed=3, batch=16).permutation(n), ids)
+
+    def test_deck_deals_from_pool(self):
+        import copy
+        import pickle
+        pool = d.ShufflePool(seed=4, batch=8)
+        deck = d.Deck(pool=pool)
+        hands, attempts = deck.deal_valid_hands(10)
+        self.assertEqual(len(deck.pool_draws), attempts)
+        ids = pool.permutation(deck.pool_draws[-1])
+        self.assertEqual([c.card_id for hand in hands for c in hand], ids)
+        self.assertIs(copy.deepcopy(deck).pool, pool)
+        restored = pickle.loads(pickle.dumps(pool))
+        self.assertEqual(restored.draws, pool.draws)
+        self.assertEqual(restored.draw(), pool.draw())
@@ -0,0 +1,99 @@
+import json
+import time
+
+from briscola_service import BriscolaService
+from tests.conftest import DummyRedis, restored
+
+
+def envelope(game_id, action_id, message_type="sync"):
+    return json.dumps({"message_type": message_type, "game_id": game_id, "action_id": action_id, "player_id": 0,
+                       "role": "player", "payload": {"message_type": message_type}})
+
+
+class CountingRedis(DummyRedis):
+    def __init__(self):
+        super().__init__()
+        self.pubsubs = 0
+
+    def pubsub(self):
+        self.pubsubs += 1
+        return super().pubsub()
+
+
+def wait_for_results(redis, count, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        results = [json.loads(d)["action_id"] for c, d in redis.published
+                   if c.endswith(".events") and json.loads(d)["message_type"] == "action.result"]
+        if len(results) >= count:
+            return results
+        time.sleep(0.01)
+    raise AssertionError(f"only {len(results)} of {count} results")
+
+
+def test_one_subscription_hands_actions_to_game_queues():
+    redis = CountingRedis()
+    service = BriscolaService(redis)
+    pubsub = redis.pubsub()
+    pubsub.push_message("game.A.actions", envelope("A", "a0", "join"), pmessage=True)
+    pubsub.push_message("game.B.actions", envelope("B", "b0", "join"), pmessage=True)
+    pubsub.push_message("game.A.actions", envelope("A", "a1"), pmessage=True)
+    service.monitor_actions()
+    assert sorted(wait_for_results(redis, 3)) == ["a0", "a1", "b0"]
+    # first actions go straight to the new servers: nothing is published back to an actions channel
+    assert all(channel.endswith(".events") for channel, _ in redis.published)
+    # no per-game subscription: the test's handle and the service's one pattern subscription
+    assert redis.pubsubs == 2
+    assert pubsub.channels == set() and pubsub.patterns == {"game.*.actions"}
+
+
+def test_ensure_server_is_idempotent():
+    redis = DummyRedis()
+    service = BriscolaService(redis)
+    assert service.ensure_server("G")
+    server, thread, work = service.servers["G"], service.threads["G"], service.queues["G"]
+    assert service.ensure_server("G")
+    assert (service.servers["G"], service.threads["G"], service.queues["G"]) == (server, thread, work)
+
+
+def test_restart_keeps_queued_actions_and_stops_old_loop():
+    redis = DummyRedis()
+    service = BriscolaService(redis)
+    service.ensure_server("G")
+    old_thread, old_queue = service.threads["G"], service.queues["G"]
+    old_queue.put(envelope("G", "g1"))
+    old_queue.put(envelope("G", "g2"))
+    # the old loop handles what is queued ahead of its sentinel before the new server loads
+    service.ensure_server("G", restart=True)
+    assert not old_thread.is_alive()
+    old_queue.put(envelope("G", "g3"))
+    assert sorted(wait_for_results(redis, 3)) == ["g1", "g2", "g3"]
+    assert service.threads["G"].is_alive() and service.threads["G"] is not old_thread
+    assert service.queues["G"] is old_queue
+
+
+def test_restart_loads_every_move_the_old_server_made():
+    redis = DummyRedis()
+    service = BriscolaService(redis)
+    service.ensure_server("G")
+    work = service.queues["G"]
+    work.put(envelope("G", "join", "join"))
+    for seat, bid in enumerate([70, -1, -1, -1, -1]):
+        work.put(json.dumps({"message_type": "bid", "game_id": "G", "action_id": f"bid-{seat}", "player_id": seat,
+                             "role": "player", "payload": {"message_type": "bid", "bid": bid}}))
+    service.ensure_server("G", restart=True)  # while those actions are still being handled
+    server = service.servers["G"]
+    assert server.game.state == "call-partner-rank" and server.last_action_id == "bid-4"
+    assert restored(redis, "G").game.checkpoint() == server.game.checkpoint()
+
+
+def test_idle_game_keeps_its_server():
+    redis = DummyRedis()
+    service = BriscolaService(redis)
+    service.ensure_server("G")
+    thread = service.threads["G"]
+    deadline = time.time() + 5
+    while "game:G:heartbeat" not in redis.store and time.time() < deadline:
+        time.sleep(0.01)
+    service.monitor_heartbeats(once=True)
+    assert service.threads["G"] is thread and thread.is_alive()
@@ -0,0 +1,90 @@
+import copy
+import random
+
+import pytest
+
+from briscola import bot
+from briscola.endgame import EndgameSolver
+from briscola.game import Game
+
+
+def endgame_position(seed, tricks_left):
+    """Play a random game up to the start of the last tricks_left tricks."""
+    random.seed(seed)
+    rng = random.Random(seed)
+    g = Game()
+    g.start_game()
+    g.deal_cards()
+    g.player_bid(0, 70)
+    for pid in [1, 2, 3, 4]:
+        g.player_bid(pid, -1)
+    g.call_partner_rank(10)
+    while g.state != 'call-partner-suit':
+        g.play_card(g.current_player_id, rng.choice(g.players[g.current_player_id].hand))
+    g.call_partner_suit('coins')
+    while len(g.players[g.current_player_id].hand) > tricks_left or g.current_trick:
+        g.play_card(g.current_player_id, rng.choice(g.players[g.current_player_id].hand))
+    return g
+
+
+def minimax(g):
+    actions = bot.legal_actions(g)
+    if not actions:
+        return g.team_points()[0]
+    values = []
+    for action in actions:
+        child = copy.deepcopy(g)
+        bot.apply_action(child, action)
+        values.append(minimax(child))
+    calling = g.current_player_id in (g.bid_winner.id, g.partner.id)
+    return max(values) if calling else min(values)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_matches_plain_minimax(seed):
+    g = endgame_position(seed, 2)
+    # also start from a partly played trick
+    g.play_card(g.current_player_id, g.players[g.current_player_id].hand[0])
+    solver = EndgameSolver()
+    result = solver.solve(g, all_moves=True)
+    assert result.value == minimax(g)
+    calling = g.current_player_id in (g.bid_winner.id, g.partner.id)
+    best = (max if calling else min)(result.move_values.values())
+    assert result.move_values[result.move] == best == result.value
+    assert sorted(result.move_values) == sorted(c.card_id for c in g.players[g.current_player_id].hand)
+    assert result.nodes > 0
+    assert solver.solves == 1 and solver.total_nodes == result.nodes
+
+
+def test_best_move_only_agrees_with_all_moves():
+    g = endgame_position(7, 3)
+    assert EndgameSolver().solve(g).value == EndgameSolver().solve(g, all_moves=True).value
+
+
+def test_transposition_table_reused():
+    g = endgame_position(8, 3)
+    solver = EndgameSolver()
+    first = solver.solve(g)
+    second = solver.solve(g)
+    assert second.value == first.value
+    assert second.nodes < first.nodes
+    assert second.tt_hits > 0
+
+
+def test_requires_called_partner():
+    g = Game()
+    g.start_game()
+    g.deal_cards()
+    with pytest.raises(ValueError):
+        EndgameSolver().solve(g)
+
+
+def test_bot_switches_to_solver():
+    g = endgame_position(9, 2)
+    seat = g.current_player_id
+    b = bot.ISMCTSBot(workers=1, iterations=3, seed=1)
+    card = b.choose_card(g, seat)
+    assert g.players[seat].has_card(card)
+    assert b.last_search['endgame'] is True
+    assert b.last_search['iterations'] == 3
+    assert b.last_search['nodes'] > 0
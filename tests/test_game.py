@@ -1,7 +1,9 @@
+import json
+import random
 from unittest import TestCase
 
 import briscola.deck as deck
-from briscola.game import Game
+from briscola.game import Game, beats, trick_winner
 
 
 class TestGame(TestCase):
@@ -35,6 +37,17 @@ class TestGame(TestCase):
             self.assertTrue(sum([card.value for card in player.hand]) >= g.minimum_hand_value)
 
         self.assertEqual(g.state, 'bid')
+        self.assertGreaterEqual(g.deal_stats['attempts'], 1)
+        self.assertGreaterEqual(g.deal_stats['seconds'], 0)
+
+    def test_deal_cards_minimum_hand_value(self):
+        g = Game(minimum_hand_value=18)
+        g.start_game()
+        g.deal_cards()
+        for player in g.players:
+            self.assertGreaterEqual(sum(card.value for card in player.hand), 18)
+            self.assertEqual(player.original_hand, player.hand)
+            self.assertIsNot(player.original_hand, player.hand)
 
     def test_player_bid(self):
         g = Game()
@@ -50,6 +63,13 @@ class TestGame(TestCase):
         self.assertEqual(state, 'call-partner-rank')
         self.assertEqual(g.current_player_id, winner_id)
 
+    def test_player_bid_pass_before_any_bid(self):
+        g = Game()
+        g.start_game()
+        g.deal_cards()
+        state, winner_id, winning_bid = g.player_bid(1, -1)
+        self.assertEqual((state, winner_id, winning_bid), ('bid', None, 60))
+
     def test_call_partner_rank(self):
         g = Game()
         g.start_game()
@@ -134,6 +154,178 @@ class TestGame(TestCase):
         state, _, _ = g.play_card(4, g.players[4].hand[0])
         self.assertEqual(state, 'call-partner-suit')
 
+    def test_hand_mask(self):
+        g = Game()
+        g.start_game()
+        g.deal_cards()
+        for player in g.players:
+            self.assertEqual(bin(player.hand_mask).count('1'), 8)
+            for card in player.hand:
+                self.assertTrue(player.has_card(card))
+                self.assertEqual(g.card_owner[card.card_id], player.id)
+        player = g.players[0]
+        card = player.hand[3]
+        order = [c for c in player.hand if c is not card]
+        player.remove_card(card)
+        self.assertFalse(player.has_card(card))
+        self.assertEqual(player.hand, order)
+        self.assertRaises(ValueError, player.remove_card, card)
+
+    def test_beats(self):
+        # trump beats any non-trump, otherwise only a higher card of the winning suit wins
+        self.assertTrue(beats(deck.Card('cups', 10), deck.Card('coins', 1), 'coins'))
+        self.assertFalse(beats(deck.Card('coins', 1), deck.Card('cups', 10), 'coins'))
+        self.assertTrue(beats(deck.Card('cups', 3), deck.Card('cups', 4), 'coins'))
+        self.assertFalse(beats(deck.Card('cups', 3), deck.Card('swords', 9), 'coins'))
+        self.assertFalse(beats(deck.Card('cups', 3), deck.Card('swords', 9)))
+
+    def test_running_trick_winner(self):
+        rng = random.Random(7)
+        for _ in range(200):
+            trump = rng.choice(deck.suits + [None])
+            cards = rng.sample(deck.cards, 5)
+            g = Game()
+            g.state = 'play-tricks'
+            g.partner_suit = trump
+            g.current_player_id = 0
+            for pid, card in enumerate(cards):
+                g.players[pid].hand = [card]
+                state, winning_card, winner_id = g.play_card(pid, card)
+            trick = list(zip(cards, range(5)))
+            self.assertEqual((winning_card, winner_id), trick_winner(trick, trump))
+            self.assertEqual(state, 'trick-won')
+            self.assertEqual(g.last_trick, trick)
+            self.assertEqual(g.last_trick_winner_id, winner_id)
+            self.assertEqual(g.current_trick, [])
+            self.assertEqual(g.current_player_id, winner_id)
+            self.assertEqual(g.players[winner_id].points, sum(c.value for c in cards))
+
+    def test_first_trick_flow(self):
+        g = Game()
+        g.start_game()
+        g.deal_cards()
+        g.player_bid(0, 70)
+        for pid in [1, 2, 3, 4]:
+            g.player_bid(pid, -1)
+        g.call_partner_rank(10)
+        for _ in range(4):
+            g._next_player_play_random_card()
+            self.assertEqual(g.state, 'play-first-trick')
+        g._next_player_play_random_card()
+        self.assertEqual(g.state, 'call-partner-suit')
+        state, _, partner_id = g.call_partner_suit('cups')
+        self.assertEqual(state, 'trick-won')
+        self.assertIn(deck.Card('cups', 10), g.players[partner_id].original_hand)
+        self.assertEqual(len(g.last_trick), 5)
+
+    @staticmethod
+    def _dump(g):
+        players = [(p.hand, p.hand_mask, p.bid, p.points, [list(t) for t in p.tricks_won]) for p in g.players]
+        return (g.state, g.bid, g.bid_winner, g.partner, g.partner_rank, g.partner_suit, list(g.current_trick),
+                g.trick_winning_card, g.trick_winner_id, list(g.last_trick), g.last_trick_winner_id,
+                g.current_leader_id, g.current_player_id, g.zobrist, players)
+
+    def test_undo_restores_every_transition(self):
+        rng = random.Random(3)
+        random.seed(3)
+        g = Game()
+        g.start_game()
+        g.deal_cards()
+        history = [self._dump(g)]
+        g.player_bid(2, 75)
+        history.append(self._dump(g))
+        for pid in [0, 1, 3, 4]:
+            g.player_bid(pid, -1)
+            history.append(self._dump(g))
+        g.call_partner_rank(9)
+        history.append(self._dump(g))
+        while any(p.hand for p in g.players):
+            if g.state == 'call-partner-suit':
+                g.call_partner_suit(rng.choice(deck.suits))
+            else:
+                g.play_card(g.current_player_id, rng.choice(g.players[g.current_player_id].hand))
+            self.assertEqual(g.zobrist, g.rehash())
+            history.append(self._dump(g))
+        self.assertEqual(len(history), 1 + 5 + 1 + 40 + 1)
+        final_hash = g.zobrist
+        while len(history) > 1:
+            history.pop()
+            g.undo()
+            self.assertEqual(self._dump(g), history[-1])
+        self.assertRaises(Exception, g.undo)
+        self.assertNotEqual(final_hash, g.zobrist)
+
+    def test_zobrist_transpositions(self):
+        random.seed(4)
+        a = Game()
+        a.start_game()
+        a.deal_cards()
+        b = __import__('copy').deepcopy(a)
+        a.player_bid(1, -1)
+        a.player_bid(2, 70)
+        b.player_bid(2, 70)
+        b.player_bid(1, -1)
+        self.assertEqual(a.zobrist, b.zobrist)
+        a.player_bid(3, -1)
+        self.assertNotEqual(a.zobrist, b.zobrist)
+
+    def test_seed_replays_deal(self):
+        def hands(game):
+            game.start_game()
+            game.deal_cards()
+            return [p.hand for p in game.players]
+
+        first = Game(seed=11)
+        self.assertEqual(first.seed, 11)
+        self.assertEqual(hands(first), hands(Game(seed=11)))
+        replay = Game()
+        replay.reseed(11)
+        self.assertEqual(hands(replay), [p.original_hand for p in first.players])
+
+    def test_checkpoint_resumes_exactly(self):
+        def dump(game):
+            players = [(p.original_hand, p.hand, p.hand_mask, p.bid, p.points, p.tricks_won) for p in game.players]
+            return (game.state, game.bid, game.bid_winner.id, game.partner.id, game.partner_rank, game.partner_suit,
+                    game.current_trick, game.trick_winning_card, game.trick_winner_id, game.last_trick,
+                    game.last_trick_winner_id, game.current_leader_id, game.current_player_id, game.card_owner,
+                    game.seed, game.zobrist, players)
+
+        g = Game(seed=5)
+        g.start_game()
+        g.deal_cards()
+        g.player_bid(0, 70)
+        for pid in range(1, 5):
+            g.player_bid(pid, -1)
+        g.call_partner_rank(1)
+        for _ in range(5):
+            g.play_card(g.current_player_id, g.players[g.current_player_id].hand[0])
+        g.call_partner_suit('coins')
+        for _ in range(3):
+            g.play_card(g.current_player_id, g.players[g.current_player_id].hand[-1])
+
+        resumed = Game()
+        resumed.restore_checkpoint(json.loads(json.dumps(g.checkpoint())))
+        self.assertEqual(dump(resumed), dump(g))
+        for _ in range(2):
+            card = g.players[g.current_player_id].hand[0]
+            self.assertEqual(resumed.play_card(g.current_player_id, card), g.play_card(g.current_player_id, card))
+        self.assertEqual(dump(resumed), dump(g))
+
+    def test_version_increases_with_every_change(self):
+        g = Game(seed=2)
+        versions = [g.version]
+        g.start_game()
+        versions.append(g.version)
+        g.deal_cards()
+        versions.append(g.version)
+        g.player_bid(0, 70)
+        versions.append(g.version)
+        g.undo()
+        versions.append(g.version)
+        g.player_bid(0, 70)
+        versions.append(g.version)
+        self.assertEqual(versions, sorted(set(versions)))
+
     def test__next_player_play_random_card(self):
         g = Game()
         g.start_game()
@@ -0,0 +1,133 @@
+import asyncio
+import json
+import time
+
+import briscola_leases
+from briscola_async_service import AsyncBriscolaService
+from briscola_leases import LeaseManager
+from briscola_service import BriscolaService
+from tests.conftest import AsyncDummyRedis, DummyRedis
+
+
+def join(game_id):
+    return {"message_type": "join", "game_id": game_id, "action_id": f"{game_id}-join", "player_id": 0,
+            "role": "player", "payload": {"message_type": "join"}}
+
+
+def node(redis, name):
+    service = BriscolaService(redis)
+    service.leases.node_id = name
+    return service
+
+
+def test_lease_is_exclusive_until_released():
+    redis = DummyRedis()
+    a = LeaseManager(redis, 5000, node_id="a")
+    b = LeaseManager(redis, 5000, node_id="b")
+    assert a.acquire("G")
+    assert a.acquire("G")  # re-entrant: extends
+    assert not b.acquire("G")
+    assert not b.release("G")
+    assert a.holds("G") and not b.holds("G")
+    assert a.release("G")
+    b.foreign["G"] = 0  # as if the recheck interval had passed
+    assert b.acquire("G")
+    assert redis.get("game:G:owner") == "b"
+
+
+def test_renew_reports_lost_leases_across_batches(monkeypatch):
+    monkeypatch.setattr(briscola_leases, "LEASE_RENEW_BATCH", 3)
+    redis = DummyRedis()
+    a = LeaseManager(redis, 5000, node_id="a")
+    games = [f"g{n}" for n in range(7)]
+    for game_id in games:
+        a.acquire(game_id)
+    redis.store["game:g4:owner"] = "b"  # expired and taken over
+    del redis.store["game:g5:owner"]  # expired
+    assert a.renew(games) == ["g4", "g5"]
+    assert a.holds("g0") and not a.holds("g4") and not a.holds("g5")
+
+
+def test_holds_stops_before_the_lease_can_expire():
+    a = LeaseManager(DummyRedis(), 1500, node_id="a", margin_ms=1000)
+    a.acquire("G")
+    assert a.holds("G")
+    a.deadlines["G"] = time.monotonic() + 0.5  # inside the margin
+    assert not a.holds("G")
+
+
+def test_refused_game_is_skipped_without_asking_redis_until_it_could_have_lapsed():
+    redis = DummyRedis()
+    a = LeaseManager(redis, 5000, node_id="a")
+    b = LeaseManager(redis, 5000, node_id="b", recheck_ms=60000)
+    calls = []
+    script = b.acquire_script
+    b.acquire_script = lambda **kwargs: calls.append(kwargs) or script(**kwargs)
+    assert a.acquire("G")
+    assert not b.acquire("G") and not b.acquire("G")
+    assert len(calls) == 1
+    assert 4 < b.foreign["G"] - time.monotonic() <= 5  # what was left of a's lease
+    b.foreign["G"] = time.monotonic()  # a's lease could have lapsed by now
+    del redis.store["game:G:owner"]
+    assert b.acquire("G") and len(calls) == 2 and "G" not in b.foreign
+
+
+def test_second_node_ignores_a_leased_game():
+    redis = DummyRedis()
+    a, b = node(redis, "a"), node(redis, "b")
+    assert a.ensure_server("G")
+    redis.pubsub().push_message("game.G.actions", json.dumps(join("G")), pmessage=True)
+    b.monitor_actions()
+    assert "G" not in b.servers
+    assert redis.published == []  # not re-published for a server b never started
+
+
+def test_takeover_after_expiry_reloads_state():
+    redis = DummyRedis()
+    a, b = node(redis, "a"), node(redis, "b")
+    a.ensure_server("G")
+    a.servers["G"].handle_action(join("G"))
+    a.servers["G"].handle_action({**join("G"), "message_type": "bid", "action_id": "bid",
+                                  "payload": {"message_type": "bid", "bid": 70}})
+    del redis.store["game:G:owner"]  # a stopped renewing and the lease expired
+
+    assert b.ensure_server("G")
+    assert b.servers["G"].game.players[0].bid == 70
+    a.monitor_heartbeats(once=True)
+    assert "G" not in a.servers
+    assert not a.owns(b.servers["G"])
+
+
+def test_server_loop_stops_when_lease_is_gone():
+    redis = DummyRedis()
+    a = node(redis, "a")
+    a.ensure_server("G")
+    server = a.servers["G"]
+    redis.store["game:G:owner"] = "b"
+    a.leases.deadlines["G"] = 0  # renewals late: the loop checks with Redis
+    assert not a.owns(server)
+    assert "G" not in a.servers
+
+
+def test_async_nodes_share_games_by_lease():
+    async def scenario():
+        redis = AsyncDummyRedis()
+        a, b = AsyncBriscolaService(redis), AsyncBriscolaService(redis)
+        a.leases.node_id, b.leases.node_id = "a", "b"
+        await a.dispatch(join("G"))
+        await a.queues["G"].join()
+        await b.dispatch(join("G"))
+        ignored = "G" not in b.servers
+        await a.stop()  # releases the lease
+        b.leases.foreign["G"] = 0  # as if the recheck interval had passed
+        await b.dispatch(join("G"))
+        await b.queues["G"].join()
+        taken = b.servers["G"].game.state
+        await b.stop()
+        return redis, ignored, taken
+
+    redis, ignored, taken = asyncio.run(scenario())
+    assert ignored
+    assert taken == "bid"
+    results = [json.loads(d) for c, d in redis.sync.published if json.loads(d)["message_type"] == "action.result"]
+    assert len(results) == 2
@@ -0,0 +1,210 @@
+import asyncio
+import json
+import os
+import signal
+import threading
+import time
+
+from briscola_async_service import AsyncBriscolaService
+from briscola_persistence import CHECKPOINT_ACTIONS, WriteBehind
+from briscola_service import BriscolaService, GameServer
+from tests.conftest import AsyncDummyRedis, DummyRedis, restored
+
+
+def action(game_id, action_id, message_type, player_id=0, **payload):
+    return {"message_type": message_type, "game_id": game_id, "action_id": action_id, "player_id": player_id,
+            "role": "player", "payload": dict(payload, message_type=message_type)}
+
+
+def test_due_after_window_but_never_later_than_max_staleness():
+    wb = WriteBehind(window_ms=50, max_staleness_ms=120)
+    wb.mark("G")
+    first, due = wb.dirty["G"]
+    assert abs(due - first - 0.05) < 0.01
+    assert wb.take_due(first + 0.04) == []
+    wb.dirty["G"] = (first - 0.1, due)  # changed again and again since 100 ms ago
+    wb.mark("G")
+    assert wb.dirty["G"][1] <= first + 0.02 + 1e-9
+    assert wb.take_due(first + 0.03) == ["G"]
+    assert wb.dirty == {} and wb.next_due() is None
+    wb.mark("H")
+    wb.discard("H")
+    assert wb.take_due(time.monotonic() + 1) == []
+
+
+def test_write_behind_defers_changes_within_a_phase():
+    redis = DummyRedis()
+    wb = WriteBehind(window_ms=50, max_staleness_ms=500)
+    server = GameServer("WB1", redis, write_behind=wb)
+    server.handle_action(action("WB1", "join", "join"))
+    redis.executed.clear()
+    server.handle_action(action("WB1", "bid-0", "bid", bid=70))
+    assert server.game.state == "bid"
+    assert redis.executed == [["publish", "publish"]]  # the result and the phase event, no log entry
+    assert "game:WB1:log" not in redis.store
+    assert "WB1" in wb.dirty and server.state_pending
+
+    server.flush_state()
+    assert restored(redis, "WB1").game.players[0].bid == 70
+    assert "WB1" not in wb.dirty and not server.state_pending
+    redis.store.clear()
+    server.flush_state()  # nothing left to write
+    assert redis.store == {}
+
+
+def test_phase_change_is_written_with_its_action():
+    redis = DummyRedis()
+    wb = WriteBehind()
+    server = GameServer("WB2", redis, write_behind=wb)
+    server.handle_action(action("WB2", "join", "join"))
+    server.handle_action(action("WB2", "bid-0", "bid", bid=70))
+    for seat in range(1, 5):
+        redis.executed.clear()
+        server.handle_action(action("WB2", f"pass-{seat}", "bid", player_id=seat, bid=-1))
+    assert server.game.state == "call-partner-rank"
+    assert redis.executed[-1][-2:] == ["rpush", "expire"]
+    assert len(redis.store["game:WB2:log"]) == 5
+    assert restored(redis, "WB2").game.state == "call-partner-rank"
+    assert "WB2" not in wb.dirty and not server.state_pending
+
+
+def test_flusher_has_the_game_worker_write_due_snapshots():
+    redis = DummyRedis()
+    service = BriscolaService(redis)
+    service.write_behind = WriteBehind(window_ms=10, max_staleness_ms=10)
+    service.ensure_server("G")
+    flusher = threading.Thread(target=service.flush_dirty_games, daemon=True)
+    flusher.start()
+    service.queues["G"].put(json.dumps(action("G", "join", "join")))
+    service.queues["G"].put(json.dumps(action("G", "bid-0", "bid", bid=70)))
+    deadline = time.time() + 5
+    while "game:G:log" not in redis.store and time.time() < deadline:
+        time.sleep(0.01)
+    service.stop_event.set()
+    assert restored(redis, "G").game.players[0].bid == 70
+
+
+def test_shutdown_writes_pending_snapshots():
+    redis = DummyRedis()
+    service = BriscolaService(redis)
+    service.write_behind = WriteBehind(window_ms=60000, max_staleness_ms=60000)
+    service.ensure_server("G")
+    server = service.servers["G"]
+    server.handle_action(action("G", "join", "join"))
+    server.handle_action(action("G", "bid-0", "bid", bid=70))
+    assert "game:G:log" not in redis.store
+    service.flush_all_states()
+    assert restored(redis, "G").game.players[0].bid == 70
+
+
+def test_async_stop_writes_pending_snapshots():
+    async def scenario():
+        redis = AsyncDummyRedis()
+        service = AsyncBriscolaService(redis)
+        service.write_behind = WriteBehind(window_ms=60000, max_staleness_ms=60000)
+        await service.dispatch(action("A", "join", "join"))
+        await service.dispatch(action("A", "bid-0", "bid", bid=70))
+        await service.queues["A"].join()
+        before = "game:A:log" in redis.sync.store
+        await service.stop()
+        return redis, before
+
+    redis, before = asyncio.run(scenario())
+    assert not before
+    assert restored(redis.sync, "A").game.players[0].bid == 70
+
+
+def signal_after(delay, condition=lambda: True):
+    """Send this process SIGTERM once condition holds, from a timer thread, as docker stop would."""
+    def send():
+        deadline = time.time() + 5
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+        os.kill(os.getpid(), signal.SIGTERM)
+    timer = threading.Timer(delay, send)
+    timer.start()
+    return timer
+
+
+def test_sigterm_writes_pending_state_and_releases_leases():
+    redis = DummyRedis()
+    service = BriscolaService(redis)
+    service.write_behind = WriteBehind(window_ms=60000, max_staleness_ms=60000)
+    service.monitor_actions = service.stop_event.wait  # a subscription that stays open until the stop
+    service.ensure_server("G")
+    service.queues["G"].put(json.dumps(action("G", "join", "join")))
+    service.queues["G"].put(json.dumps(action("G", "bid-0", "bid", bid=70)))
+    previous = signal.getsignal(signal.SIGTERM)
+    signal_after(0.05, lambda: service.servers["G"].game.players[0].bid == 70)
+    service.run()
+    assert signal.getsignal(signal.SIGTERM) is previous
+    assert restored(redis, "G").game.players[0].bid == 70
+    assert "game:G:owner" not in redis.store
+
+
+def test_async_sigterm_writes_pending_state():
+    redis = AsyncDummyRedis()
+    service = AsyncBriscolaService(redis)
+    service.write_behind = WriteBehind(window_ms=60000, max_staleness_ms=60000)
+    for n, (mtype, payload) in enumerate([("join", {}), ("bid", {"bid": 70})]):
+        redis.pubsub_obj.push_message("game.A.actions", json.dumps(action("A", f"a{n}", mtype, **payload)))
+    signal_after(0.05, lambda: "A" in service.servers and service.servers["A"].game.players[0].bid == 70)
+    service.run()
+    assert restored(redis.sync, "A").game.players[0].bid == 70
+    assert "game:A:owner" not in redis.sync.store
+
+
+def test_a_pool_dealt_game_restores_from_its_snapshot_alone(monkeypatch):
+    import briscola_service
+    from briscola.deck import ShufflePool
+
+    monkeypatch.setattr(briscola_service, "_shuffle_pool", ShufflePool(seed=5, batch=16))
+    redis = DummyRedis()
+    server = GameServer("POOL1", redis)
+    server.handle_action(action("POOL1", "join", "join"))
+    assert server.game.deal_stats["pool_draws"]
+    assert set(json.loads(redis.store["game:POOL1:state"])) == {"snapshot", "last_action_id", "clients"}
+    assert restored(redis, "POOL1").game.checkpoint() == server.game.checkpoint()
+
+
+def test_restart_resumes_exactly_after_every_action():
+    redis = DummyRedis()
+    server = GameServer("LOG1", redis)
+    server.handle_action(action("LOG1", "join", "join"))
+    moves = [("bid", 0, {"bid": 70})] + [("bid", seat, {"bid": -1}) for seat in range(1, 5)]
+    reversed_hand = [c.card_id for c in reversed(server.game.players[2].hand)]
+    moves += [("call-partner-rank", 0, {"partner_rank": 1}), ("reorder", 2, {"hand": reversed_hand})]
+    n = 0
+    while any(p.hand for p in server.game.players):
+        if moves:
+            mtype, seat, payload = moves.pop(0)
+        elif server.game.state == "call-partner-suit":
+            mtype, seat, payload = "call-partner-suit", 0, {"partner_suit": "cups"}
+        else:
+            seat = server.game.current_player_id
+            card = server.game.players[seat].hand[0]
+            mtype, payload = "play", {"card": {"card_id": card.card_id}}
+        n += 1
+        redis.executed.clear()
+        server.handle_action(action("LOG1", f"a{n}", mtype, player_id=seat, **payload))
+        if mtype == "play" and server.game.current_trick:
+            assert redis.executed == [["publish", "publish", "rpush", "expire"]]  # no snapshot mid-trick
+        assert len(redis.store.get("game:LOG1:log", [])) < CHECKPOINT_ACTIONS
+
+        resumed = restored(redis, "LOG1")
+        assert resumed.game.checkpoint() == server.game.checkpoint()
+        assert resumed.game.zobrist == server.game.zobrist
+        assert resumed.last_action_id == f"a{n}" and resumed.initialized
+    assert sum(p.points for p in server.game.players) == 120
+
+
+def test_restart_has_the_old_worker_write_its_pending_state():
+    redis = DummyRedis()
+    service = BriscolaService(redis)
+    service.write_behind = WriteBehind(window_ms=60000, max_staleness_ms=60000)
+    service.ensure_server("G")
+    service.queues["G"].put(json.dumps(action("G", "join", "join")))
+    service.queues["G"].put(json.dumps(action("G", "bid-0", "bid", bid=70)))
+    service.ensure_server("G", restart=True)
+    assert service.servers["G"].game.players[0].bid == 70
+    assert "G" not in service.write_behind.dirty
@@ -1,10 +1,12 @@
+import base64
 import json
 
 import pytest
 
 from briscola_service import GameServer
 from briscola import deck
-from tests.conftest import DummyRedis, extract_payloads
+from briscola.snapshot import decode as decode_game
+from tests.conftest import DummyRedis, extract_payloads, restored
 
 
 def test_join_sync_snapshot(dummy_redis):
@@ -70,3 +72,94 @@ def test_reorder_persists_order(dummy_redis):
     updated = hand_updates[0]["payload"]["hand"]
     assert updated[0]["suit"] == new_order[0]["suit"]
     assert updated[0]["rank"] == new_order[0]["rank"]
+
+
+def test_seed_persisted_but_not_sent(dummy_redis):
+    server = GameServer("SEED01", dummy_redis)
+    server.handle_action({"message_type": "join", "game_id": "SEED01", "payload": {"message_type": "join"}, "player_id": 0, "role": "player"})
+    assert all("seed" not in p["payload"] for p in extract_payloads(dummy_redis))
+    server.persist_state()
+    persisted = json.loads(dummy_redis.store["game:SEED01:state"])
+    assert decode_game(base64.b64decode(persisted["snapshot"])).seed == server.game.seed
+
+    # an older snapshot that kept only the seed still deals the same hands again
+    legacy = GameServer("SEED01", DummyRedis())
+    legacy.load_state({"phase": "idle", "seed": server.game.seed})
+    legacy.game.start_game()
+    legacy.game.deal_cards()
+    assert [p.hand for p in legacy.game.players] == [p.original_hand for p in server.game.players]
+
+
+def test_trick_winning_play_is_one_transaction(dummy_redis):
+    server = GameServer("PIPE01", dummy_redis)
+    server.handle_action({"message_type": "join", "game_id": "PIPE01", "payload": {"message_type": "join"}, "player_id": 0, "role": "player"})
+    game = server.game
+    game.state, game.partner_suit, game.bid_winner = "play-tricks", "cups", game.players[0]
+    game.current_player_id = game.current_leader_id = 0
+    for seat in range(5):
+        card = server.game.players[seat].hand[0]
+        dummy_redis.executed.clear()
+        server.handle_action({
+            "message_type": "play", "game_id": "PIPE01", "player_id": seat, "role": "player",
+            "payload": {"message_type": "play", "card": {"suit": card.suit, "rank": card.rank}},
+        })
+        assert len(dummy_redis.executed) == 1
+    # trick.played, trick.won and action.result, then the trick's checkpoint, which empties the log
+    assert server.game.state == "trick-won"
+    assert dummy_redis.executed[0] == ["publish", "publish", "publish", "set", "delete"]
+    assert restored(dummy_redis, "PIPE01").game.state == "trick-won"
+    assert "game:PIPE01:log" not in dummy_redis.store
+
+
+def test_sync_reuses_public_snapshot_until_game_changes(dummy_redis):
+    server = GameServer("CACHE1", dummy_redis)
+
+    def sync(player_id, role="player"):
+        dummy_redis.published.clear()
+        server.handle_action({"message_type": "sync", "game_id": "CACHE1", "player_id": player_id, "role": role,
+                              "payload": {"message_type": "sync"}})
+        result, event = extract_payloads(dummy_redis)
+        assert result["payload"]["effects"]["snapshot"] == event["payload"]
+        return event["payload"]
+
+    first = sync(0)
+    cached = server.snapshot_cache
+    assert first == server.build_snapshot(0, "player")
+    assert [c["card_id"] for c in first["hand"]] == [c.card_id for c in server.game.players[0].hand]
+    second = sync(1)
+    observer = sync(None, "observer")
+    assert server.snapshot_cache is cached  # built once for every client
+    assert second["hand"] != first["hand"] and "hand" not in observer
+    assert {k: v for k, v in second.items() if k != "hand"} == observer
+
+    version = server.game.version
+    server.handle_action({"message_type": "bid", "game_id": "CACHE1", "player_id": 0, "role": "player",
+                          "payload": {"message_type": "bid", "bid": 75}})
+    assert server.game.version > version
+    assert sync(2)["bids"][0]["bid"] == 75
+    assert server.snapshot_cache is not cached
+
+
+def test_a_deal_that_fails_is_answered_and_retried(dummy_redis):
+    server = GameServer("DEAL01", dummy_redis)
+    server.game.minimum_hand_value = 25  # more than a fifth of the 120 points: no deal can satisfy it
+    join = {"message_type": "join", "game_id": "DEAL01", "action_id": "j1", "player_id": 0, "role": "player",
+            "payload": {"message_type": "join"}}
+    server.handle_action(join)
+    result, = extract_payloads(dummy_redis)
+    assert result["payload"]["status"] == "error" and result["payload"]["code"] == "deal_failed"
+    assert not server.initialized
+
+    server.game.minimum_hand_value = 5
+    server.handle_action(dict(join, action_id="j2"))
+    assert server.initialized and server.game.state == "bid"
+    assert extract_payloads(dummy_redis)[1]["payload"]["status"] == "ok"
+
+
+def test_unsatisfiable_minimum_hand_value_fails_at_startup(monkeypatch):
+    import briscola_service
+
+    briscola_service.check_deal_settings()
+    monkeypatch.setattr(briscola_service, "MINIMUM_HAND_VALUE", 25)
+    with pytest.raises(SystemExit):
+        briscola_service.check_deal_settings()
@@ -11,8 +11,7 @@ def test_service_restarts_on_missing_heartbeat(monkeypatch):
         return DummyPubSub(self)
 
     dummy.pubsub = pubsub.__get__(dummy, DummyRedis)
-    service = BriscolaService()
-    service.redis = dummy
+    service = BriscolaService(dummy)
 
     # Seed a server
     service.ensure_server("ABC123")
@@ -31,8 +30,7 @@ def test_service_loads_snapshot_on_restart(monkeypatch):
     dummy = DummyRedis()
     snap = {"phase": "play-tricks", "scores": [{"player_id": 0, "points": 5}]}
     dummy.store["game:XYZ789:state"] = json.dumps(snap)
-    service = BriscolaService()
-    service.redis = dummy
+    service = BriscolaService(dummy)
     service.ensure_server("XYZ789")
     assert service.servers["XYZ789"].game.state == "play-tricks"
     assert service.servers["XYZ789"].game.players[0].points == 5
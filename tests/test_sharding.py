@@ -0,0 +1,145 @@
+import asyncio
+import json
+import signal
+import sys
+import time
+
+from briscola_async_service import AsyncBriscolaService
+from briscola_service import BriscolaService, game_id_from_channel
+from briscola_sharding import HashRing, ShardSupervisor, shard_filter
+from tests.conftest import AsyncDummyRedis, DummyRedis
+
+
+def test_ring_spreads_games_and_moves_few_when_a_shard_is_added():
+    ids = [f"game-{i}" for i in range(4000)]
+    four = HashRing(f"shard-{i}" for i in range(4))
+    counts = {}
+    for game_id in ids:
+        counts[four.node_for(game_id)] = counts.get(four.node_for(game_id), 0) + 1
+    assert len(counts) == 4
+    assert min(counts.values()) > len(ids) / 4 * 0.7
+
+    five = HashRing(f"shard-{i}" for i in range(5))
+    moved = [game_id for game_id in ids if four.node_for(game_id) != five.node_for(game_id)]
+    # only the new shard's share moves, and only onto the new shard
+    assert len(moved) < len(ids) * 0.3
+    assert all(five.node_for(game_id) == "shard-4" for game_id in moved)
+
+
+def test_every_game_has_exactly_one_shard():
+    filters = [shard_filter(i, 3) for i in range(3)]
+    for n in range(300):
+        assert sum(owns(f"g{n}") for owns in filters) == 1
+
+
+def test_game_id_from_channel():
+    assert game_id_from_channel("game.abc-1.actions") == "abc-1"
+    assert game_id_from_channel("game.a.b.actions") == "a.b"
+
+
+def test_threaded_service_ignores_other_shards_games(monkeypatch):
+    owns = shard_filter(0, 2)
+    mine = next(f"g{n}" for n in range(100) if owns(f"g{n}"))
+    theirs = next(f"g{n}" for n in range(100) if not owns(f"g{n}"))
+    service = BriscolaService(DummyRedis(), game_filter=owns)
+    started = []
+    monkeypatch.setattr(service, "ensure_server", lambda game_id: started.append(game_id) is None)
+    for game_id in (theirs, mine):
+        data = json.dumps({"message_type": "join", "game_id": game_id, "payload": {}})
+        service.redis.pubsub().push_message(f"game.{game_id}.actions", data, pmessage=True)
+    service.monitor_actions()
+    assert started == [mine]
+
+
+def test_restore_starts_only_owned_persisted_games(monkeypatch):
+    owns = shard_filter(1, 2)
+    redis = DummyRedis()
+    for n in range(20):
+        redis.set(f"game:g{n}:state", "{}")
+        redis.setex(f"game:g{n}:heartbeat", 30, "alive")
+    service = BriscolaService(redis, game_filter=owns)
+    started = []
+    monkeypatch.setattr(service, "ensure_server", lambda game_id: started.append(game_id) is None)
+    assert service.restore_games() == len(started)
+    assert sorted(started) == sorted(f"g{n}" for n in range(20) if owns(f"g{n}"))
+
+
+def test_async_restore_loads_owned_games():
+    owns = shard_filter(0, 2)
+    redis = AsyncDummyRedis()
+    for n in range(10):
+        redis.sync.set(f"game:g{n}:state", "{}")
+
+    async def scenario():
+        service = AsyncBriscolaService(redis_client=redis, game_filter=owns)
+        restored = await service.restore_games()
+        servers = sorted(service.servers)
+        await service.stop()
+        return restored, servers
+
+    restored, servers = asyncio.run(scenario())
+    assert servers == sorted(f"g{n}" for n in range(10) if owns(f"g{n}"))
+    assert restored == len(servers)
+
+
+def exit_at_once(index, workers, mode, restore):
+    pass
+
+
+def sleep_forever(index, workers, mode, restore):
+    time.sleep(60)
+
+
+def exit_with_restore_flag(index, workers, mode, restore):
+    raise SystemExit(7 if restore else 0)
+
+
+def stop_cleanly_on_sigterm(index, workers, mode, restore):
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(3))  # as a service's run() writes and exits
+    time.sleep(60)
+
+
+def ignore_sigterm(index, workers, mode, restore):
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    time.sleep(60)
+
+
+def test_stop_lets_workers_stop_cleanly_and_kills_the_stuck():
+    supervisor = ShardSupervisor(1, target=stop_cleanly_on_sigterm, stop_timeout=5)
+    supervisor.start()
+    time.sleep(0.2)  # the worker to install its handler
+    supervisor.stop()
+    assert supervisor.processes[0].exitcode == 3
+
+    supervisor = ShardSupervisor(1, target=ignore_sigterm, stop_timeout=0.2)
+    supervisor.start()
+    time.sleep(0.2)
+    started = time.monotonic()
+    supervisor.stop()
+    assert supervisor.processes[0].exitcode == -signal.SIGKILL
+    assert time.monotonic() - started < 5
+
+
+def test_supervisor_restarts_dead_worker_with_restore():
+    supervisor = ShardSupervisor(2, target=exit_at_once)
+    supervisor.start()
+    for proc in supervisor.processes.values():
+        proc.join()
+    supervisor.target = sleep_forever
+    assert supervisor.check() == [0, 1]
+    assert supervisor.restarts == 2
+    assert all(proc.is_alive() for proc in supervisor.processes.values())
+    assert supervisor.check() == []
+    supervisor.stop()
+    assert not any(proc.is_alive() for proc in supervisor.processes.values())
+
+
+def test_replacement_worker_restores_its_games():
+    supervisor = ShardSupervisor(1, target=exit_with_restore_flag)
+    supervisor.start()
+    supervisor.processes[0].join()
+    assert supervisor.processes[0].exitcode == 0
+    supervisor.check()
+    supervisor.processes[0].join()
+    assert supervisor.processes[0].exitcode == 7
+    supervisor.stop()
@@ -0,0 +1,50 @@
+import random
+
+import pytest
+
+from briscola import snapshot
+from briscola.game import Game
+
+
+def states(seed):
+    """The game after each of its transitions, from an undealt game to the last trick."""
+    rng = random.Random(seed)
+    game = Game(seed=seed)
+    yield game
+    game.start_game()
+    game.deal_cards()
+    yield game
+    game.player_bid(rng.randrange(5), rng.randrange(61, 121))
+    for seat in range(5):
+        if game.state == "bid" and game.players[seat] is not game.bid_winner:
+            game.player_bid(seat, -1)
+    yield game
+    game.call_partner_rank(rng.choice(range(1, 11)))
+    yield game
+    while any(p.hand for p in game.players):
+        if game.state == "call-partner-suit":
+            game.call_partner_suit(rng.choice(["cups", "coins", "swords", "clubs"]))
+        else:
+            hand = game.players[game.current_player_id].hand
+            game.play_card(game.current_player_id, rng.choice(hand))
+        yield game
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_round_trip_at_every_transition(seed):
+    for game in states(seed):
+        data = snapshot.encode(game)
+        assert data[0] == snapshot.VERSION
+        restored = snapshot.decode(data)
+        assert restored.checkpoint() == game.checkpoint()
+        assert restored.zobrist == game.zobrist
+        assert len(data) < 256
+
+
+def test_decodes_into_a_given_game_and_rejects_unknown_versions():
+    game = next(s for s in states(7) if s.state == "call-partner-rank")
+    target = Game()
+    assert snapshot.decode(snapshot.encode(game), target) is target
+    assert target.checkpoint() == game.checkpoint()
+    with pytest.raises(ValueError):
+        snapshot.decode(bytes([snapshot.VERSION + 1]) + snapshot.encode(game)[1:])
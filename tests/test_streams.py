@@ -0,0 +1,174 @@
+import json
+
+import briscola_streams as streams
+from briscola_streams import StreamsBriscolaService, add_action, partition_for, stream_key
+from tests.conftest import DummyRedis, extract_payloads, restored
+
+
+class ManualService(StreamsBriscolaService):
+    """Game servers are driven by the test instead of worker threads."""
+
+    def start_worker(self, game_id):
+        pass
+
+    def drain(self):
+        handled = 0
+        for game_id, work in self.queues.items():
+            while not work.empty():
+                self.handle(game_id, work.get())
+                handled += 1
+        return handled
+
+
+def action(game_id, action_id, message_type="join", player_id=0, **payload):
+    return {"message_type": message_type, "game_id": game_id, "action_id": action_id, "player_id": player_id,
+            "role": "player", "payload": dict(payload, message_type=message_type)}
+
+
+def results(redis):
+    return [p["payload"]["action_id"] for p in extract_payloads(redis) if p["message_type"] == "action.result"]
+
+
+def pending(redis, group="briscola"):
+    return sum(len(g["pending"]) for (_, name), g in redis.groups.items() if name == group)
+
+
+def test_partition_is_stable_and_in_range():
+    assert partition_for("ABC123", 16) == partition_for("ABC123", 16)
+    assert {partition_for(f"g{n}", 8) for n in range(200)} == set(range(8))
+
+
+def test_actions_are_handled_in_order_and_acknowledged():
+    redis = DummyRedis()
+    service = ManualService(redis, partitions=4)
+    service.ensure_groups()
+    for n in range(3):
+        add_action(redis, action("g1", f"a{n}", "sync"), partitions=4)
+    assert service.poll(block_ms=None) == 3
+    assert pending(redis) == 3
+    assert service.drain() == 3
+    assert results(redis) == ["a0", "a1", "a2"]
+    assert pending(redis) == 0
+
+
+def test_nodes_share_partitions_and_each_action_is_handled_once():
+    redis = DummyRedis()
+    nodes = ["node-a", "node-b"]
+    services = [ManualService(redis, node=node, nodes=nodes, partitions=8) for node in nodes]
+    assert sorted(services[0].streams + services[1].streams) == sorted(stream_key(p) for p in range(8))
+    assert not set(services[0].streams) & set(services[1].streams)
+    for service in services:
+        service.ensure_groups()
+    ids = [f"g{n}" for n in range(40)]
+    for game_id in ids:
+        add_action(redis, action(game_id, f"{game_id}-join"), partitions=8)
+    for service in services:
+        service.poll(block_ms=None)
+        service.drain()
+    assert sorted(results(redis)) == sorted(f"{game_id}-join" for game_id in ids)
+    assert all(service.servers for service in services)
+    assert pending(redis) == 0
+
+
+def test_restart_redelivers_own_pending_entries():
+    redis = DummyRedis()
+    crashed = ManualService(redis, partitions=2)
+    crashed.ensure_groups()
+    add_action(redis, action("g1", "j", "sync"), partitions=2)
+    crashed.poll(block_ms=None)  # read, never handled or acknowledged
+
+    restarted = ManualService(redis, partitions=2)
+    restarted.ensure_groups()
+    assert restarted.read_pending() == 1
+    restarted.drain()
+    assert results(redis) == ["j"]
+    assert pending(redis) == 0
+
+
+def test_redelivered_action_already_persisted_is_not_replayed():
+    redis = DummyRedis()
+    first = ManualService(redis, partitions=1)
+    first.ensure_groups()
+    add_action(redis, action("g1", "join"), partitions=1)
+    first.poll(block_ms=None)
+    first.drain()
+    add_action(redis, action("g1", "bid-1", "bid", player_id=0, bid=61), partitions=1)
+    first.poll(block_ms=None)
+    # handled and persisted, then the node dies before the acknowledgement
+    stream, entry_id, envelope, _ = first.queues["g1"].get()
+    first.servers["g1"].handle_action(envelope)
+    assert restored(redis, "g1").last_action_id == "bid-1"
+
+    second = ManualService(redis, partitions=1)
+    second.ensure_groups()
+    assert second.read_pending() == 1
+    second.drain()
+    assert results(redis).count("bid-1") == 1
+    assert pending(redis) == 0
+
+
+def test_stale_entries_of_another_consumer_are_claimed():
+    redis = DummyRedis()
+    gone = ManualService(redis, node="node-a", nodes=["node-a"], partitions=1)
+    gone.ensure_groups()
+    add_action(redis, action("g1", "j", "sync"), partitions=1)
+    gone.poll(block_ms=None)
+
+    other = ManualService(redis, node="node-b", nodes=["node-b"], partitions=1)
+    other.ensure_groups()
+    assert other.claim_stale(min_idle_ms=0) == 1
+    other.drain()
+    assert results(redis) == ["j"]
+    assert pending(redis) == 0
+
+
+def test_a_dead_nodes_partitions_pass_to_the_live_nodes():
+    redis = DummyRedis()
+    nodes = ["node-a", "node-b"]
+    survivor, dead = (ManualService(redis, node=node, nodes=nodes, partitions=8) for node in nodes)
+    for service in (survivor, dead):
+        service.rebalance()
+        service.ensure_groups()
+    assert sorted(survivor.streams + dead.streams) == sorted(stream_key(p) for p in range(8))
+    game_id = next(f"g{n}" for n in range(100) if stream_key(partition_for(f"g{n}", 8)) in dead.streams)
+    add_action(redis, action(game_id, "j", "sync"), partitions=8)
+    dead.poll(block_ms=None)  # read but never handled: the node dies
+
+    # the dead node stops refreshing its entry, so it drops out of the ring once the startup grace has passed
+    redis.store[survivor.nodes_key()]["node-b"] -= streams.STREAM_NODE_TTL_MS + 1
+    assert not survivor.rebalance()
+    survivor.started -= streams.STREAM_NODE_TTL_MS
+    assert survivor.rebalance()
+    assert sorted(survivor.streams) == sorted(stream_key(p) for p in range(8))
+    assert survivor.claim_stale(min_idle_ms=0) == 1
+    add_action(redis, action(game_id, "k", "sync"), partitions=8)
+    survivor.poll(block_ms=None)
+    survivor.drain()
+    assert results(redis) == ["j", "k"]
+    assert pending(redis) == 0
+
+
+def test_a_node_drops_the_games_of_partitions_it_loses():
+    redis = DummyRedis()
+    first = ManualService(redis, node="node-a", nodes=["node-a"], partitions=8)
+    first.rebalance()
+    first.ensure_groups()
+    for n in range(20):
+        add_action(redis, action(f"g{n}", "j", "sync"), partitions=8)
+    first.poll(block_ms=None)
+    first.drain()
+    joined = ManualService(redis, node="node-b", nodes=["node-b"], partitions=8)
+    joined.rebalance()
+    assert first.rebalance()
+    assert joined.streams and not set(first.streams) & set(joined.streams)
+    assert {stream_key(partition_for(g, 8)) for g in first.servers} <= set(first.streams)
+    assert set(first.servers) == set(first.queues) and len(first.servers) < 20
+
+
+def test_malformed_entries_are_dropped():
+    redis = DummyRedis()
+    service = ManualService(redis, partitions=1)
+    service.ensure_groups()
+    redis.xadd(stream_key(0), {"data": "not json"})
+    assert service.poll(block_ms=None) == 0
+    assert pending(redis) == 0
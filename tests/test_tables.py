@@ -0,0 +1,115 @@
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from briscola import bot, deck, tables
+from briscola.game import NO_TRUMP, beats, trick_winner
+from tests.test_bot import started_game
+
+
+@pytest.fixture(scope="module")
+def table_dir(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp("tables"))
+    tables.generate(directory, tricks=50000, seed=1)
+    return directory
+
+
+def test_files_are_versioned(table_dir):
+    for name in tables.SHAPES:
+        assert tables.path(name, table_dir).endswith(".v{}.npy".format(tables.VERSION))
+
+
+def test_hold_is_exact(table_dir):
+    hold = tables.load("hold", table_dir)
+    for trump, suit in [(0, "cups"), (2, "swords"), (NO_TRUMP, None)]:
+        for card in random.Random(trump).sample(deck.cards, 6):
+            beaten_by = sum(1 for other in deck.cards if beats(card, other, suit))
+            assert hold[trump, card.card_id, 0] == 1.0
+            assert hold[trump, card.card_id, 1] == pytest.approx((39 - beaten_by) / 39)
+
+
+def test_win_matches_trick_winner(table_dir):
+    win = tables.load("win", table_dir)
+    rng = random.Random(2)
+    ace = deck.Card("coins", 10)
+    # the highest trump always wins
+    assert (win[1, :, ace.card_id] == 1.0).all()
+    counts, wins = 0, 0
+    for _ in range(4000):
+        trick = rng.sample(deck.cards, 5)
+        position = rng.randrange(5)
+        card = trick[position]
+        if card.suit != "cups" or card.rank != 8:
+            continue
+        counts += 1
+        winner, _ = trick_winner([(c, i) for i, c in enumerate(trick)], "clubs")
+        wins += winner is card
+    # tricks where the cups 8 sits at a random position, against the table averaged over positions
+    expected = win[3, :, deck.Card("cups", 8).card_id].mean()
+    assert counts > 50
+    assert abs(wins / counts - expected) < 0.15
+
+
+def test_load_maps_read_only_once(table_dir):
+    table = tables.load("take", table_dir)
+    assert isinstance(table, np.memmap)
+    assert not table.flags.writeable
+    assert tables.load("take", table_dir) is table
+    assert (table >= 0).all() and (table <= 120).all()
+
+
+def test_load_rejects_missing_or_wrong_shape(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        tables.load("win", str(tmp_path))
+    np.save(tables.path("win", str(tmp_path)), np.zeros((2, 2), dtype=np.float32))
+    with pytest.raises(ValueError):
+        tables.load("win", str(tmp_path))
+
+
+def test_bot_bids_and_calls_from_tables(table_dir):
+    b = bot.Bot(seed=3, tables=tables.WinTables(table_dir))
+    strong = [deck.Card("coins", rank) for rank in (10, 9, 8, 7, 6)] + [deck.Card("cups", 10), deck.Card("swords", 10),
+                                                                         deck.Card("clubs", 10)]
+    weak = [deck.Card(suit, rank) for suit in ("cups", "swords") for rank in (2, 3, 4, 5)]
+    assert b.hand_take(strong, "coins") > b.hand_take(strong, "cups") > b.hand_take(weak, "cups")
+    assert b.hand_wins(strong, "coins") > b.hand_wins(weak, "coins")
+
+    g = started_game(3)
+    g.players[0].original_hand = strong
+    g.bid = 61
+    assert 61 < b.choose_bid(g, 0) <= 120
+    g.players[0].original_hand = weak
+    assert b.choose_bid(g, 0) == -1
+    g.players[0].original_hand = strong
+    g.partner_rank = 1
+    assert b.choose_suit(g, 0) == "coins"
+
+
+def test_service_bots_bid_from_tables_while_advice_is_pending(table_dir, monkeypatch):
+    import briscola_service as service
+
+    monkeypatch.setattr(service, "_tables", None)
+    monkeypatch.setattr(service, "_tables_missing", False)
+    monkeypatch.setattr(tables, "DEFAULT_DIRECTORY", table_dir)
+    assert isinstance(service.get_tables(), tables.WinTables)
+    searcher = bot.ISMCTSBot(workers=1, iterations=1, tables=service.get_tables())
+    g = started_game(3)
+    g.bid = 61
+    g.players[0].original_hand = [deck.Card("coins", rank) for rank in (10, 9, 8, 7, 6)] + [
+        deck.Card(suit, 10) for suit in ("cups", "swords", "clubs")]
+    assert searcher.choose_bid(g, 0) == bot.Bot(tables=service.get_tables()).choose_bid(g, 0) > 61
+
+    monkeypatch.setattr(service, "_tables", None)
+    monkeypatch.setattr(tables, "DEFAULT_DIRECTORY", table_dir + "-missing")
+    assert service.get_tables() is None
+
+
+def test_bot_plays_from_tables(table_dir):
+    g = started_game(8)
+    player = g.players[g.current_player_id]
+    b = bot.Bot(seed=8, tables=tables.WinTables(table_dir))
+    card = b.choose_card(g, player.id)
+    assert player.has_card(card)
+    assert b.card_score(g, player.id, card) == max(b.card_score(g, player.id, c) for c in player.hand)
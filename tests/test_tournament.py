@@ -0,0 +1,54 @@
+import json
+
+from briscola import tournament
+
+
+def test_games_replay_from_their_number():
+    a = tournament.play_game(7, ["random"], seed=3)
+    b = tournament.play_game(7, ["random"], seed=3)
+    a.pop("seconds"), b.pop("seconds")
+    assert a == b
+    assert a["calling_points"] + a["defending_points"] == 120
+
+
+def test_rotations_share_a_deal_and_cover_every_seat():
+    for strategies in (["a"], ["a", "b"], ["a", "b", "c"], list("abcde"), list("abcdefg")):
+        lineups = [tournament.lineup(strategies, n) for n in range(tournament.games_per_deal(strategies))]
+        for seat in range(5):
+            # every strategy plays every seat of the deal equally often
+            assert sorted(lineup[seat] for lineup in lineups) == sorted(strategies * 5)
+    # every rotation of a deal deals the same hands, and the heuristic auction only looks at the hands
+    calls = [tournament.play_game(n, ["random"], seed=1)["caller"] for n in range(5)]
+    assert len(set(calls)) == 1
+
+
+def test_resume_plays_only_missing_games(tmp_path):
+    out = str(tmp_path / "results.jsonl")
+    records, stats = tournament.run(["random"], 10, out, workers=0, chunk=5)
+    assert stats["games_played"] == 10
+    with open(out, "a") as f:
+        f.write('{"game": 11, "sea')  # a line cut short by a crash
+    records, stats = tournament.run(["random"], 20, out, workers=0, chunk=5, resume=True)
+    assert stats["games_played"] == 10
+    assert [r["game"] for r in records] == list(range(20))
+    with open(out) as f:
+        assert sorted(json.loads(line)["game"] for line in f) == list(range(20))
+
+
+def test_pool_results_match_serial(tmp_path):
+    serial, _ = tournament.run(["random"], 10, str(tmp_path / "a.jsonl"), workers=0, seed=2)
+    pooled, _ = tournament.run(["random"], 10, str(tmp_path / "b.jsonl"), workers=2, seed=2, chunk=3)
+    strip = lambda records: [{k: v for k, v in r.items() if k != "seconds"} for r in records]
+    assert strip(serial) == strip(pooled)
+
+
+def test_summary_intervals():
+    records = [tournament.play_game(n, ["random"], seed=4) for n in range(20)]
+    summary = tournament.summarize(records)["random"]
+    assert summary["seats"] == 100
+    rate, low, high = summary["win_rate"]
+    assert low <= rate <= high
+    mean, low, high = summary["points"]
+    assert low <= mean <= high
+    assert summary["bids"] == 20
+    assert tournament.wilson(0, 0) == (0.0, 0.0, 0.0)